@@ -35,6 +35,7 @@ from authdata.models import Source
 from authdata.models import User
 from authdata.models import Attribute
 from authdata.models import UserAttribute
+from authdata.models import DreamschoolOrganisation
 
 
 class MunicipalityAdmin(admin.ModelAdmin):
@@ -69,6 +70,11 @@ class SourceAdmin(admin.ModelAdmin):
     list_display = ('name',)
 
 
+class DreamschoolOrganisationAdmin(admin.ModelAdmin):
+    list_display = ('municipality', 'school', 'org_id')
+    search_fields = ('municipality', 'school', 'org_id')
+
+
 class UserAttributeInline(admin.TabularInline):
     model = UserAttribute
     extra = 0
@@ -112,4 +118,5 @@ admin.site.register(Source, SourceAdmin)
 admin.site.register(User, UserAdmin)
 admin.site.register(Attribute, AttributeAdmin)
 admin.site.register(UserAttribute, UserAttributeAdmin)
+admin.site.register(DreamschoolOrganisation, DreamschoolOrganisationAdmin)
 
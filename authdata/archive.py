@@ -0,0 +1,98 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Archival of disabled UserAttributes.
+
+Removing a UserAttribute only sets its ``disabled_at``, the row stays for
+changed_at listings to report the removal. Rows disabled for longer than
+settings.AUTHDATA_ATTRIBUTE_RETENTION_DAYS are moved to
+ArchivedUserAttribute in batches, so the UserAttribute table only grows
+with the active attributes. The archived rows keep their ``modified`` and
+changed_at listings still find them.
+
+Run ``manage.py archive_user_attributes`` periodically.
+"""
+
+import datetime
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from django.utils import timezone
+from authdata.models import UserAttribute, ArchivedUserAttribute
+
+BATCH_SIZE = 1000
+
+FIELDS = ('id', 'user_id', 'attribute_id', 'value', 'data_source_id', 'created', 'modified', 'disabled_at')
+
+
+def retention_cutoff(days=None):
+  """
+  Attributes disabled before this are archived, by default
+  settings.AUTHDATA_ATTRIBUTE_RETENTION_DAYS ago
+  """
+  if days is None:
+    days = getattr(settings, 'AUTHDATA_ATTRIBUTE_RETENTION_DAYS', 30)
+  return timezone.now() - datetime.timedelta(days=days)
+
+
+def archive_batch(before, batch_size=BATCH_SIZE):
+  """
+  Move at most ``batch_size`` attributes disabled before ``before`` to the
+  archive. Returns the number of attributes moved.
+  """
+  with transaction.atomic():
+    rows = list(UserAttribute.objects.filter(disabled_at__lt=before).order_by('id')
+        .select_for_update().values(*FIELDS)[:batch_size])
+    if not rows:
+      return 0
+    now = timezone.now()
+    ArchivedUserAttribute.objects.bulk_create([ArchivedUserAttribute(archived_at=now, **row) for row in rows])
+    # The attributes are already left out of the output, deleting them must
+    # not trigger authdata.documents like Model.delete() would
+    with connection.cursor() as cursor:
+      cursor.execute('DELETE FROM %s WHERE id IN (%s)' % (
+          connection.ops.quote_name(UserAttribute._meta.db_table), ', '.join(['%s'] * len(rows))),
+          [row['id'] for row in rows])
+  return len(rows)
+
+
+def archive(before=None, batch_size=BATCH_SIZE, progress=None):
+  """
+  Move all attributes disabled before ``before``, by default the retention
+  cutoff, to the archive one batch per transaction. Returns the number of
+  attributes moved.
+  """
+  before = before or retention_cutoff()
+  count = 0
+  while True:
+    moved = archive_batch(before, batch_size)
+    if not moved:
+      return count
+    count += moved
+    if progress:
+      progress(count)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,271 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Load test scenarios for the authdata API.
+
+The scenarios are run in-process through the Django test client against the
+configured database, so the numbers include everything from URL resolution
+to JSON rendering but no network or web server overhead. Run them with
+``manage.py benchmark``, data sets can be created with
+``authdata.testdata``.
+"""
+
+import os
+import csv
+import math
+import time
+import random
+import tempfile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from authdata.models import User, UserAttribute, Municipality, School, Attendance
+
+
+SCENARIOS = (
+  'query_username',
+  'query_attribute',
+  'query_connection',
+  'user_municipality',
+  'user_school',
+  'user_group',
+  'user_changed_at',
+  'csv_import',
+)
+
+
+def percentile(values, percent):
+  """
+  Nearest-rank percentile of a list of numbers
+  """
+  if not values:
+    return None
+  values = sorted(values)
+  rank = int(math.ceil(percent / 100.0 * len(values))) - 1
+  return values[max(rank, 0)]
+
+
+def summarize(name, latencies, queries, errors, elapsed):
+  """
+  Summary statistics of one scenario. Latencies are in seconds.
+  """
+  count = len(latencies)
+  return {
+    'scenario': name,
+    'requests': count,
+    'errors': errors,
+    'p50_ms': _ms(percentile(latencies, 50)),
+    'p95_ms': _ms(percentile(latencies, 95)),
+    'p99_ms': _ms(percentile(latencies, 99)),
+    'max_ms': _ms(max(latencies) if latencies else None),
+    'queries_per_request': float(sum(queries)) / count if count else None,
+    'max_queries': max(queries) if queries else None,
+    'throughput_rps': count / elapsed if elapsed else None,
+  }
+
+
+def _ms(seconds):
+  if seconds is None:
+    return None
+  return round(seconds * 1000.0, 3)
+
+
+class Benchmark(object):
+  """
+  Runs the scenarios against the data currently in the database
+
+  ``requests`` is the number of requests made in each point lookup scenario
+  and ``list_requests`` in each listing scenario. ``csv_rows`` is the size of
+  the file imported in the ``csv_import`` scenario.
+  """
+
+  def __init__(self, requests=100, list_requests=10, csv_rows=1000, seed=None, username='benchmark'):
+    self.requests = requests
+    self.list_requests = list_requests
+    self.csv_rows = csv_rows
+    self.random = random.Random(seed)
+    self.username = username
+    user, _ = User.objects.get_or_create(username=username)
+    token, _ = Token.objects.get_or_create(user=user)
+    self.client = Client(HTTP_AUTHORIZATION='Token %s' % token.key)
+
+  def run(self, scenarios=SCENARIOS):
+    """
+    Run the given scenarios, returns a dict suitable for JSON output.
+    Scenarios that can not be run in this context are left out.
+    """
+    started = timezone.now()
+    dataset = self.dataset()
+    results = [getattr(self, 'bench_%s' % name)() for name in scenarios]
+    results = [result for result in results if result is not None]
+    return {
+      'started': started.isoformat(),
+      'database': connection.vendor,
+      'dataset': dataset,
+      'results': results,
+    }
+
+  def dataset(self):
+    return {
+      'users': User.objects.count(),
+      'user_attributes': UserAttribute.objects.count(),
+      'attendances': Attendance.objects.count(),
+      'schools': School.objects.count(),
+      'municipalities': Municipality.objects.count(),
+    }
+
+  def measure(self, name, requests):
+    """
+    Time each callable in ``requests``. A callable returns a response,
+    status codes 400 and above are counted as errors.
+    """
+    latencies = []
+    queries = []
+    errors = 0
+    started = time.time()
+    for request in requests:
+      with CaptureQueriesContext(connection) as captured:
+        t = time.time()
+        try:
+          response = request()
+        except Exception:
+          response = None
+        latencies.append(time.time() - t)
+      queries.append(len(captured))
+      if response is None or response.status_code >= 400:
+        errors += 1
+    return summarize(name, latencies, queries, errors, time.time() - started)
+
+  def sample(self, queryset, count, *fields):
+    """
+    Pick ``count`` random rows from ``queryset`` without sorting the table
+    """
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+      return []
+    rows = []
+    for i in xrange(count):
+      pk = self.random.randint(bounds['low'], bounds['high'])
+      row = queryset.filter(id__gte=pk).order_by('id').values_list(*fields)[:1]
+      rows.extend(row)
+    return rows
+
+  def get(self, path, data=None):
+    return lambda: self.client.get(path, data or {})
+
+  def bench_query_username(self):
+    users = self.sample(User.objects.exclude(username=self.username), self.requests, 'username')
+    return self.measure('query_username',
+        [self.get('/api/1/query/%s' % username) for username, in users])
+
+  def bench_query_attribute(self):
+    values = self.sample(UserAttribute.objects.all(), self.requests, 'attribute__name', 'value')
+    return self.measure('query_attribute',
+        [self.get('/api/1/query', {name: value}) for name, value in values])
+
+  def bench_query_connection(self):
+    """
+    query_username with a new database connection for every request,
+    compared to a connection kept open between requests (CONN_MAX_AGE).
+    The result is that of the persistent connection.
+
+    Skipped inside a transaction, for example in a TestCase, as closing the
+    connection would end it.
+    """
+    if connection.in_atomic_block:
+      return None
+    users = self.sample(User.objects.exclude(username=self.username), self.requests, 'username')
+    conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+    try:
+      connection.settings_dict['CONN_MAX_AGE'] = 0
+      new_connection = self.measure('query_connection',
+          [self.reconnect(self.get('/api/1/query/%s' % username)) for username, in users])
+      connection.settings_dict['CONN_MAX_AGE'] = None
+      connection.close()
+      result = self.measure('query_connection',
+          [self.get('/api/1/query/%s' % username) for username, in users])
+    finally:
+      connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+      connection.close()
+    result['new_connection_p50_ms'] = new_connection['p50_ms']
+    result['new_connection_p95_ms'] = new_connection['p95_ms']
+    if result['p50_ms'] is not None:
+      result['connection_setup_ms'] = round(new_connection['p50_ms'] - result['p50_ms'], 3)
+    return result
+
+  def reconnect(self, request):
+    def wrapper():
+      connection.close()
+      return request()
+    return wrapper
+
+  def bench_user_municipality(self):
+    names = self.sample(Municipality.objects.all(), self.list_requests, 'name')
+    return self.measure('user_municipality',
+        [self.get('/api/1/user/', {'municipality': name}) for name, in names])
+
+  def bench_user_school(self):
+    names = self.sample(School.objects.all(), self.list_requests, 'name')
+    return self.measure('user_school',
+        [self.get('/api/1/user/', {'school': name}) for name, in names])
+
+  def bench_user_group(self):
+    groups = self.sample(Attendance.objects.all(), self.list_requests, 'school__name', 'group')
+    return self.measure('user_group',
+        [self.get('/api/1/user/', {'school': school, 'group': group}) for school, group in groups])
+
+  def bench_user_changed_at(self):
+    # Synchronisation clients poll for changes made after their last run
+    since = time.time() - 3600
+    return self.measure('user_changed_at',
+        [self.get('/api/1/user/', {'changed_at': since}) for i in xrange(self.list_requests)])
+
+  def bench_csv_import(self):
+    schools = list(School.objects.values_list('school_id', flat=True)[:100]) or ['benchmark']
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+      with os.fdopen(fd, 'wb') as csvfile:
+        writer = csv.writer(csvfile)
+        for i in xrange(self.csv_rows):
+          writer.writerow(['1.2.246.562.99.%011d' % self.random.randint(0, 10 ** 10),
+              self.random.choice(schools), '7A', self.random.choice(['teacher', 'student']),
+              'First%d' % i, 'Last%d' % i, 'import-%d' % i])
+      with CaptureQueriesContext(connection) as captured:
+        started = time.time()
+        call_command('csv_import', path, 'benchmark_import', source='benchmark', really_do_this=True)
+        elapsed = time.time() - started
+    finally:
+      os.remove(path)
+    result = summarize('csv_import', [elapsed], [len(captured)], 0, elapsed)
+    result['rows'] = self.csv_rows
+    result['rows_per_second'] = self.csv_rows / elapsed if elapsed else None
+    return result
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
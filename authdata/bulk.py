@@ -0,0 +1,317 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Bulk writes for the API.
+
+A BulkWriter validates a list of rows, resolves the related objects the
+rows refer to by name with one query per relation and writes the rows in
+one transaction with bulk inserts and CASE updates. Rows are matched to
+existing objects of the same data source by the ``key`` fields:
+
+create
+  every row is inserted
+update
+  rows must match an existing object, which is updated
+upsert
+  matching objects are updated, other rows inserted
+
+Either every row is written or, when any row is invalid, none.
+"""
+
+import collections
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+from authdata import cache
+from authdata import documents
+from authdata.models import User, Attribute, UserAttribute, Municipality, School, Role, Attendance
+
+
+MODES = ('create', 'update', 'upsert')
+
+# Number of values in one IN list or CASE expression
+CHUNK_SIZE = 500
+
+# Resolved value of a name matching several objects
+AMBIGUOUS = object()
+
+
+class BulkError(Exception):
+  """
+  ``errors`` is a list of {'index': row index, 'errors': {field: [message]}}
+  """
+
+  def __init__(self, errors):
+    super(BulkError, self).__init__('%d invalid rows' % len(errors))
+    self.errors = errors
+
+
+def chunks(values, size=CHUNK_SIZE):
+  values = list(values)
+  for i in xrange(0, len(values), size):
+    yield values[i:i + size]
+
+
+class BulkWriter(object):
+  model = None
+  # Input fields, all strings, required unless in ``defaults``
+  fields = ()
+  # Values of input fields missing from a row
+  defaults = {}
+  # Input fields referring to other objects: (model, field the value is matched to)
+  relations = {}
+  # Fields which identify an existing object of the data source
+  key = ()
+  # Fields set by updates in addition to the input fields
+  update_defaults = {}
+  max_length = 2048
+
+  def __init__(self, data_source, mode='upsert'):
+    if mode not in MODES:
+      raise ValueError('Unknown mode %r' % mode)
+    self.data_source = data_source
+    self.mode = mode
+
+  def column(self, field):
+    return '%s_id' % field if field in self.relations else field
+
+  def write(self, rows):
+    """
+    Validate and write the rows. Returns the number of created, updated and
+    unchanged objects. Raises BulkError if any row is invalid.
+    """
+    max_rows = getattr(settings, 'AUTHDATA_BULK_MAX_ROWS', 50000)
+    if not isinstance(rows, list):
+      raise BulkError([{'index': None, 'errors': {'non_field_errors': ['Expected a list of objects.']}}])
+    if len(rows) > max_rows:
+      raise BulkError([{'index': None, 'errors': {'non_field_errors': ['At most %d rows are allowed.' % max_rows]}}])
+    values = self.validate(rows)
+    with transaction.atomic():
+      existing = self.existing(values)
+      if self.mode == 'update':
+        missing = [{'index': i, 'errors': {'non_field_errors': ['No such object.']}}
+            for i, row in enumerate(values) if self.row_key(row) not in existing]
+        if missing:
+          raise BulkError(missing)
+      new = []
+      changed = []
+      for row in values:
+        obj = existing.get(self.row_key(row))
+        if obj is None:
+          new.append(row)
+          continue
+        changes = self.changes(obj, row)
+        if changes:
+          changed.append((obj, row, changes))
+      self.create(new)
+      self.update(changed)
+      self.changed(new + [row for obj, row, changes in changed])
+    return {
+      'created': len(new),
+      'updated': len(changed),
+      'unchanged': len(values) - len(new) - len(changed),
+    }
+
+  def validate(self, rows):
+    """
+    Check the rows and resolve their relations. Returns the rows as dicts of
+    column values.
+    """
+    if self.defaults:
+      rows = [dict(self.defaults.items() + row.items()) if isinstance(row, dict) else row for row in rows]
+    errors = collections.defaultdict(dict)
+    for index, row in enumerate(rows):
+      if not isinstance(row, dict):
+        errors[index]['non_field_errors'] = ['Expected an object.']
+        continue
+      for field in self.fields:
+        value = row.get(field)
+        if not isinstance(value, basestring):
+          errors[index][field] = ['This field is required.' if value is None else 'Not a valid string.']
+        elif len(value) > self.max_length:
+          errors[index][field] = ['Ensure this field has no more than %d characters.' % self.max_length]
+    resolved = {}
+    for field, (model, slug) in self.relations.iteritems():
+      names = set(row[field] for i, row in enumerate(rows)
+          if isinstance(row, dict) and field not in errors.get(i, {}))
+      resolved[field] = self.resolve(model, slug, names)
+    values = []
+    seen = {}
+    for index, row in enumerate(rows):
+      if not isinstance(row, dict):
+        continue
+      value = {}
+      for field in self.fields:
+        if field in errors[index]:
+          continue
+        if field in self.relations:
+          pk = resolved[field].get(row[field])
+          if pk is None:
+            errors[index][field] = ['Object with %s=%s does not exist.' % (self.relations[field][1], row[field])]
+          elif pk is AMBIGUOUS:
+            errors[index][field] = ['More than one object with %s=%s.' % (self.relations[field][1], row[field])]
+          else:
+            value[self.column(field)] = pk
+        else:
+          value[field] = row[field]
+      if errors[index]:
+        continue
+      key = self.row_key(value)
+      if key in seen:
+        errors[index]['non_field_errors'] = ['Same object as row %d.' % seen[key]]
+        continue
+      seen[key] = index
+      values.append(value)
+    errors = [{'index': index, 'errors': e} for index, e in sorted(errors.items()) if e]
+    if errors:
+      raise BulkError(errors)
+    return values
+
+  def resolve(self, model, slug, names):
+    """
+    Map of names to primary keys, AMBIGUOUS for names matching many objects
+    """
+    resolved = {}
+    for chunk in chunks(names):
+      for name, pk in model.objects.filter(**{'%s__in' % slug: chunk}).values_list(slug, 'pk'):
+        resolved[name] = AMBIGUOUS if name in resolved else pk
+    return resolved
+
+  def row_key(self, row):
+    return tuple(row[self.column(field)] for field in self.key)
+
+  def existing(self, values):
+    """
+    Existing objects of the data source matching the rows, by key
+    """
+    if self.mode == 'create' or not values:
+      return {}
+    first = self.column(self.key[0])
+    objs = {}
+    for chunk in chunks(set(row[first] for row in values)):
+      queryset = self.model.objects.filter(data_source=self.data_source, **{'%s__in' % first: chunk})
+      for obj in queryset.order_by('pk'):
+        objs.setdefault(tuple(getattr(obj, self.column(field)) for field in self.key), obj)
+    return objs
+
+  def changes(self, obj, row):
+    """
+    Fields of ``obj`` the row changes
+    """
+    changes = dict((column, value) for column, value in row.iteritems() if getattr(obj, column) != value)
+    changes.update((column, value) for column, value in self.update_defaults.iteritems()
+        if getattr(obj, column) != value)
+    return changes
+
+  def create(self, values):
+    self.model.objects.bulk_create([self.model(data_source=self.data_source, **row) for row in values],
+        batch_size=CHUNK_SIZE)
+
+  def update(self, changed):
+    """
+    Update the changed objects, one UPDATE statement for each chunk
+    """
+    now = timezone.now()
+    for chunk in chunks(changed):
+      columns = set()
+      for obj, row, changes in chunk:
+        columns.update(changes)
+      updates = {'modified': now}
+      for column in columns:
+        field = self.model._meta.get_field(column)
+        # PostgreSQL types a CASE of untyped parameters, such as only NULLs,
+        # as text
+        updates[column] = Cast(Case(*[When(pk=obj.pk, then=Value(changes.get(column, getattr(obj, column)),
+            output_field=field)) for obj, row, changes in chunk], output_field=field), field)
+      self.model.objects.filter(pk__in=[obj.pk for obj, row, changes in chunk]).update(**updates)
+
+  def changed(self, values):
+    """
+    Called in the transaction with the rows written
+    """
+    pass
+
+
+class UserAttributeWriter(BulkWriter):
+  model = UserAttribute
+  fields = ('user', 'attribute', 'value')
+  relations = {
+    'user': (User, 'username'),
+    'attribute': (Attribute, 'name'),
+  }
+  key = ('user', 'attribute')
+  # Writing a disabled attribute enables it again
+  update_defaults = {'disabled_at': None}
+
+  def changed(self, values):
+    documents.schedule(set(row['user_id'] for row in values))
+
+
+class AttendanceWriter(BulkWriter):
+  model = Attendance
+  fields = ('user', 'school', 'role', 'group')
+  relations = {
+    'user': (User, 'username'),
+    'school': (School, 'school_id'),
+    'role': (Role, 'name'),
+  }
+  key = ('user', 'school', 'role', 'group')
+  # As the model field
+  defaults = {'group': ''}
+
+  def changed(self, values):
+    documents.schedule(set(row['user_id'] for row in values))
+
+
+class MunicipalityWriter(BulkWriter):
+  model = Municipality
+  fields = ('name', 'municipality_id')
+  key = ('municipality_id',)
+
+  def changed(self, values):
+    # Updates do not send signals
+    cache.MUNICIPALITIES.invalidate()
+    municipalities = Municipality.objects.filter(data_source=self.data_source,
+        municipality_id__in=[row['municipality_id'] for row in values])
+    documents.invalidate(Attendance.objects.filter(school__municipality__in=municipalities).values('user_id'))
+
+
+class SchoolWriter(BulkWriter):
+  model = School
+  fields = ('name', 'school_id', 'municipality')
+  relations = {
+    'municipality': (Municipality, 'municipality_id'),
+  }
+  key = ('school_id',)
+
+  def changed(self, values):
+    cache.SCHOOLS.invalidate()
+    schools = School.objects.filter(data_source=self.data_source,
+        school_id__in=[row['school_id'] for row in values])
+    documents.invalidate(Attendance.objects.filter(school__in=schools).values('user_id'))
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,169 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+In-process caches of small reference tables.
+
+Sources, attributes, roles, municipalities and schools are looked up by
+name on every write and rarely change. Each ReferenceCache keeps a snapshot
+of its table in the process, so lookups are dictionary hits. Objects saved
+or deleted in this process update the snapshot through signals; changes
+made by other processes and by queryset updates are picked up after
+settings.AUTHDATA_REFERENCE_CACHE_TTL seconds. A name missing from the
+snapshot is always looked up in the database.
+
+Snapshots are loaded from the default database. Objects read or created
+inside a transaction are added when the transaction commits, since the
+transaction may still be rolled back.
+"""
+
+import time
+import threading
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connection
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from authdata import timing
+from authdata.models import Source, Attribute, Role, Municipality, School
+
+
+class ReferenceCache(object):
+  """
+  Objects of ``model`` by the value of ``field``. When several objects
+  have the same value, the one with the lowest primary key is used.
+  """
+
+  def __init__(self, model, field, name):
+    self.model = model
+    self.field = field
+    self.name = name
+    self._lock = threading.Lock()
+    self._index = None
+    self._loaded_at = 0
+
+  def __deepcopy__(self, memo):
+    # Shared by the process, also when DRF copies the fields referring to it
+    return self
+
+  def index(self):
+    """
+    The snapshot, or None inside a transaction when there is no fresh one
+    """
+    ttl = getattr(settings, 'AUTHDATA_REFERENCE_CACHE_TTL', 300)
+    with self._lock:
+      if self._index is not None and time.time() - self._loaded_at < ttl:
+        return self._index
+    return self.load()
+
+  def load(self):
+    if connection.in_atomic_block:
+      return None
+    index = {}
+    for obj in self.model.objects.using(DEFAULT_DB_ALIAS).order_by('-pk'):
+      index[getattr(obj, self.field)] = obj
+    with self._lock:
+      self._index = index
+      self._loaded_at = time.time()
+    return index
+
+  def get(self, value, query_missing=True):
+    """
+    The object or None.
+
+    With ``query_missing`` false a value missing from the snapshot is not
+    looked up. Instead the snapshot is reloaded if it is older than
+    settings.AUTHDATA_REFERENCE_CACHE_MISS_TTL seconds, so unknown values
+    cost at most one query in that time.
+    """
+    index = self.index()
+    if index is not None and value in index:
+      timing.cache(self.name, True)
+      return index[value]
+    timing.cache(self.name, False)
+    if index is not None and not query_missing:
+      if time.time() - self._loaded_at < getattr(settings, 'AUTHDATA_REFERENCE_CACHE_MISS_TTL', 10):
+        return None
+      index = self.load()
+      if index is not None:
+        return index.get(value)
+      # Not reloaded inside a transaction, look the value up instead
+    obj = self.model.objects.using(DEFAULT_DB_ALIAS).filter(**{self.field: value}).order_by('pk').first()
+    if obj is not None:
+      self.add(obj)
+    return obj
+
+  def get_or_create(self, value, defaults=None):
+    """
+    Like QuerySet.get_or_create(field=value, defaults=defaults)
+    """
+    obj = self.get(value)
+    if obj is not None:
+      return obj, False
+    obj, created = self.model.objects.get_or_create(defaults=defaults, **{self.field: value})
+    self.add(obj)
+    return obj, created
+
+  def add(self, obj):
+    if connection.in_atomic_block:
+      transaction.on_commit(lambda: self._add(obj))
+    else:
+      self._add(obj)
+
+  def _add(self, obj):
+    with self._lock:
+      if self._index is not None:
+        self._index.setdefault(getattr(obj, self.field), obj)
+
+  def invalidate(self):
+    with self._lock:
+      self._index = None
+
+  def _saved(self, sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+      self.add(instance)
+    else:
+      self.invalidate()
+
+  def _deleted(self, sender, instance, **kwargs):
+    self.invalidate()
+
+  def connect(self):
+    post_save.connect(self._saved, sender=self.model, weak=False)
+    post_delete.connect(self._deleted, sender=self.model, weak=False)
+    return self
+
+
+SOURCES = ReferenceCache(Source, 'name', 'source').connect()
+ATTRIBUTES = ReferenceCache(Attribute, 'name', 'attribute').connect()
+ROLES = ReferenceCache(Role, 'name', 'role').connect()
+MUNICIPALITIES = ReferenceCache(Municipality, 'name', 'municipality').connect()
+SCHOOLS = ReferenceCache(School, 'school_id', 'school').connect()
+
+
+def invalidate_all():
+  for cache in (SOURCES, ATTRIBUTES, ROLES, MUNICIPALITIES, SCHOOLS):
+    cache.invalidate()
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
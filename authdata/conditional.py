@@ -0,0 +1,125 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Conditional GETs of user data.
+
+The ETag of a response is computed from the ``modified`` timestamps of the
+users and the rows serialized with them, in one aggregate query for the
+users and one for each of their relations. A relation is only joined with
+the tables it refers to, so no rows are multiplied. The numbers of users,
+attributes and attendances are part of the ETag, so a deleted row changes
+it even though no timestamp does. With settings.AUTHDATA_USER_DOCUMENTS
+the UserDocument timestamps are used, see authdata.documents.
+
+There is no Last-Modified: the latest timestamp of the remaining rows does
+not change when a row is deleted, so If-Modified-Since could not be
+answered correctly.
+
+The ETag is only computed for HEAD requests and requests with
+If-None-Match, other GETs cost no extra queries. A request with a matching
+If-None-Match is answered with 304 Not Modified before anything is
+serialized. Clients get the first ETag with a HEAD request or by sending
+any If-None-Match, such as ``""``.
+"""
+
+import hashlib
+import functools
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from authdata import documents
+from authdata.models import User, UserAttribute, Attendance
+
+RELATIONS = (
+  (UserAttribute, ('modified', 'attribute__modified', 'data_source__modified')),
+  (Attendance, ('modified', 'role__modified', 'school__modified', 'school__municipality__modified')),
+)
+
+
+def user_state(queryset):
+  """
+  Returns the number of users in ``queryset``, whether any of them has an
+  external source, the row counts and the timestamps the validators are
+  computed from, or None if some user has no document yet.
+  """
+  users = User.objects.filter(pk__in=queryset.values('pk'))
+  if documents.enabled():
+    state = users.aggregate(users=Count('id'), documents=Count('document'),
+        modified=Max('document__modified'), external=Max('external_source'))
+    if state['users'] != state['documents']:
+      return None
+    return state['users'], bool(state['external']), (state['users'],), [state['modified']]
+  state = users.aggregate(users=Count('id'), external=Max('external_source'), modified=Max('modified'))
+  counts, timestamps = [state['users']], [state['modified']]
+  if state['users']:
+    for model, fields in RELATIONS:
+      aggregates = dict(('modified_%d' % i, Max(field)) for i, field in enumerate(fields))
+      rows = model.objects.filter(user__in=queryset.values('pk')).aggregate(count=Count('id'), **aggregates)
+      counts.append(rows['count'])
+      timestamps.extend(rows['modified_%d' % i] for i in xrange(len(fields)))
+  return state['users'], bool(state['external']), tuple(counts), timestamps
+
+
+def etag(queryset, requester, single=False):
+  """
+  Returns the ETag of the users in ``queryset`` as seen by ``requester``,
+  or None if the response can not be validated. With ``single`` the
+  queryset must match exactly one local user.
+  """
+  state = user_state(queryset)
+  if state is None:
+    return None
+  users, external, counts, timestamps = state
+  if not users or (single and (users != 1 or external)):
+    return None
+  return '"%s"' % hashlib.md5(repr((requester, counts, timestamps))).hexdigest()
+
+
+def conditional(users, single=False):
+  """
+  Answers conditional GETs of a view method. The view method named
+  ``users`` is called with the arguments of the request and returns the
+  queryset of the users the response is serialized from, or None if the
+  response can not be validated.
+  """
+  def decorator(method):
+    @functools.wraps(method)
+    def inner(view, request, *args, **kwargs):
+      queryset = None
+      if request.method == 'HEAD' or (request.method == 'GET' and 'HTTP_IF_NONE_MATCH' in request.META):
+        queryset = getattr(view, users)(request, *args, **kwargs)
+      tag = etag(queryset, request.user.username, single) if queryset is not None else None
+      if tag is None:
+        return method(view, request, *args, **kwargs)
+      response = get_conditional_response(request, etag=tag)
+      if response is None:
+        response = method(view, request, *args, **kwargs)
+      if response.status_code in (200, 304):
+        response['ETag'] = tag
+      return response
+    return inner
+  return decorator
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -23,12 +23,91 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import collections
+import hashlib
 import logging
-from authdata.models import User, Source, Attribute, UserAttribute
+import threading
+from django.conf import settings
+from authdata import cache
+from authdata import metrics
+from authdata import timing
+from authdata.models import User, UserAttribute
 
 LOG = logging.getLogger(__name__)
 
 
+class LRUCache(object):
+  """
+  Thread safe mapping which keeps at most maxsize most recently used items
+
+  Hits and misses of a named cache are recorded for timed requests.
+  """
+
+  def __init__(self, maxsize, name=None):
+    self.maxsize = maxsize
+    self.name = name
+    self._data = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key, default=None):
+    with self._lock:
+      try:
+        value = self._data.pop(key)
+      except KeyError:
+        value = default
+        hit = False
+      else:
+        self._data[key] = value
+        hit = True
+    if self.name:
+      timing.cache(self.name, hit)
+    return value
+
+  def set(self, key, value):
+    with self._lock:
+      self._data.pop(key, None)
+      self._data[key] = value
+      if len(self._data) > self.maxsize:
+        self._data.popitem(last=False)
+
+  def clear(self):
+    with self._lock:
+      self._data.clear()
+
+  def __len__(self):
+    return len(self._data)
+
+
+# (salt, username) -> oid
+OID_CACHE = LRUCache(getattr(settings, 'AUTHDATA_OID_CACHE_SIZE', 10000), name='oid')
+
+
+class UserRecord(dict):
+  """
+  User data returned by external sources.
+
+  A dict with a fixed set of keys, so it renders and compares like the plain
+  dicts used before. Roles and attributes are materialized to lists when the
+  record is created, so storing or rendering a record never runs source
+  logic again.
+  """
+  __slots__ = ()
+
+  fields = ('username', 'first_name', 'last_name', 'roles', 'attributes')
+
+  def __init__(self, username, first_name, last_name, roles=(), attributes=()):
+    super(UserRecord, self).__init__(
+      username=username,
+      first_name=first_name,
+      last_name=last_name,
+      roles=list(roles),
+      attributes=list(attributes),
+    )
+
+  def __reduce__(self):
+    return (self.__class__, tuple(self[field] for field in self.fields))
+
+
 class ExternalDataSource(object):
   """
   An external user attribute source. The source is identified by a specific
@@ -50,9 +129,53 @@ class ExternalDataSource(object):
     """
     raise NotImplementedError
 
+  @property
+  def source_name(self):
+    """
+    Name of the source in timings and metrics
+    """
+    return self.external_source or self.__class__.__name__
+
+  def timed(self):
+    """
+    Context manager recording the time spent in the block as time spent in
+    this external source, in metrics and for requests timed by
+    TimingMiddleware.
+    """
+    return timing.backend(self.source_name)
+
+  def make_oid(self, salt, username):
+    """
+    Derive a fake MPASS OID from a source specific salt and the username.
+
+    Results are memoized in OID_CACHE.
+    """
+    key = (salt, username)
+    oid = OID_CACHE.get(key)
+    if oid is None:
+      # TODO: OID is cut to 30 chars due to django username limitation
+      oid = 'MPASSOID.{user_hash}'.format(user_hash=hashlib.sha1(salt + username).hexdigest())[:30]
+      OID_CACHE.set(key, oid)
+    return oid
+
+  @staticmethod
+  def resolve_oid(oid):
+    """
+    Find the external source of a provisioned user.
+
+    Returns a (external_source, external_id) tuple or None if the OID is
+    unknown. The username index of User serves as the lookup table, it is
+    kept up to date by provision_user.
+    """
+    try:
+      return User.objects.filter(username=oid).values_list('external_source', 'external_id').get()
+    except User.DoesNotExist:
+      return None
+
   def get_data(self, external_id):
     """
-    Get user data based on attribute query.
+    Get user data based on attribute query. Returns a UserRecord or None if
+    the user does not exist in the source.
 
     external_id: attribute value passed by Auth Proxy
     """
@@ -66,6 +189,33 @@ class ExternalDataSource(object):
     """
     raise NotImplementedError
 
+  def iter_user_data(self, request):
+    """
+    Query for a user listing, yielding users one at a time as they are
+    fetched and provisioned.
+
+    request: the request object containing GET-parameters for filtering the query
+
+    The default implementation wraps get_user_data. Sources should override
+    this and build get_user_data on top of it with user_listing.
+    """
+    for user_data in self.get_user_data(request)['results']:
+      yield user_data
+
+  def user_listing(self, users):
+    """
+    Collect an iterable of user dicts into the paginated listing format
+    returned by get_user_data
+    """
+    results = list(users)
+    # TODO: support actual paging
+    return {
+      'count': len(results),
+      'next': None,
+      'previous': None,
+      'results': results,
+    }
+
   def provision_user(self, oid, external_id):
     """
     Save fetched user to local db
@@ -75,6 +225,7 @@ class ExternalDataSource(object):
     """
 
     user_obj, new_user_created = User.objects.get_or_create(username=oid)
+    metrics.observe_provisioning(self.source_name, new_user_created)
     LOG.debug('User provision',
             extra={'data':
                    {'oid': oid, 'external_id': external_id,
@@ -85,8 +236,8 @@ class ExternalDataSource(object):
     user_obj.external_source = self.external_source
     user_obj.save()
 
-    source_obj, _ = Source.objects.get_or_create(name='local')
-    attribute_obj, _ = Attribute.objects.get_or_create(name=self.external_source)
+    source_obj, _ = cache.SOURCES.get_or_create('local')
+    attribute_obj, _ = cache.ATTRIBUTES.get_or_create(self.external_source)
 
     user_attr_obj, _ = UserAttribute.objects.get_or_create(user=user_obj,
         attribute=attribute_obj, data_source=source_obj)
@@ -28,12 +28,20 @@ Dreamschool external data source
 """
 
 import logging
-import hashlib
+import threading
+import time
 import requests
 
 from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.test.signals import setting_changed
 
+from authdata import timing
 from authdata.datasources.base import ExternalDataSource
+from authdata.datasources.base import UserRecord
+from authdata.models import DreamschoolOrganisation
 
 LOG = logging.getLogger(__name__)
 
@@ -134,6 +142,87 @@ LOG = logging.getLogger(__name__)
 TEACHER_PERM = 'dreamdiary.diary.supervisor'
 
 
+class OrganisationIndex(object):
+  """
+  Forward and inverted indexes of the Dreamschool organisations
+
+  org_ids: {municipality: {school: org_id}}, names in lowercase
+  municipalities: {org_id: municipality}
+  """
+
+  def __init__(self, organisations):
+    """
+    organisations: iterable of (municipality, school, org_id) tuples. Later
+    entries override earlier ones.
+    """
+    self.org_ids = {}
+    self.municipalities = {}
+    for municipality, school, org_id in organisations:
+      municipality = municipality.lower()
+      self.org_ids.setdefault(municipality, {})[school.lower()] = org_id
+    for municipality, schools in self.org_ids.iteritems():
+      for org_id in schools.itervalues():
+        self.municipalities.setdefault(int(org_id), municipality)
+
+  @classmethod
+  def load(cls):
+    """
+    Build the index from settings.AUTHDATA_DREAMSCHOOL_ORG_MAP and the
+    DreamschoolOrganisation table
+    """
+    organisations = []
+    for municipality, schools in settings.AUTHDATA_DREAMSCHOOL_ORG_MAP.iteritems():
+      for school, org_id in schools.iteritems():
+        organisations.append((municipality, school, org_id))
+    organisations.extend(DreamschoolOrganisation.objects.values_list('municipality', 'school', 'org_id'))
+    return cls(organisations)
+
+
+_org_index = None
+_org_index_loaded_at = 0
+_org_index_lock = threading.Lock()
+
+
+def get_org_index():
+  """
+  Returns the OrganisationIndex, shared by all handlers in this process.
+
+  The index is rebuilt when the organisations change or after
+  settings.AUTHDATA_DREAMSCHOOL_ORG_MAP_TTL seconds, so changes made in
+  other processes are noticed too. An index read inside a transaction is
+  not shared, as it may contain uncommitted rows.
+  """
+  global _org_index, _org_index_loaded_at
+  ttl = getattr(settings, 'AUTHDATA_DREAMSCHOOL_ORG_MAP_TTL', 300)
+  with _org_index_lock:
+    if _org_index is not None and time.time() - _org_index_loaded_at < ttl:
+      timing.cache('dreamschool_org_index', True)
+      return _org_index
+  timing.cache('dreamschool_org_index', False)
+  index = OrganisationIndex.load()
+  if not connection.in_atomic_block:
+    with _org_index_lock:
+      _org_index = index
+      _org_index_loaded_at = time.time()
+  return index
+
+
+def invalidate_org_index(**kwargs):
+  global _org_index
+  with _org_index_lock:
+    _org_index = None
+
+
+def _org_map_setting_changed(setting, **kwargs):
+  if setting == 'AUTHDATA_DREAMSCHOOL_ORG_MAP':
+    invalidate_org_index()
+
+
+post_save.connect(invalidate_org_index, sender=DreamschoolOrganisation)
+post_delete.connect(invalidate_org_index, sender=DreamschoolOrganisation)
+setting_changed.connect(_org_map_setting_changed)
+
+
 class DreamschoolDataSource(ExternalDataSource):
   """
   Required configuration parameters:
@@ -151,17 +240,18 @@ class DreamschoolDataSource(ExternalDataSource):
     self.password = password
 
   # PRIVATE METHODS
-  def _get_municipality_by_org_id(self, org_id):
+  @property
+  def org_index(self):
+    return get_org_index()
+
+  def _get_municipality_by_org_id(self, org_id, org_index=None):
     org_id = int(org_id)
     LOG.debug('Fetching municipality for org_id',
               extra={'data': {'org_id': org_id}})
-    for municipality in settings.AUTHDATA_DREAMSCHOOL_ORG_MAP.keys():
-      for org_title in settings.AUTHDATA_DREAMSCHOOL_ORG_MAP[municipality]:
-        if int(settings.AUTHDATA_DREAMSCHOOL_ORG_MAP[municipality][org_title]) == org_id:
-          return municipality.capitalize()
-    return u''
+    org_index = org_index or self.org_index
+    return org_index.municipalities.get(org_id, u'').capitalize()
 
-  def _get_roles(self, user_data):
+  def _get_roles(self, user_data, org_index=None):
     """Create roles structure
 
     Example of output::
@@ -184,6 +274,8 @@ class DreamschoolDataSource(ExternalDataSource):
 
     roles_data = user_data['roles']
     groups_data = user_data['user_groups']
+    # One index for all the groups, it is not cached inside a transaction
+    org_index = org_index or self.org_index
 
     # First we get list of schools where user is a teacher
     schools_as_teacher = []
@@ -193,6 +285,7 @@ class DreamschoolDataSource(ExternalDataSource):
         schools_as_teacher.append(org_id)
 
     # iterate through groups
+    roles = []
     for g in groups_data:
       out = {}
       out['school'] = g['organisation']['title']
@@ -201,10 +294,11 @@ class DreamschoolDataSource(ExternalDataSource):
       else:
         out['role'] = 'student'
       out['group'] = g['title']
-      out['municipality'] = self._get_municipality_by_org_id(g['organisation']['id'])
-      yield out
+      out['municipality'] = self._get_municipality_by_org_id(g['organisation']['id'], org_index)
+      roles.append(out)
+    return roles
 
-  def _get_org_id(self, municipality, school):
+  def _get_org_id(self, municipality, school, org_index=None):
     if not municipality or not school:
       return None
 
@@ -213,7 +307,7 @@ class DreamschoolDataSource(ExternalDataSource):
               'school': repr(school)}})
 
     try:
-      muni = settings.AUTHDATA_DREAMSCHOOL_ORG_MAP[municipality.lower()]
+      muni = (org_index or self.org_index).org_ids[municipality.lower()]
     except KeyError:
       LOG.error('Unknown municipality')
       return None
@@ -241,8 +335,7 @@ class DreamschoolDataSource(ExternalDataSource):
     There is no OID information in this external source. Generate fake OID
     from username.
     """
-    # TODO: OID is cut to 30 chars due to django username limitation
-    return 'MPASSOID.{user_hash}'.format(user_hash=hashlib.sha1('dreamschool' + username).hexdigest())[:30]
+    return self.make_oid('dreamschool', username)
 
   def get_user_data(self, request):
     """
@@ -250,6 +343,14 @@ class DreamschoolDataSource(ExternalDataSource):
 
     Returns a list of users based on request.GET filtering values
     """
+    return self.user_listing(self.iter_user_data(request))
+
+  def iter_user_data(self, request):
+    """
+    Requested by mpass-connector
+
+    Yields users based on request.GET filtering values
+    """
 
     self.request = request
     school = u''
@@ -264,7 +365,8 @@ class DreamschoolDataSource(ExternalDataSource):
     url = self.api_url
     username = self.username
     password = self.password
-    org_id = self._get_org_id(municipality, school)
+    org_index = self.org_index
+    org_id = self._get_org_id(municipality, school, org_index)
 
     params = {}
     if org_id:
@@ -273,11 +375,13 @@ class DreamschoolDataSource(ExternalDataSource):
       }
       if group:
         params['user_groups__title__icontains'] = group
-      r = requests.get(url, auth=(username, password), params=params)
+      with self.timed():
+        r = requests.get(url, auth=(username, password), params=params)
     else:
       # This may fail to proxy timeout error
       # TODO: Catch status code 502 Proxy error
-      r = requests.get(url, auth=(username, password))
+      with self.timed():
+        r = requests.get(url, auth=(username, password))
 
     LOG.debug('Fetched from dreamschool', extra={'data':
       {'api_url': self.api_url,
@@ -293,25 +397,14 @@ class DreamschoolDataSource(ExternalDataSource):
          'username': self.username,
          'params': params,
          }})
-      return {
-        'count': 0,
-        'next': None,
-        'previous': None,
-        'results': [],
-      }
+      return
 
-    response = []
     user_data = {}
     try:
       user_data = r.json()
     except ValueError:
       LOG.exception('Could not parse user data from dreamschool API')
-      return {
-        'count': 0,
-        'next': None,
-        'previous': None,
-        'results': [],
-      }
+      return
 
     for d in user_data['objects']:
       user_id = d['id']
@@ -322,25 +415,18 @@ class DreamschoolDataSource(ExternalDataSource):
       external_id = str(user_id)
       attributes = [
       ]
-      roles = self._get_roles(d)
-      response.append({
-        'username': oid,
-        'first_name': first_name,
-        'last_name': last_name,
-        'roles': roles,
-        'attributes': attributes
-      })
+      roles = self._get_roles(d, org_index)
 
       # On Demand provisioning of the users
       self.provision_user(oid, external_id)
 
-    # TODO: support actual paging via SimplePagedResultsControl
-    return {
-      'count': len(response),
-      'next': None,
-      'previous': None,
-      'results': response,
-    }
+      yield UserRecord(
+        username=oid,
+        first_name=first_name,
+        last_name=last_name,
+        roles=roles,
+        attributes=attributes,
+      )
 
   def get_data(self, external_id):
     """Requested by idP
@@ -351,7 +437,8 @@ class DreamschoolDataSource(ExternalDataSource):
     username = self.username
     password = self.password
 
-    r = requests.get(url, auth=(username, password))
+    with self.timed():
+      r = requests.get(url, auth=(username, password))
 
     LOG.debug('Fetched from dreamschool', extra={'data':
       {'url': url,
@@ -386,13 +473,13 @@ class DreamschoolDataSource(ExternalDataSource):
     oid = self.get_oid(username)
     self.provision_user(oid, external_id)
 
-    return {
-      'username': self.get_oid(username),
-      'first_name': first_name,
-      'last_name': last_name,
-      'roles': roles,
-      'attributes': attributes
-    }
+    return UserRecord(
+      username=oid,
+      first_name=first_name,
+      last_name=last_name,
+      roles=roles,
+      attributes=attributes,
+    )
     # TODO: support actual paging via SimplePagedResultsControl
 
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,625 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Fake backends for the external data sources
+
+These make it possible to exercise the external data sources without
+network access, for example to benchmark connection handling, caching and
+timeouts. Every fake serves the same deterministic ``FakeDataset`` and can
+be configured to add latency and to fail a share of the requests.
+
+* ``FakeTestLDAPDataSource`` and ``FakeOuluLDAPDataSource`` replace the LDAP
+  connection with an in-process directory. Configure them in
+  AUTH_EXTERNAL_SOURCES instead of the real classes, with the additional
+  keyword arguments ``users``, ``schools``, ``seed``, ``latency`` and
+  ``error_rate``.
+* ``FakeBackendServer`` is an HTTP server mimicking the Dreamschool, Wilma,
+  Opinsys and Google Directory APIs. Run it with
+  ``manage.py fake_backends``, which also prints matching configuration.
+"""
+
+import re
+import json
+import time
+import base64
+import hashlib
+import hmac
+import random
+import logging
+import threading
+import urlparse
+import collections
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import ldap
+from authdata.datasources.dreamschool import TEACHER_PERM
+from authdata.datasources.ldap_base import TestLDAPDataSource
+from authdata.datasources.oulu import OuluLDAPDataSource
+
+LOG = logging.getLogger(__name__)
+
+
+FakePerson = collections.namedtuple('FakePerson',
+    ['id', 'username', 'first_name', 'last_name', 'role', 'school', 'group'])
+
+
+class FakeDataset(object):
+  """
+  Deterministic set of people for the fake backends
+
+  Every person attends one group in one of ``schools`` schools, which are
+  referred to by index. Roughly every tenth person is a teacher.
+  """
+
+  def __init__(self, size=1000, schools=10, seed=0):
+    rng = random.Random(seed)
+    self.schools = schools
+    self.people = []
+    for i in xrange(1, size + 1):
+      role = 'teacher' if rng.random() < 0.1 else 'student'
+      group = '%d%s' % (rng.randint(1, 9), rng.choice('ABCD'))
+      self.people.append(FakePerson(i, 'fake%d' % i, 'First%d' % i, 'Last%d' % i,
+          role, rng.randrange(schools), group))
+    self.by_id = dict((p.id, p) for p in self.people)
+    self.by_username = dict((p.username, p) for p in self.people)
+
+
+class FakeBehaviour(object):
+  """
+  Latency in seconds added to every request and the share of requests
+  which fail
+  """
+
+  def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+    self.latency = latency
+    self.error_rate = error_rate
+    self.random = random.Random(seed)
+
+  def delay(self):
+    if self.latency:
+      time.sleep(self.latency)
+
+  def fails(self):
+    return bool(self.error_rate) and self.random.random() < self.error_rate
+
+
+# LDAP
+
+_FILTER_ESCAPE = re.compile(r'\\([0-9a-fA-F]{2})')
+
+
+def _unescape(value):
+  return _FILTER_ESCAPE.sub(lambda m: chr(int(m.group(1), 16)), value)
+
+
+def parse_filter(filterstr):
+  """
+  Parse an LDAP search filter to nested tuples:
+
+    ('&', [filter, ...]), ('|', [filter, ...]), ('!', filter),
+    ('=', attribute, value), ('present', attribute) and
+    ('substring', attribute, regex)
+
+  Attribute names and values are lowercased.
+  """
+  if isinstance(filterstr, unicode):
+    filterstr = filterstr.encode('utf-8')
+  node, pos = _parse_filter(filterstr, 0)
+  if pos != len(filterstr):
+    raise ldap.FILTER_ERROR({'desc': 'Bad search filter', 'info': filterstr})
+  return node
+
+
+def _parse_filter(s, pos):
+  if s[pos:pos + 1] != '(':
+    raise ldap.FILTER_ERROR({'desc': 'Bad search filter', 'info': s})
+  pos += 1
+  op = s[pos:pos + 1]
+  if op in ('&', '|'):
+    children = []
+    pos += 1
+    while s[pos:pos + 1] == '(':
+      child, pos = _parse_filter(s, pos)
+      children.append(child)
+    node = (op, children)
+  elif op == '!':
+    child, pos = _parse_filter(s, pos + 1)
+    node = (op, child)
+  else:
+    end = s.find(')', pos)
+    if end == -1 or '=' not in s[pos:end]:
+      raise ldap.FILTER_ERROR({'desc': 'Bad search filter', 'info': s})
+    attribute, value = s[pos:end].split('=', 1)
+    attribute = attribute.lower()
+    if value == '*':
+      node = ('present', attribute)
+    elif '*' in value:
+      pattern = '.*'.join(re.escape(_unescape(part).lower()) for part in value.split('*'))
+      node = ('substring', attribute, re.compile('^%s$' % pattern, re.DOTALL))
+    else:
+      node = ('=', attribute, _unescape(value).lower())
+    pos = end
+  if s[pos:pos + 1] != ')':
+    raise ldap.FILTER_ERROR({'desc': 'Bad search filter', 'info': s})
+  return node, pos + 1
+
+
+def _matches(node, attrs):
+  op = node[0]
+  if op == '&':
+    return all(_matches(child, attrs) for child in node[1])
+  if op == '|':
+    return any(_matches(child, attrs) for child in node[1])
+  if op == '!':
+    return not _matches(node[1], attrs)
+  values = attrs.get(node[1], ())
+  if op == 'present':
+    return bool(values)
+  if op == 'substring':
+    return any(node[2].match(v) for v in values)
+  return node[2] in values
+
+
+class FakeLDAPDirectory(object):
+  """
+  In-memory directory of (dn, attributes) entries searched like an LDAP
+  server. Equality terms are answered from lazily built indexes.
+  """
+
+  def __init__(self, entries):
+    self.entries = list(entries)
+    self._dns = [dn.lower() for dn, attrs in self.entries]
+    self._attrs = [dict((k.lower(), set(v.lower() for v in values)) for k, values in attrs.iteritems())
+        for dn, attrs in self.entries]
+    self._indexes = {}
+    self._lock = threading.Lock()
+
+  def _index(self, attribute):
+    with self._lock:
+      if attribute not in self._indexes:
+        index = collections.defaultdict(list)
+        for i, attrs in enumerate(self._attrs):
+          for value in attrs.get(attribute, ()):
+            index[value].append(i)
+        self._indexes[attribute] = index
+      return self._indexes[attribute]
+
+  def _candidates(self, node):
+    if node[0] == '=':
+      return self._index(node[1]).get(node[2], [])
+    if node[0] == '&':
+      candidates = [self._candidates(child) for child in node[1]]
+      candidates = [c for c in candidates if c is not None]
+      if candidates:
+        return min(candidates, key=len)
+    return None
+
+  def search(self, base, scope, filterstr):
+    if isinstance(base, unicode):
+      base = base.encode('utf-8')
+    base = base.lower()
+    node = parse_filter(filterstr)
+    candidates = self._candidates(node)
+    if candidates is None:
+      candidates = xrange(len(self.entries))
+    results = []
+    for i in candidates:
+      dn = self._dns[i]
+      if scope == ldap.SCOPE_BASE:
+        in_scope = dn == base
+      elif scope == ldap.SCOPE_ONELEVEL:
+        in_scope = dn.endswith(',' + base) and ',' not in dn[:-len(base) - 1]
+      else:
+        in_scope = dn == base or dn.endswith(',' + base)
+      if in_scope and _matches(node, self._attrs[i]):
+        results.append(self.entries[i])
+    return results
+
+
+class FakeLDAPObject(object):
+  """
+  Stands in for the connection object returned by ``ldap.initialize``
+  """
+
+  def __init__(self, directory, behaviour):
+    self.directory = directory
+    self.behaviour = behaviour
+
+  def _request(self):
+    self.behaviour.delay()
+    if self.behaviour.fails():
+      raise ldap.SERVER_DOWN({'desc': "Can't contact LDAP server"})
+
+  def set_option(self, option, value):
+    pass
+
+  def start_tls_s(self):
+    self._request()
+
+  def simple_bind_s(self, who='', cred=''):
+    self._request()
+
+  def search_s(self, base, scope, filterstr='(objectClass=*)', attrlist=None, attrsonly=0):
+    self._request()
+    return self.directory.search(base, scope, filterstr)
+
+  def unbind_s(self):
+    pass
+
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+
+class FakeLDAPMixin(object):
+  """
+  Connects an LDAPDataSource to an in-process FakeLDAPDirectory
+
+  The directory is built once per process for each data set.
+  """
+
+  def __init__(self, *args, **kwargs):
+    self.fake_users = kwargs.pop('users', 1000)
+    self.fake_schools = kwargs.pop('schools', 10)
+    self.fake_seed = kwargs.pop('seed', 0)
+    self.fake_behaviour = FakeBehaviour(latency=kwargs.pop('latency', 0.0),
+        error_rate=kwargs.pop('error_rate', 0.0), seed=self.fake_seed)
+    super(FakeLDAPMixin, self).__init__(*args, **kwargs)
+
+  @property
+  def fake_directory(self):
+    key = (self.__class__, self.ldap_base_dn, self.fake_users, self.fake_schools, self.fake_seed)
+    with _directories_lock:
+      if key not in _directories:
+        dataset = FakeDataset(self.fake_users, self.fake_schools, self.fake_seed)
+        _directories[key] = FakeLDAPDirectory(self.fake_entries(dataset))
+      return _directories[key]
+
+  def connect(self):
+    self.connection = FakeLDAPObject(self.fake_directory, self.fake_behaviour)
+    self.connection.simple_bind_s(self.ldap_username, self.ldap_password)
+
+  def fake_entries(self, dataset):
+    raise NotImplementedError
+
+
+class FakeTestLDAPDataSource(FakeLDAPMixin, TestLDAPDataSource):
+  """
+  TestLDAPDataSource against a fake of the test LDAP directory. Users are
+  found with their username as external id.
+  """
+
+  def fake_entries(self, dataset):
+    for p in dataset.people:
+      attrs = {
+        'cn': [p.username],
+        'uid': [p.username],
+        'givenName': [p.first_name],
+        'sn': [p.last_name],
+        'mail': ['%s@mpass-test.invalid' % p.username],
+        'objectClass': ['top', 'inetOrgPerson'],
+      }
+      if p.role == 'teacher':
+        ou = 'Opettajat'
+        attrs['title'] = ['Opettaja']
+      else:
+        ou = 'Oppilaat'
+        attrs['title'] = ['Oppilas']
+        attrs['departmentNumber'] = [p.group]
+      dn = 'cn=%s,ou=%s,ou=People,ou=LdapKoulu%d,%s' % (p.username, ou, p.school + 1, self.ldap_base_dn)
+      yield dn, attrs
+
+
+def object_guid(username):
+  """
+  objectGUID of a person in FakeOuluLDAPDataSource
+  """
+  return hashlib.md5(username).digest()
+
+
+class FakeOuluLDAPDataSource(FakeLDAPMixin, OuluLDAPDataSource):
+  """
+  OuluLDAPDataSource against a fake Active Directory. Users are found with
+  the base64 encoded ``object_guid`` of their username as external id.
+  """
+
+  def fake_entries(self, dataset):
+    schools = sorted(self.school_id_map)
+    for p in dataset.people:
+      attrs = {
+        'objectCategory': ['person'],
+        'objectClass': ['top', 'person', 'organizationalPerson', 'user'],
+        'objectGUID': [object_guid(p.username)],
+        'uid': [p.username],
+        'givenName': [p.first_name],
+        'sn': [p.last_name],
+        'title': ['Opettaja' if p.role == 'teacher' else 'Oppilas'],
+        'physicalDeliveryOfficeName': [schools[p.school % len(schools)].encode('utf-8')],
+        'department': [p.group],
+      }
+      yield 'CN=%s,OU=Users,%s' % (p.username, self.ldap_base_dn), attrs
+
+
+# HTTP
+
+class FakeBackendHandler(BaseHTTPRequestHandler):
+  """
+  Routes requests to the fake APIs of FakeBackendServer
+  """
+
+  routes = (
+    (re.compile(r'^/dreamschool/api/2/users/$'), 'dreamschool_users'),
+    (re.compile(r'^/dreamschool/api/2/users/(\d+)/$'), 'dreamschool_user'),
+    (re.compile(r'^/external/mpass$'), 'wilma_user'),
+    (re.compile(r'^/v3/users/_by_id/([^/]+)$'), 'opinsys_user'),
+    (re.compile(r'^/gafe/discovery$'), 'gafe_discovery'),
+    (re.compile(r'^/gafe/admin/directory/v1/users/([^/]+)$'), 'gafe_user'),
+  )
+
+  def do_GET(self):
+    path, _, query = self.path.partition('?')
+    params = dict(urlparse.parse_qsl(query))
+    self.server.behaviour.delay()
+    for pattern, name in self.routes:
+      match = pattern.match(path)
+      if match:
+        if self.server.behaviour.fails():
+          return self.send_json(503, {'detail': 'Fake failure'})
+        status, data = getattr(self, name)(params, *match.groups())
+        return self.send_json(status, data)
+    return self.send_json(404, {'detail': 'Not found'})
+
+  def send_json(self, status, data):
+    body = json.dumps(data)
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    LOG.debug('Fake backend request', extra={'data': {'request': format % args}})
+
+  def authorized(self):
+    expected = 'Basic %s' % base64.b64encode('%s:%s' % (self.server.username, self.server.password))
+    return self.headers.get('Authorization') == expected
+
+  @property
+  def base_url(self):
+    return 'http://%s' % self.headers.get('Host')
+
+  def school_name(self, person):
+    return 'Fake school %d' % (person.school + 1)
+
+  # Dreamschool
+
+  def dreamschool_data(self, p):
+    org_id = p.school + 1
+    return {
+      'id': p.id,
+      'username': p.username,
+      'first_name': p.first_name,
+      'last_name': p.last_name,
+      'roles': [{
+        'organisation': {'id': org_id},
+        'permissions': [{'code': TEACHER_PERM}] if p.role == 'teacher' else [],
+      }],
+      'user_groups': [{
+        'organisation': {'id': org_id, 'title': self.school_name(p)},
+        'title': p.group,
+      }],
+    }
+
+  def dreamschool_users(self, params):
+    if not self.authorized():
+      return 401, {'detail': 'Authentication credentials were not provided.'}
+    people = self.server.dataset.people
+    if 'organisations__id' in params:
+      school = int(params['organisations__id']) - 1
+      people = [p for p in people if p.school == school]
+    if 'user_groups__title__icontains' in params:
+      group = params['user_groups__title__icontains'].lower()
+      people = [p for p in people if group in p.group.lower()]
+    return 200, {'objects': [self.dreamschool_data(p) for p in people]}
+
+  def dreamschool_user(self, params, user_id):
+    if not self.authorized():
+      return 401, {'detail': 'Authentication credentials were not provided.'}
+    person = self.server.dataset.by_id.get(int(user_id))
+    if person is None:
+      return 404, {'detail': 'Not found'}
+    return 200, self.dreamschool_data(person)
+
+  # Wilma
+
+  def wilma_user(self, params):
+    query = self.path.partition('?')[2]
+    signed, _, checksum = query.rpartition('&h=')
+    calcinput = '%s/external/mpass?%s' % (self.base_url, signed)
+    expected = hmac.new(self.server.sharedsecret, calcinput, digestmod=hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, checksum):
+      return 403, {'detail': 'Invalid checksum'}
+    person = self.server.dataset.by_username.get(params.get('username'))
+    if person is None:
+      return 404, []
+    return 200, [{
+      'cryptid': hashlib.sha1(person.username).hexdigest(),
+      'first_name': person.first_name,
+      'last_name': person.last_name,
+      'roles': [{'school': self.school_name(person), 'group': person.group, 'role': person.role}],
+    }]
+
+  # Opinsys
+
+  def opinsys_user(self, params, username):
+    if not self.authorized():
+      return 401, {'detail': 'Unauthorized'}
+    person = self.server.dataset.by_username.get(username)
+    if person is None:
+      return 404, {'detail': 'Not found'}
+    return 200, {
+      'first_name': person.first_name,
+      'last_name': person.last_name,
+      'schools': [{
+        'name': self.school_name(person),
+        'roles': [person.role],
+        'groups': [{'type': 'teaching group', 'name': person.group}],
+      }],
+    }
+
+  # Google Directory
+
+  def gafe_discovery(self, params):
+    return 200, {
+      'kind': 'discovery#restDescription',
+      'discoveryVersion': 'v1',
+      'id': 'admin:directory_v1',
+      'name': 'admin',
+      'version': 'directory_v1',
+      'protocol': 'rest',
+      'rootUrl': '%s/gafe/' % self.base_url,
+      'servicePath': 'admin/directory/v1/',
+      'baseUrl': '%s/gafe/admin/directory/v1/' % self.base_url,
+      'parameters': {
+        'fields': {'type': 'string', 'location': 'query'},
+      },
+      'schemas': {
+        'User': {'id': 'User', 'type': 'object'},
+      },
+      'resources': {
+        'users': {
+          'methods': {
+            'get': {
+              'id': 'directory.users.get',
+              'path': 'users/{userKey}',
+              'httpMethod': 'GET',
+              'parameters': {
+                'userKey': {'type': 'string', 'required': True, 'location': 'path'},
+                'projection': {'type': 'string', 'location': 'query'},
+                'customFieldMask': {'type': 'string', 'location': 'query'},
+                'viewType': {'type': 'string', 'location': 'query'},
+              },
+              'parameterOrder': ['userKey'],
+              'response': {'$ref': 'User'},
+            },
+          },
+        },
+      },
+    }
+
+  def gafe_user(self, params, user_key):
+    username = urlparse.unquote(user_key).split('@')[0]
+    person = self.server.dataset.by_username.get(username)
+    if person is None:
+      return 404, {'error': {'code': 404, 'message': 'Resource Not Found: userKey'}}
+    return 200, {
+      'primaryEmail': '%s@fake.invalid' % person.username,
+      'name': {'givenName': person.first_name, 'familyName': person.last_name},
+      'customSchemas': {
+        'PrimusV2': {
+          'SchoolID': self.school_name(person),
+          'Role': person.role.title(),
+          'Class': person.group,
+          'PrimusID': str(person.id),
+        },
+      },
+    }
+
+
+class FakeBackendServer(ThreadingMixIn, HTTPServer):
+  """
+  HTTP server for the fake Dreamschool, Wilma, Opinsys and Google Directory
+  APIs. Port 0 picks a free port.
+  """
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self, address=('127.0.0.1', 0), dataset=None, behaviour=None,
+      username='fake', password='fake', sharedsecret='fake'):
+    HTTPServer.__init__(self, address, FakeBackendHandler)
+    self.dataset = dataset or FakeDataset()
+    self.behaviour = behaviour or FakeBehaviour()
+    self.username = username
+    self.password = password
+    self.sharedsecret = sharedsecret
+    self.thread = None
+
+  @property
+  def host(self):
+    return '%s:%d' % self.server_address[:2]
+
+  def start(self):
+    """
+    Serve in a background thread
+    """
+    self.thread = threading.Thread(target=self.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    return self
+
+  def stop(self):
+    self.shutdown()
+    self.server_close()
+
+  def dreamschool_org_map(self, municipality='fake'):
+    """
+    AUTHDATA_DREAMSCHOOL_ORG_MAP entry for the fake schools
+    """
+    return {municipality: dict(('fake school %d' % (i + 1), i + 1) for i in xrange(self.dataset.schools))}
+
+  def external_sources(self):
+    """
+    AUTH_EXTERNAL_SOURCES entries for the fake APIs
+    """
+    return {
+      'dreamschool': ['authdata.datasources.dreamschool', 'DreamschoolDataSource', {
+        'api_url': 'http://%s/dreamschool/api/2/users/' % self.host,
+        'username': self.username,
+        'password': self.password,
+      }],
+      'wilma': ['authdata.datasources.wilma', 'WilmaDataSource', {
+        'hostname': self.host,
+        'sharedsecret': self.sharedsecret,
+        'municipality': 'Fake',
+        'scheme': 'http',
+      }],
+      'opinsys': ['authdata.datasources.opinsys', 'OpinsysDataSource', {
+        'clientId': self.username,
+        'clientKey': self.password,
+        'tenantId': 'fake',
+        'municipality': 'Fake',
+        'api_host': self.host,
+        'scheme': 'http',
+      }],
+      'gafe': ['authdata.datasources.gafe', 'GafeDataSource', {
+        'keyPath': None,
+        'adminPrincipal': None,
+        'municipality': 'Fake',
+        'discoveryUrl': 'http://%s/gafe/discovery' % self.host,
+      }],
+    }
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
@@ -25,12 +25,12 @@
 from __future__ import print_function, unicode_literals
 
 import logging
-import hashlib
 import requests
 
 from django.conf import settings
 
 from authdata.datasources.base import ExternalDataSource
+from authdata.datasources.base import UserRecord
 
 import argparse
 import json
@@ -50,12 +50,13 @@ class GafeDataSource(ExternalDataSource):
   This is a base class for all external data sources
   """
 
-  def __init__(self, keyPath, adminPrincipal, municipality, *args, **kwargs):
+  def __init__(self, keyPath, adminPrincipal, municipality, discoveryUrl=None, *args, **kwargs):
     LOG.debug('Invoke init')
     self.request = None
     self.keyPath = keyPath
     self.adminPrincipal = adminPrincipal
     self.municipality = municipality
+    self.discoveryUrl = discoveryUrl
 
   def _get_roles(self, data):
     out = {}
@@ -68,15 +69,25 @@ class GafeDataSource(ExternalDataSource):
 #    out['role'] = data['Role'].title()
     out['group'] = data['Class']
     out['municipality'] = self.municipality
-    yield out
+    return [out]
 
   def get_data(self, external_id):
-    scopes = ['https://www.googleapis.com/auth/admin.directory.user.readonly']
-    credentials = ServiceAccountCredentials.from_json_keyfile_name(self.keyPath, scopes)
-    delegated = credentials.create_delegated(self.adminPrincipal)
     from httplib2 import Http
-    http_auth = delegated.authorize(Http())
-    service = discovery.build('admin', 'directory_v1', http=http_auth)
+    if self.keyPath:
+      scopes = ['https://www.googleapis.com/auth/admin.directory.user.readonly']
+      credentials = ServiceAccountCredentials.from_json_keyfile_name(self.keyPath, scopes)
+      delegated = credentials.create_delegated(self.adminPrincipal)
+      http_auth = delegated.authorize(Http())
+    else:
+      # Without a key the API is called unauthenticated, which is only
+      # useful against authdata.datasources.fakes
+      http_auth = Http()
+    build_kwargs = {'http': http_auth}
+    if self.discoveryUrl:
+      build_kwargs['discoveryServiceUrl'] = self.discoveryUrl
+      build_kwargs['cache_discovery'] = False
+    with self.timed():
+      service = discovery.build('admin', 'directory_v1', **build_kwargs)
 
     # Limit the response fields to only needed ones
     fields = "primaryEmail,customSchemas,name"
@@ -86,7 +97,8 @@ class GafeDataSource(ExternalDataSource):
 #                         customFieldMask="mpassData",
 #                         viewType="domain_public",
                          fields=fields)
-    resp = req.execute()
+    with self.timed():
+      resp = req.execute()
     # On Demand provisioning of the user
     oid = self.get_oid(external_id)
     self.provision_user(oid, external_id)
@@ -96,13 +108,13 @@ class GafeDataSource(ExternalDataSource):
         if 'PrimusV2' in resp['customSchemas'] and resp['customSchemas']['PrimusV2'] is not None:
             roles = self._get_roles(resp['customSchemas']['PrimusV2'])
             attributes = [{'name':'legacyId', 'value': resp['customSchemas']['PrimusV2']['PrimusID']}]
-    return {
-      'username': oid,
-      'first_name': resp['name']['givenName'],
-      'last_name': resp['name']['familyName'],
-      'roles': roles,
-      'attributes': attributes
-    }
+    return UserRecord(
+      username=oid,
+      first_name=resp['name']['givenName'],
+      last_name=resp['name']['familyName'],
+      roles=roles,
+      attributes=attributes,
+    )
 
   def get_oid(self, username):
     LOG.debug('Invoke get_oid')
@@ -110,7 +122,7 @@ class GafeDataSource(ExternalDataSource):
     Generate MPASS OID for user from the username
     Not needed if authentication source returns proper oid
     """
-    return 'MPASSOID.{user_hash}'.format(user_hash=hashlib.sha1('gafe' + username).hexdigest())[:30]
+    return self.make_oid('gafe', username)
 
   def get_user_data(self, request):
     LOG.debug('Invoke get_user_data')
@@ -24,17 +24,25 @@
 # THE SOFTWARE.
 
 
+import collections
 import hashlib
 import logging
 import string
 
 import ldap
+from ldap.dn import escape_dn_chars
+from ldap.filter import escape_filter_chars
 
+from authdata import timing
 from authdata.datasources.base import ExternalDataSource
+from authdata.datasources.base import UserRecord
 
 LOG = logging.getLogger(__name__)
 
 
+ListingQuery = collections.namedtuple('ListingQuery', ['base_dn', 'scope', 'filterstr'])
+
+
 class LDAPDataSource(ExternalDataSource):
   """
   Abstract base class for implementing external LDAP data sources.
@@ -69,6 +77,32 @@ class LDAPDataSource(ExternalDataSource):
 
   external_source = 'ldap'
 
+  # Filter terms matching every user in a listing query. Indexed attributes
+  # should come first so the server can narrow the candidate set with them.
+  listing_filter_terms = (
+    u'(objectClass=inetOrgPerson)',
+  )
+
+  # Listing GET parameters which are matched against an LDAP attribute, eg.
+  # {'group': 'departmentNumber'}
+  listing_filter_attributes = {
+  }
+
+  # Listing GET parameters which name an organizational unit directly below
+  # ldap_base_dn, eg. {'school': 'ou'}. The unit is then used as the search
+  # base instead of filtering the whole tree.
+  listing_scope_attributes = {
+  }
+
+  # Scope of listing queries below the search base. Sources with all users
+  # directly below the base should use ldap.SCOPE_ONELEVEL, a subtree search
+  # is only needed when the users are in units of their own.
+  listing_scope = ldap.SCOPE_SUBTREE
+
+  # Compiled listing queries, shared by all instances
+  _listing_query_cache = {}
+  listing_query_cache_size = 1024
+
   def __init__(self, host, username, password, *args, **kwargs):
     self.ldap_server = host
     self.ldap_username = username
@@ -93,19 +127,79 @@ class LDAPDataSource(ExternalDataSource):
     """
     # TODO: error handling
     ldap.set_option(ldap.OPT_X_TLS_REQUIRE_CERT, ldap.OPT_X_TLS_NEVER)
-    self.connection = ldap.initialize(self.ldap_server)
-    self.connection.set_option(ldap.OPT_REFERRALS, 0)
-    self.connection.simple_bind_s(self.ldap_username, self.ldap_password)
+    with self.timed():
+      self.connection = ldap.initialize(self.ldap_server)
+      self.connection.set_option(ldap.OPT_REFERRALS, 0)
+      self.connection.simple_bind_s(self.ldap_username, self.ldap_password)
 
-  def query(self, query_filter):
+  def query(self, query_filter, base_dn=None, scope=None):
     """
     query ldap with the provided filter string
+
+    base_dn and scope default to ldap_base_dn and a subtree search
     """
     if not self.connection:
       self.connect()
+    if base_dn is None:
+      base_dn = self.ldap_base_dn
+    if scope is None:
+      scope = ldap.SCOPE_SUBTREE
     # TODO: LDAP error handling
     # TODO: must get exactly one result
-    return self.connection.search_s(self.ldap_base_dn, filterstr=query_filter, scope=ldap.SCOPE_SUBTREE)
+    with self.timed():
+      return self.connection.search_s(base_dn, filterstr=query_filter, scope=scope)
+
+  def get_listing_query(self, params):
+    """
+    Compile user listing parameters to a ListingQuery.
+
+    params: GET parameters of the listing request
+
+    Parameter values are escaped. Parameters without a value are ignored.
+    Compiled queries are cached per data source class and base dn.
+    """
+    scoped = tuple((p, params.get(p) or u'') for p in sorted(self.listing_scope_attributes))
+    filtered = tuple((p, params.get(p) or u'') for p in sorted(self.listing_filter_attributes))
+    key = (self.__class__, self.ldap_base_dn, self.listing_scope, scoped, filtered)
+    try:
+      listing_query = self._listing_query_cache[key]
+    except KeyError:
+      timing.cache('ldap_listing_query', False)
+    else:
+      timing.cache('ldap_listing_query', True)
+      return listing_query
+
+    base_dn = self.ldap_base_dn
+    for param, value in scoped:
+      if value:
+        rdn = u'%s=%s' % (self.listing_scope_attributes[param], escape_dn_chars(value))
+        base_dn = u'%s,%s' % (rdn, base_dn)
+    terms = list(self.listing_filter_terms)
+    for param, value in filtered:
+      if value:
+        terms.append(u'(%s=%s)' % (self.listing_filter_attributes[param], escape_filter_chars(value)))
+    if len(terms) == 1:
+      filterstr = terms[0]
+    else:
+      filterstr = u'(&%s)' % u''.join(terms)
+    listing_query = ListingQuery(base_dn, self.listing_scope, filterstr)
+
+    if len(self._listing_query_cache) >= self.listing_query_cache_size:
+      self._listing_query_cache.clear()
+    self._listing_query_cache[key] = listing_query
+    return listing_query
+
+  def query_listing(self, params):
+    """
+    Query ldap for a user listing filtered by the given GET parameters
+    """
+    listing_query = self.get_listing_query(params)
+    if LOG.isEnabledFor(logging.DEBUG):
+      LOG.debug('LDAP listing query', extra={'data': {
+        'base_dn': repr(listing_query.base_dn),
+        'filterstr': repr(listing_query.filterstr),
+      }})
+    return self.query(listing_query.filterstr, base_dn=listing_query.base_dn, scope=listing_query.scope)
 
 
 class TestLDAPDataSource(LDAPDataSource):
@@ -137,6 +231,18 @@ class TestLDAPDataSource(LDAPDataSource):
 
   external_source = 'ldap_test'
 
+  listing_filter_attributes = {
+    'group': 'departmentNumber',
+  }
+
+  listing_scope_attributes = {
+    'school': 'ou',
+  }
+
+  # Users are in units of their role below ou=People of the school, so the
+  # search covers the subtree of the school
+  listing_scope = ldap.SCOPE_SUBTREE
+
   municipality_id_map = {
     'KuntaYksi': '1234567-8'
   }
@@ -180,18 +286,14 @@ class TestLDAPDataSource(LDAPDataSource):
     There is no OID information in this external source. Generate fake OID
     from username.
     """
-    # TODO: OID is cut to 30 chars due to django username limitation
-    return 'MPASSOID.{user_hash}'.format(user_hash=hashlib.sha1('ldap_test' + username).hexdigest())[:30]
+    return self.make_oid('ldap_test', username)
 
   def normalizeString(self, string):
     return string.decode('unicode_escape').encode('iso8859-1').decode('utf8')
 
   def get_data(self, external_id):
     try:
-      import time
-      startstamp = int(time.time() * 1000)
-      query_result = self.query(self.ldap_filter.format(value=external_id))[0]
-      LOG.debug("LDAP query took " + str(int(time.time() * 1000) - startstamp) + " ms")
+      query_result = self.query(self.ldap_filter.format(value=escape_filter_chars(u'%s' % external_id)))[0]
     except IndexError:
       return None
     dn_parts = query_result[0].split(',')
@@ -214,23 +316,19 @@ class TestLDAPDataSource(LDAPDataSource):
     # Provision
     self.provision_user(oid, external_id)
 
-    return {
-      'username': oid,
-      'first_name': first_name,
-      'last_name': last_name,
-      'roles': roles,
-      'attributes': attributes
-    }
+    return UserRecord(
+      username=oid,
+      first_name=first_name,
+      last_name=last_name,
+      roles=roles,
+      attributes=attributes,
+    )
 
   def get_user_data(self, request):
-    ldap_filter = "objectclass=inetOrgPerson"
-    query_base = self.ldap_base_dn
-    if 'school' in request.GET:
-      self.ldap_base_dn = 'ou=%s,%s' % (request.GET['school'], query_base)
-    if 'group' in request.GET and request.GET['group'] != '':
-      ldap_filter = '(&(departmentNumber=%s)(%s))' % (request.GET['group'], ldap_filter)
-    query_results = self.query(ldap_filter)
-    response = []
+    return self.user_listing(self.iter_user_data(request))
+
+  def iter_user_data(self, request):
+    query_results = self.query_listing(request.GET)
 
     for result in query_results:
       dn_parts = result[0].split(',')
@@ -249,24 +347,18 @@ class TestLDAPDataSource(LDAPDataSource):
         'municipality': self.get_municipality_id(dn_parts[4].strip("ou=")),
         'group': result[1].get('departmentNumber', [''])[0]
       }]
-      response.append({
-        'username': oid,
-        'first_name': first_name,
-        'last_name': last_name,
-        'roles': roles,
-        'attributes': attributes
-      })
 
       # Provision
       self.provision_user(oid, external_id)
 
+      yield UserRecord(
+        username=oid,
+        first_name=first_name,
+        last_name=last_name,
+        roles=roles,
+        attributes=attributes,
+      )
     # TODO: support actual paging via SimplePagedResultsControl
-    return {
-      'count': len(response),
-      'next': None,
-      'previous': None,
-      'results': response,
-    }
 
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
@@ -23,12 +23,12 @@
 # THE SOFTWARE.
 
 import logging
-import hashlib
 import requests
 
 from django.conf import settings
 
 from authdata.datasources.base import ExternalDataSource
+from authdata.datasources.base import UserRecord
 
 LOG = logging.getLogger(__name__)
 
@@ -41,13 +41,16 @@ class OpinsysDataSource(ExternalDataSource):
   This is a base class for all external data sources
   """
 
-  def __init__(self, clientId, clientKey, tenantId, municipality, *args, **kwargs):
+  def __init__(self, clientId, clientKey, tenantId, municipality, api_host='api.opinsys.fi', scheme='https', *args, **kwargs):
     LOG.debug('Invoke init')
     self.request = None
     self.tenantId = tenantId
     self.clientId = clientId
     self.clientKey = clientKey
     self.municipality = municipality
+    # Other values are only useful against authdata.datasources.fakes
+    self.api_host = api_host
+    self.scheme = scheme
 
   def _get_roles(self, data):
     out = {}
@@ -67,7 +70,7 @@ class OpinsysDataSource(ExternalDataSource):
       out['role'] = 'oppilas'
     elif roleString.lower() == 'teacher':
       out['role'] = 'opettaja'
-    yield out
+    return [out]
 
   def get_oid(self, username):
     LOG.debug('Invoke get_oid')
@@ -76,7 +79,7 @@ class OpinsysDataSource(ExternalDataSource):
 
     Not needed if authentication source returns proper oid
     """
-    return 'MPASSOID.{user_hash}'.format(user_hash=hashlib.sha1('opinsys'+self.tenantId + username).hexdigest())[:30]
+    return self.make_oid('opinsys' + self.tenantId, username)
 
   def get_data(self, external_id):
     import httplib, urllib, base64, os, json, pprint, time
@@ -84,11 +87,15 @@ class OpinsysDataSource(ExternalDataSource):
     auth = base64.encodestring('%s:%s' % (self.clientId, self.clientKey)).replace('\n', '')
     headers = {"Host": self.tenantId, "Authorization": "Basic %s" % auth }
     try:
-        conn = httplib.HTTPSConnection('api.opinsys.fi')
-        conn.request("GET", "/v3/users/_by_id/" + external_id, "", headers)
-        response = conn.getresponse()
-        data = json.load(response)
-        conn.close()
+        if self.scheme == 'http':
+          conn = httplib.HTTPConnection(self.api_host)
+        else:
+          conn = httplib.HTTPSConnection(self.api_host)
+        with self.timed():
+          conn.request("GET", "/v3/users/_by_id/" + external_id, "", headers)
+          response = conn.getresponse()
+          data = json.load(response)
+          conn.close()
     except Exception as e:
         print(e)
 
@@ -99,13 +106,13 @@ class OpinsysDataSource(ExternalDataSource):
     oid = self.get_oid(external_id)
     self.provision_user(oid, external_id)
 
-    return {
-      'username': oid,
-      'first_name': data['first_name'],
-      'last_name': data['last_name'],
-      'roles': roles,
-      'attributes': attributes
-    }
+    return UserRecord(
+      username=oid,
+      first_name=data['first_name'],
+      last_name=data['last_name'],
+      roles=roles,
+      attributes=attributes,
+    )
 
   def get_user_data(self, request):
     LOG.debug('Invoke get_user_data')
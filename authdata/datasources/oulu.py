@@ -29,11 +29,12 @@ External data source implementations
 """
 
 import base64
-import hashlib
 import logging
 
 import ldap
+from ldap.filter import escape_filter_chars
 
+from authdata.datasources.base import UserRecord
 from authdata.datasources.ldap_base import LDAPDataSource
 
 LOG = logging.getLogger(__name__)
@@ -50,6 +51,22 @@ class OuluLDAPDataSource(LDAPDataSource):
 
   external_source = 'ad_oulu'
 
+  # objectCategory is indexed in AD, objectClass is not
+  listing_filter_terms = (
+    u'(objectCategory=person)',
+    u'(objectClass=user)',
+  )
+
+  listing_filter_attributes = {
+    'school': 'physicalDeliveryOfficeName',
+    'group': 'department',
+  }
+
+  # School and group are attributes of the accounts rather than units, so
+  # the base can not be narrowed. Configure base_dn as the unit holding the
+  # user accounts; the subtree search also finds accounts in its sub-units.
+  listing_scope = ldap.SCOPE_SUBTREE
+
   municipality_id_map = {
     'Oulu': '0187690-1'
   }
@@ -121,21 +138,21 @@ class OuluLDAPDataSource(LDAPDataSource):
     Initialize a secure connection the the LDAP server.
     """
     ldap.set_option(ldap.OPT_X_TLS_CACERTFILE, 'oulu_certificate')
-    self.connection = ldap.initialize(self.ldap_server)
-    self.connection.set_option(ldap.OPT_REFERRALS, 0)
-    self.connection.set_option(ldap.OPT_PROTOCOL_VERSION, 3)
-    self.connection.set_option(ldap.OPT_X_TLS_DEMAND, True)
-    self.connection.set_option(ldap.OPT_X_TLS, ldap.OPT_X_TLS_DEMAND)
-    self.connection.start_tls_s()
-    self.connection.simple_bind_s(self.ldap_username, self.ldap_password)
+    with self.timed():
+      self.connection = ldap.initialize(self.ldap_server)
+      self.connection.set_option(ldap.OPT_REFERRALS, 0)
+      self.connection.set_option(ldap.OPT_PROTOCOL_VERSION, 3)
+      self.connection.set_option(ldap.OPT_X_TLS_DEMAND, True)
+      self.connection.set_option(ldap.OPT_X_TLS, ldap.OPT_X_TLS_DEMAND)
+      self.connection.start_tls_s()
+      self.connection.simple_bind_s(self.ldap_username, self.ldap_password)
 
   def get_oid(self, username):
     """
     There is no OID information in this external source. Generate fake OID
     from username.
     """
-    # TODO: OID is cut to 30 chars due to django username limitation
-    return 'MPASSOID.{user_hash}'.format(user_hash=hashlib.sha1('ad_oulu' + username).hexdigest())[:30]
+    return self.make_oid('ad_oulu', username)
 
   def get_external_id(self, query_result):
     # TODO: Check if this works
@@ -171,7 +188,7 @@ class OuluLDAPDataSource(LDAPDataSource):
       # search term is an objectGUID. it needs to be decoded to a byte string
       # for querying ldap
       object_guid = base64.b64decode(external_id)
-      query_result = self.query(self.ldap_filter.format(value=object_guid))[0]
+      query_result = self.query(self.ldap_filter.format(value=escape_filter_chars(object_guid, escape_mode=2)))[0]
     except IndexError:
       return None
     username = self.get_username(query_result)
@@ -189,22 +206,19 @@ class OuluLDAPDataSource(LDAPDataSource):
     # Provision
     self.provision_user(oid, external_id)
 
-    return {
-      'username': oid,
-      'first_name': first_name,
-      'last_name': last_name,
-      'roles': roles,
-      'attributes': attributes
-    }
+    return UserRecord(
+      username=oid,
+      first_name=first_name,
+      last_name=last_name,
+      roles=roles,
+      attributes=attributes,
+    )
 
   def get_user_data(self, request):
-    ldap_filter = u'(&(objectCategory=person)(objectClass=user))'
-    if 'school' in request.GET:
-      ldap_filter = u'(&(physicalDeliveryOfficeName={school}){filter_base})'.format(school=request.GET['school'], filter_base=ldap_filter)
-    if 'group' in request.GET and request.GET['group'] != '':
-      ldap_filter = u'(&(department={group}){filter_base})'.format(group=request.GET['group'], filter_base=ldap_filter)
-    query_results = self.query(ldap_filter)
-    response = []
+    return self.user_listing(self.iter_user_data(request))
+
+  def iter_user_data(self, request):
+    query_results = self.query_listing(request.GET)
 
     for query_result in query_results:
       username = self.get_username(query_result)
@@ -221,25 +235,18 @@ class OuluLDAPDataSource(LDAPDataSource):
         'municipality': self.get_municipality_id(self.get_municipality()),
         'group': self.get_group(query_result),
       }]
-      response.append({
-        'username': oid,
-        'first_name': first_name,
-        'last_name': last_name,
-        'roles': roles,
-        'attributes': attributes
-      })
 
       # Provision
       self.provision_user(oid, external_id)
 
+      yield UserRecord(
+        username=oid,
+        first_name=first_name,
+        last_name=last_name,
+        roles=roles,
+        attributes=attributes,
+      )
     # TODO: support actual paging via SimplePagedResultsControl
 
-    return {
-      'count': len(response),
-      'next': None,
-      'previous': None,
-      'results': response,
-    }
-
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
@@ -31,6 +31,7 @@ import random
 from django.conf import settings
 
 from authdata.datasources.base import ExternalDataSource
+from authdata.datasources.base import UserRecord
 
 LOG = logging.getLogger(__name__)
 
@@ -43,11 +44,13 @@ class WilmaDataSource(ExternalDataSource):
   This is a base class for all external data sources
   """
 
-  def __init__(self, hostname, sharedsecret, municipality, *args, **kwargs):
+  def __init__(self, hostname, sharedsecret, municipality, scheme='https', *args, **kwargs):
     LOG.debug('Invoke init')
     self.hostname = hostname
     self.sharedsecret = sharedsecret
     self.municipality = municipality
+    # http is only useful against authdata.datasources.fakes
+    self.scheme = scheme
 
   def _get_roles(self, data):
     out = {}
@@ -65,7 +68,7 @@ class WilmaDataSource(ExternalDataSource):
         elif roleString.lower() == 'teacher':
           out['role'] = 'opettaja'
     out['municipality'] = self.municipality
-    yield out
+    return [out]
 
   def get_oid(self, username):
     LOG.debug('Invoke get_oid')
@@ -74,7 +77,7 @@ class WilmaDataSource(ExternalDataSource):
 
     Not needed if authentication source returns proper oid
     """
-    return 'MPASSOID.{user_hash}'.format(user_hash=hashlib.sha1('wilma'+self.hostname + username).hexdigest())[:30]
+    return self.make_oid('wilma' + self.hostname, username)
 
   def nonce_generator(self, size=16, chars=string.ascii_uppercase + string.ascii_lowercase + string.digits):
     return ''.join(random.choice(chars) for _ in range(size))
@@ -83,15 +86,19 @@ class WilmaDataSource(ExternalDataSource):
     import httplib, urllib, base64, os, json, pprint, time, hmac
     LOG.debug('Invoke get_data')
     try:
-        conn = httplib.HTTPSConnection(self.hostname)
+        if self.scheme == 'http':
+          conn = httplib.HTTPConnection(self.hostname)
+        else:
+          conn = httplib.HTTPSConnection(self.hostname)
         basequery = "/external/mpass?username=" + external_id + "&nonce=" + self.nonce_generator(16)
-        calcinput = "https://" + self.hostname + basequery
+        calcinput = self.scheme + "://" + self.hostname + basequery
         checksum = hmac.new(self.sharedsecret, calcinput, digestmod=hashlib.sha256).hexdigest()
-        LOG.debug("Using the following call " + basequery + "&h=" + checksum)
-        conn.request("GET", basequery + "&h=" + checksum)
-        response = conn.getresponse()
-        data = json.load(response)
-        conn.close()
+        LOG.debug("Using the following call %s&h=%s", basequery, checksum)
+        with self.timed():
+          conn.request("GET", basequery + "&h=" + checksum)
+          response = conn.getresponse()
+          data = json.load(response)
+          conn.close()
     except Exception as e:
         print(e)
 
@@ -103,13 +110,13 @@ class WilmaDataSource(ExternalDataSource):
     oid = self.get_oid(external_id)
     self.provision_user(oid, external_id)
 
-    return {
-      'username': oid,
-      'first_name': data[0]['first_name'],
-      'last_name': data[0]['last_name'],
-      'roles': roles,
-      'attributes': attributes
-    }
+    return UserRecord(
+      username=oid,
+      first_name=data[0]['first_name'],
+      last_name=data[0]['last_name'],
+      roles=roles,
+      attributes=attributes,
+    )
 
   def get_user_data(self, request):
     LOG.debug('Invoke get_user_data')
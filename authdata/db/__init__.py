@@ -0,0 +1,45 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Database backends.
+
+``authdata.db.postgresql`` is the PostgreSQL backend of Django with
+connection health checks and an optional connection pool. It is configured
+with these keys of a DATABASES entry in addition to Django's own:
+
+CONN_HEALTH_CHECKS
+  Check that a persistent connection (CONN_MAX_AGE) still works the first
+  time it is used in a request and reconnect if it does not, instead of
+  failing the request. Same as the setting of newer Django versions.
+
+POOL
+  Dict with MAX_SIZE, MAX_IDLE and TIMEOUT. Connections closed at the end of
+  a request are returned to a pool shared by the threads of the process and
+  reused by the next request. Meant for threaded gunicorn workers with
+  CONN_MAX_AGE 0; a request waits TIMEOUT seconds for a free connection
+  when MAX_SIZE connections are in use.
+"""
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
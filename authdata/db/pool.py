@@ -0,0 +1,112 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+A thread safe pool of DB-API connections, see authdata.db
+"""
+
+import time
+import threading
+from django.db.utils import OperationalError
+from authdata import metrics
+
+
+class PoolTimeout(OperationalError):
+  pass
+
+
+class ConnectionPool(object):
+  """
+  At most ``max_size`` connections are handed out at a time, get() waits
+  ``timeout`` seconds for one to be returned. Up to ``max_idle`` returned
+  connections are kept open for reuse, others are closed. Pools with a
+  ``name`` export their usage in authdata.metrics with it as the alias.
+  """
+
+  def __init__(self, connect, max_size=10, max_idle=None, timeout=10, name=None):
+    self.connect = connect
+    self.name = name
+    self.max_size = max_size
+    self.max_idle = max_size if max_idle is None else max_idle
+    self.timeout = timeout
+    self.idle = []
+    self.in_use = 0
+    self.condition = threading.Condition()
+    self.observe()
+
+  def observe(self):
+    if self.name is not None:
+      metrics.observe_pool(self.name, self.max_size, self.in_use, len(self.idle))
+
+  def get(self):
+    deadline = time.time() + self.timeout
+    with self.condition:
+      while self.in_use >= self.max_size:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          raise PoolTimeout('No free database connection in %s seconds, %d in use' % (self.timeout, self.in_use))
+        self.condition.wait(remaining)
+      self.in_use += 1
+      connection = self.idle.pop() if self.idle else None
+      self.observe()
+    if connection is not None:
+      return connection
+    try:
+      return self.connect()
+    except Exception:
+      self.release()
+      raise
+
+  def put(self, connection, discard=False):
+    """
+    Return a connection. Discarded connections are closed.
+    """
+    with self.condition:
+      keep = not discard and len(self.idle) < self.max_idle
+      if keep:
+        self.idle.append(connection)
+    if not keep:
+      try:
+        connection.close()
+      except Exception:
+        pass
+    self.release()
+
+  def release(self):
+    with self.condition:
+      self.in_use -= 1
+      self.observe()
+      self.condition.notify()
+
+  def close(self):
+    """
+    Close the idle connections
+    """
+    with self.condition:
+      idle, self.idle = self.idle, []
+      self.observe()
+    for connection in idle:
+      connection.close()
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,121 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+PostgreSQL backend with connection health checks and an optional pool, see
+authdata.db
+"""
+
+import os
+import threading
+import psycopg2
+from psycopg2 import extensions
+from django.db.backends.postgresql import base
+from authdata.db.pool import ConnectionPool
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict, conn_params):
+  """
+  Pool of the process for these connection parameters. Pools are not
+  inherited by forked worker processes.
+  """
+  key = (os.getpid(), tuple(sorted(conn_params.items())))
+  with _pools_lock:
+    if key not in _pools:
+      options = settings_dict['POOL']
+      _pools[key] = ConnectionPool(lambda: psycopg2.connect(**conn_params),
+          max_size=options.get('MAX_SIZE', 10),
+          max_idle=options.get('MAX_IDLE'),
+          timeout=options.get('TIMEOUT', 10),
+          name=alias)
+    return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+  health_check_done = False
+
+  def get_new_connection(self, conn_params):
+    if not self.settings_dict.get('POOL'):
+      return super(DatabaseWrapper, self).get_new_connection(conn_params)
+    pool = get_pool(self.alias, self.settings_dict, conn_params)
+    while True:
+      connection = pool.get()
+      if not connection.closed and (not self.settings_dict.get('CONN_HEALTH_CHECKS') or self._usable(connection)):
+        break
+      pool.put(connection, discard=True)
+    # As in Django's get_new_connection
+    options = self.settings_dict['OPTIONS']
+    self.isolation_level = options.get('isolation_level', connection.isolation_level)
+    if self.isolation_level != connection.isolation_level:
+      connection.set_session(isolation_level=self.isolation_level)
+    return connection
+
+  def _usable(self, connection):
+    try:
+      with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+      if not connection.autocommit:
+        connection.rollback()
+    except psycopg2.Error:
+      return False
+    return True
+
+  def _close(self):
+    if not self.settings_dict.get('POOL') or self.connection is None:
+      return super(DatabaseWrapper, self)._close()
+    pool = get_pool(self.alias, self.settings_dict, self.get_connection_params())
+    connection = self.connection
+    try:
+      if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+    except psycopg2.Error:
+      pool.put(connection, discard=True)
+    else:
+      pool.put(connection, discard=bool(connection.closed))
+
+  def connect(self):
+    super(DatabaseWrapper, self).connect()
+    self.health_check_done = True
+
+  def ensure_connection(self):
+    if (self.connection is not None and not self.health_check_done and
+        not self.in_atomic_block and self.settings_dict.get('CONN_HEALTH_CHECKS')):
+      # A persistent connection may have been closed by the server
+      # or a proxy since the previous request
+      self.health_check_done = True
+      if not self.is_usable():
+        self.close()
+    super(DatabaseWrapper, self).ensure_connection()
+
+  def close_if_unusable_or_obsolete(self):
+    # Called at the start and the end of every request
+    super(DatabaseWrapper, self).close_if_unusable_or_obsolete()
+    self.health_check_done = False
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
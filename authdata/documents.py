@@ -0,0 +1,254 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Denormalized user documents.
+
+With settings.AUTHDATA_USER_DOCUMENTS on, /api/1/query/<username> is served
+from a single UserDocument row and user listings read one document per user
+instead of joining attributes, attendances, schools, municipalities and
+roles. Documents are refreshed by the signal handlers of this module when
+the user, its attributes or attendances change. Writes inside a
+transaction refresh the documents of the affected users once, when the
+transaction commits.
+
+Changes to attributes, roles, schools, municipalities and sources can
+affect any number of users. Their documents are deleted instead, in a
+single statement, and the users are served from the tables until
+``manage.py rebuild_user_documents --missing`` builds the documents again
+in batches. Run it periodically.
+
+Bulk inserts and updates do not send signals; run
+``manage.py rebuild_user_documents`` after them and before turning the
+setting on. Users without a document are served from the tables.
+"""
+
+import json
+import threading
+from django.conf import settings
+from django.db import connection
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.utils import timezone
+from authdata.models import User, UserDocument, UserAttribute, Attribute, Attendance, Role, School, Municipality, Source
+
+
+BATCH_SIZE = 500
+
+_local = threading.local()
+
+
+def enabled():
+  return getattr(settings, 'AUTHDATA_USER_DOCUMENTS', False)
+
+
+def build(user):
+  """
+  Document data of a user from prefetch_user_data()
+  """
+  from authdata.serializers import active_attributes
+  return {
+    'username': user.username,
+    'first_name': user.first_name,
+    'last_name': user.last_name,
+    'external_source': user.external_source,
+    'external_id': user.external_id,
+    'roles': [{
+      'school': a.school.school_id,
+      'group': a.group,
+      'role': a.role.name,
+      'municipality': a.school.municipality.municipality_id,
+    } for a in user.attendances.all()],
+    'attributes': [{
+      'name': a.attribute.name,
+      'value': a.value,
+      'source': a.data_source.name,
+    } for a in active_attributes(user)],
+  }
+
+
+def refresh(user_ids):
+  """
+  Rebuild the documents of the given users. Returns the number of
+  documents written.
+  """
+  from authdata.serializers import prefetch_user_data
+  user_ids = list(user_ids)
+  count = 0
+  for i in xrange(0, len(user_ids), BATCH_SIZE):
+    batch = user_ids[i:i + BATCH_SIZE]
+    with transaction.atomic():
+      # Concurrent refreshes of the same users wait for each other instead
+      # of inserting the same documents
+      batch = list(User.objects.filter(id__in=batch).order_by('id')
+          .select_for_update().values_list('id', flat=True))
+      now = timezone.now()
+      users = prefetch_user_data(User.objects.filter(id__in=batch))
+      docs = [UserDocument(user_id=user.id, username=user.username, modified=now,
+          data=json.dumps(build(user), separators=(',', ':'))) for user in users]
+      UserDocument.objects.filter(user_id__in=batch).delete()
+      UserDocument.objects.bulk_create(docs)
+    count += len(docs)
+  return count
+
+
+def rebuild(progress=None, missing=False):
+  """
+  Rebuild the documents of all users, or only of the users without one
+  """
+  users = User.objects.order_by('id')
+  if missing:
+    users = users.filter(document__isnull=True)
+  ids = list(users.values_list('id', flat=True))
+  count = 0
+  for i in xrange(0, len(ids), BATCH_SIZE):
+    count += refresh(ids[i:i + BATCH_SIZE])
+    if progress:
+      progress(count, len(ids))
+  UserDocument.objects.exclude(user_id__in=User.objects.values('id')).delete()
+  return count
+
+
+def schedule(user_ids):
+  """
+  Refresh the documents of the given users now, or when the current
+  transaction commits
+  """
+  if not enabled():
+    return
+  if not connection.in_atomic_block:
+    refresh(user_ids)
+    return
+  if getattr(_local, 'pending', None) is None:
+    _local.pending = set()
+  _local.pending.update(user_ids)
+  # A rolled back transaction or savepoint drops its callbacks, so one is
+  # registered for every change. The first to run refreshes the users.
+  transaction.on_commit(_flush)
+
+
+def invalidate(user_ids):
+  """
+  Delete the documents of the given users, a list or a queryset of ids.
+  They are built again by rebuild(missing=True).
+  """
+  if enabled():
+    UserDocument.objects.filter(user_id__in=user_ids).delete()
+
+
+def _flush():
+  pending, _local.pending = getattr(_local, 'pending', None), None
+  if pending:
+    refresh(pending)
+
+
+def query_data(data):
+  """
+  The /api/1/query response of a document
+  """
+  return {
+    'username': data['username'],
+    'first_name': data['first_name'],
+    'last_name': data['last_name'],
+    'roles': data['roles'],
+    'attributes': [{'name': a['name'], 'value': a['value']} for a in data['attributes']],
+  }
+
+
+def list_data(data, source):
+  """
+  The user listing entry of a document, with the attributes of ``source``
+  """
+  return {
+    'username': data['username'],
+    'first_name': data['first_name'],
+    'last_name': data['last_name'],
+    'external_id': data['external_id'],
+    'roles': data['roles'],
+    'attributes': [{'name': a['name'], 'value': a['value']} for a in data['attributes'] if a['source'] == source],
+  }
+
+
+def query_document(username):
+  """
+  Query response of a local user or None if the user has no document or
+  the data must be fetched from an external source
+  """
+  rows = UserDocument.objects.filter(username=username).values_list('data', flat=True)[:1]
+  if not rows:
+    return None
+  data = json.loads(rows[0])
+  if data['external_source'] and data['external_id']:
+    return None
+  return query_data(data)
+
+
+def list_documents(rows, source):
+  """
+  Listing entries of user_list_values() rows. Users without a document are
+  read from the tables.
+  """
+  from authdata.serializers import user_list_data
+  rows = list(rows)
+  documents = dict(UserDocument.objects.filter(user_id__in=[row['id'] for row in rows]).values_list('user_id', 'data'))
+  missing = [row for row in rows if row['id'] not in documents]
+  from_tables = iter(user_list_data(missing, source) if missing else ())
+  return [list_data(json.loads(documents[row['id']]), source) if row['id'] in documents else next(from_tables)
+      for row in rows]
+
+
+def _user_changed(sender, instance, raw=False, **kwargs):
+  if not raw:
+    schedule([instance.pk])
+
+
+def _related_changed(sender, instance, raw=False, **kwargs):
+  if not raw:
+    schedule([instance.user_id])
+
+
+def _users_of(queryset):
+  def handler(sender, instance, raw=False, **kwargs):
+    if not raw:
+      invalidate(queryset(instance).values('user_id'))
+  return handler
+
+
+_attribute_changed = _users_of(lambda obj: UserAttribute.objects.filter(attribute=obj))
+_source_changed = _users_of(lambda obj: UserAttribute.objects.filter(data_source=obj))
+_role_changed = _users_of(lambda obj: Attendance.objects.filter(role=obj))
+_school_changed = _users_of(lambda obj: Attendance.objects.filter(school=obj))
+_municipality_changed = _users_of(lambda obj: Attendance.objects.filter(school__municipality=obj))
+
+post_save.connect(_user_changed, sender=User)
+for model in (UserAttribute, Attendance):
+  post_save.connect(_related_changed, sender=model)
+  post_delete.connect(_related_changed, sender=model)
+post_save.connect(_attribute_changed, sender=Attribute)
+post_save.connect(_source_changed, sender=Source)
+post_save.connect(_role_changed, sender=Role)
+post_save.connect(_school_changed, sender=School)
+post_save.connect(_municipality_changed, sender=Municipality)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
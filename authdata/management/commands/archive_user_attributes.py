@@ -0,0 +1,51 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+from django.core.management.base import BaseCommand
+from authdata import archive
+
+
+class Command(BaseCommand):
+  help = """Moves UserAttributes disabled longer than the retention to the archive.
+
+The retention is settings.AUTHDATA_ATTRIBUTE_RETENTION_DAYS unless --days
+is given. Run this periodically, e.g. nightly from cron.
+"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('--days', type=int, default=None,
+        help='Archive attributes disabled more than this many days ago')
+    parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE,
+        help='Attributes moved in one transaction')
+
+  def handle(self, *args, **options):
+    def progress(count):
+      self.stdout.write('%d archived' % count)
+    before = None
+    if options['days'] is not None:
+      before = archive.retention_cutoff(days=options['days'])
+    count = archive.archive(before, options['batch_size'], progress=progress if options['verbosity'] > 1 else None)
+    self.stdout.write('Archived %d attributes' % count)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,96 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import json
+from django.core.management.base import BaseCommand, CommandError
+from authdata import benchmark
+from authdata.testdata import TestDataGenerator
+
+
+class Command(BaseCommand):
+  help = """Runs load test scenarios against the API and prints the results as JSON.
+
+Latency percentiles, queries per request and throughput are reported for
+each scenario. Use --seed-users to first insert a data set, for example
+10000, 100000 or 1000000 users. Do not run this against a production database.
+
+For example: manage.py benchmark --seed-users 100000 --output results.json
+"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('--seed-users',
+        type=int,
+        dest='seed_users',
+        default=0,
+        help='Insert this many users before running the scenarios')
+    parser.add_argument('--seed',
+        type=int,
+        dest='seed',
+        default=None,
+        help='Random seed for the data set and the sampled requests')
+    parser.add_argument('--requests',
+        type=int,
+        dest='requests',
+        default=100,
+        help='Number of requests in each query scenario')
+    parser.add_argument('--list-requests',
+        type=int,
+        dest='list_requests',
+        default=10,
+        help='Number of requests in each user listing scenario')
+    parser.add_argument('--csv-rows',
+        type=int,
+        dest='csv_rows',
+        default=1000,
+        help='Number of rows in the csv_import scenario')
+    parser.add_argument('--scenario',
+        action='append',
+        dest='scenarios',
+        choices=benchmark.SCENARIOS,
+        help='Scenario to run, can be given multiple times. Default is all.')
+    parser.add_argument('--output',
+        dest='output',
+        default=None,
+        help='Write the results to this file instead of stdout')
+
+  def handle(self, *args, **options):
+    if options['seed_users'] < 0:
+      raise CommandError('--seed-users must not be negative')
+    if options['seed_users']:
+      generator = TestDataGenerator(users=options['seed_users'], seed=options['seed'] or 0)
+      generator.generate()
+    bench = benchmark.Benchmark(requests=options['requests'],
+        list_requests=options['list_requests'],
+        csv_rows=options['csv_rows'],
+        seed=options['seed'])
+    results = bench.run(options['scenarios'] or benchmark.SCENARIOS)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if options['output']:
+      with open(options['output'], 'w') as f:
+        f.write(output + '\n')
+    else:
+      self.stdout.write(output)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
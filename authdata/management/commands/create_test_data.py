@@ -23,41 +23,83 @@
 # THE SOFTWARE.
 #
 
-import sys
-import random
-from django.core.management.base import BaseCommand
-from authdata.models import User, Role, Attribute, UserAttribute, Municipality, School, Attendance, Source
-from authdata.tests import factories as f
+from django.core.management.base import BaseCommand, CommandError
+from authdata.testdata import TestDataGenerator
 
 
 class Command(BaseCommand):
   help = """
   Creates a set of test data:
 
-  * 10000 users, random-generated username in OID format
+  * 10000 users, username in OID format
   * 10 municipalities
   * 100 schools
   * either "teacher" or "student" role in municipality
   * varying number (1-10) of groups for each user
+
+  The sizes can be changed with the options. Same --seed produces the same data.
   """
 
+  def add_arguments(self, parser):
+    parser.add_argument('--users',
+        type=int,
+        dest='users',
+        default=10000,
+        help='Number of users')
+    parser.add_argument('--municipalities',
+        type=int,
+        dest='municipalities',
+        default=10,
+        help='Number of municipalities')
+    parser.add_argument('--schools',
+        type=int,
+        dest='schools',
+        default=10,
+        help='Number of schools in each municipality')
+    parser.add_argument('--attributes',
+        type=int,
+        dest='attributes',
+        default=10,
+        help='Number of attributes for each user')
+    parser.add_argument('--max-attendances',
+        type=int,
+        dest='max_attendances',
+        default=10,
+        help='Maximum number of attendances for each user')
+    parser.add_argument('--seed',
+        type=int,
+        dest='seed',
+        default=0,
+        help='Random seed')
+    parser.add_argument('--batch-size',
+        type=int,
+        dest='batch_size',
+        default=5000,
+        help='Number of users written in one batch')
+    parser.add_argument('--no-copy',
+        action='store_false',
+        dest='use_copy',
+        default=True,
+        help='Use INSERT instead of COPY on PostgreSQL')
+
   def handle(self, *args, **options):
-    source = f.SourceFactory.create()
-    attributes = f.AttributeFactory.create_batch(10)
-    roles = [Role.objects.get_or_create(name='teacher'), Role.objects.get_or_create(name='student')]
-    for m in xrange(10):
-      muni = f.MunicipalityFactory.create(data_source=source)
-      schools = f.SchoolFactory.create_batch(10, municipality=muni, data_source=source)
-      for u in xrange(1000):
-        user = f.UserFactory()
-        role = random.choice(roles)
-        for attr in attributes:
-          f.UserAttributeFactory.create(user=user, attribute=attr, data_source=source)
-        for g in xrange(random.randint(1, 10)):
-          f.AttendanceFactory(user=user, school=random.choice(schools), role=role, data_source=source)
-        sys.stdout.write('.')
-        sys.stdout.flush()
-    sys.stdout.write('\n')
+    for name in ('users', 'municipalities', 'schools', 'max_attendances', 'batch_size'):
+      if options[name] < 1:
+        raise CommandError('--%s must be positive' % name.replace('_', '-'))
+    generator = TestDataGenerator(users=options['users'],
+        municipalities=options['municipalities'],
+        schools=options['schools'],
+        attributes=options['attributes'],
+        max_attendances=options['max_attendances'],
+        seed=options['seed'],
+        batch_size=options['batch_size'],
+        use_copy=options['use_copy'])
+    generator.generate(progress=self.progress)
+    self.stdout.write('')
+
+  def progress(self, count):
+    self.stdout.write('\r%d users' % count, ending='')
+    self.stdout.flush()
 
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
@@ -24,12 +24,12 @@
 
 import csv
 import codecs
-from optparse import make_option
 from collections import OrderedDict
 from django.core.management.base import BaseCommand, CommandError
 from django.db import IntegrityError
 from django.core.exceptions import ObjectDoesNotExist
-from authdata.models import User, Role, Attribute, UserAttribute, Municipality, School, Attendance, Source
+from authdata import cache
+from authdata.models import User, UserAttribute, Attendance
 
 
 class Command(BaseCommand):
@@ -40,29 +40,29 @@ You need to provide at least two arguments: the name of the input file and list
 
 For example: manage.py csv_import file.csv dreamschool,facebook,twitter,linkedin,mepin
 """
-  args = '<csvfile> <attr1,attr2...>'
-  option_list = BaseCommand.option_list + (
-    make_option('--source',
+
+  def add_arguments(self, parser):
+    parser.add_argument('args', nargs='*', metavar='<csvfile> <attr1,attr2...>')
+    parser.add_argument('--source',
         action='store',
         dest='source',
         default='manual',
-        help='Source value for this run'),
-    make_option('--municipality',
+        help='Source value for this run')
+    parser.add_argument('--municipality',
         action='store',
         dest='municipality',
         default='-',
-        help='Source value for this run'),
-    make_option('--run',
+        help='Source value for this run')
+    parser.add_argument('--run',
         action='store_true',
         dest='really_do_this',
         default=False,
-        help='Really run the command'),
-    make_option('--verbose',
+        help='Really run the command')
+    parser.add_argument('--verbose',
         action='store_true',
         dest='verbose',
         default=False,
-        help='Verbose'),
-  )
+        help='Verbose')
 
   def handle(self, *args, **options):
     if len(args) != 2:
@@ -75,12 +75,12 @@ For example: manage.py csv_import file.csv dreamschool,facebook,twitter,linkedin
     # for example: manage.py csv_import file.csv dreamschool,facebook,twitter,linkedin,mepin
     self.attribute_names = OrderedDict()
     for key in args[1].split(','):
-      self.attribute_names[key], _ = Attribute.objects.get_or_create(name=key)
-    self.source, _ = Source.objects.get_or_create(name=options['source'])
+      self.attribute_names[key], _ = cache.ATTRIBUTES.get_or_create(key)
+    self.source, _ = cache.SOURCES.get_or_create(options['source'])
     # If you need more roles, add them here
     self.role_names = OrderedDict()
     for r in ['teacher', 'student']:
-      self.role_names[r], _ = Role.objects.get_or_create(name=r)
+      self.role_names[r], _ = cache.ROLES.get_or_create(r)
 
     csv_data = csv.reader(codecs.open(args[0], 'rb'), delimiter=',', quotechar='"')
     for r in csv_data:
@@ -131,18 +131,18 @@ For example: manage.py csv_import file.csv dreamschool,facebook,twitter,linkedin
     # There can be multiple attributes with the same name and different value.
     # This is one of the reasons we have the source parameter to tell where the data came from.
     for k, v in a.iteritems():
-      UserAttribute.objects.get_or_create(user=user, attribute=self.attribute_names[k], value=v, source=self.source)
+      UserAttribute.objects.get_or_create(user=user, attribute=self.attribute_names[k], value=v, data_source=self.source)
 
     # Create Municipality
     # If you leave this empty on the CLI it will default to '-'
-    municipality, _ = Municipality.objects.get_or_create(name=self.municipality)
+    municipality, _ = cache.MUNICIPALITIES.get_or_create(self.municipality, defaults={'data_source': self.source})
 
     # Create School
     # School data is not updated after it is created. Data can be then changed in the admin.
-    school, _ = School.objects.get_or_create(school_id=d['school'], defaults={'municipality': municipality, 'name': d['school']})
+    school, _ = cache.SCHOOLS.get_or_create(d['school'], defaults={'municipality': municipality, 'name': d['school'], 'data_source': self.source})
 
     # Create Attendance object for User. There can be more than one Attendance per User.
-    Attendance.objects.get_or_create(user=user, school=school, role=self.role_names[d['role']], group=d['group'], source=self.source)
+    Attendance.objects.get_or_create(user=user, school=school, role=self.role_names[d['role']], group=d['group'], data_source=self.source)
 
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
@@ -0,0 +1,91 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import json
+from django.core.management.base import BaseCommand
+from authdata.datasources.fakes import FakeBackendServer, FakeBehaviour, FakeDataset
+
+
+class Command(BaseCommand):
+  help = """Runs fake Dreamschool, Wilma, Opinsys and Google Directory APIs for offline testing.
+
+Prints AUTH_EXTERNAL_SOURCES and AUTHDATA_DREAMSCHOOL_ORG_MAP settings for
+using the fakes and serves until interrupted. The fake LDAP sources run
+in-process, see authdata.datasources.fakes.
+
+For example: manage.py fake_backends --port 8001 --users 100000 --latency 0.05 --error-rate 0.01
+"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('--host',
+        dest='host',
+        default='127.0.0.1',
+        help='Address to listen on')
+    parser.add_argument('--port',
+        type=int,
+        dest='port',
+        default=8001,
+        help='Port to listen on')
+    parser.add_argument('--users',
+        type=int,
+        dest='users',
+        default=1000,
+        help='Number of users in the fake data set')
+    parser.add_argument('--schools',
+        type=int,
+        dest='schools',
+        default=10,
+        help='Number of schools in the fake data set')
+    parser.add_argument('--seed',
+        type=int,
+        dest='seed',
+        default=0,
+        help='Random seed for the data set and failures')
+    parser.add_argument('--latency',
+        type=float,
+        dest='latency',
+        default=0.0,
+        help='Seconds added to every request')
+    parser.add_argument('--error-rate',
+        type=float,
+        dest='error_rate',
+        default=0.0,
+        help='Share of requests answered with 503, between 0 and 1')
+
+  def handle(self, *args, **options):
+    server = FakeBackendServer((options['host'], options['port']),
+        dataset=FakeDataset(options['users'], options['schools'], options['seed']),
+        behaviour=FakeBehaviour(options['latency'], options['error_rate'], options['seed']))
+    self.stdout.write('AUTH_EXTERNAL_SOURCES = %s' % json.dumps(server.external_sources(), indent=2))
+    self.stdout.write('AUTHDATA_DREAMSCHOOL_ORG_MAP = %s' % json.dumps(server.dreamschool_org_map(), indent=2))
+    self.stdout.write('Serving fake backends at http://%s/' % server.host)
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.server_close()
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
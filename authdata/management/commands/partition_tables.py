@@ -0,0 +1,52 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+from django.core.management.base import BaseCommand, CommandError
+from authdata import partitions
+
+
+class Command(BaseCommand):
+  help = """Partitions the Attendance and UserAttribute tables by data source.
+
+Needs PostgreSQL 11 or later. The tables are locked while their rows are
+copied, run this in a maintenance window. See authdata.partitions.
+"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('tables', nargs='*',
+        help='Tables to partition, by default all of %s' % ', '.join(sorted(partitions.MODELS)))
+
+  def handle(self, *args, **options):
+    names = options['tables'] or sorted(partitions.MODELS)
+    for name in names:
+      if name not in partitions.MODELS:
+        raise CommandError('Unknown table %s, choose from %s' % (name, ', '.join(sorted(partitions.MODELS))))
+    for name in names:
+      try:
+        partitions.partition(partitions.MODELS[name])
+      except partitions.PartitionError as e:
+        raise CommandError(unicode(e))
+      self.stdout.write('Partitioned %s' % partitions.table_name(partitions.MODELS[name]))
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,49 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+from django.core.management.base import BaseCommand
+from authdata import documents
+
+
+class Command(BaseCommand):
+  help = """Rebuilds the denormalized UserDocuments of all users.
+
+Run this before turning settings.AUTHDATA_USER_DOCUMENTS on and after
+importing data with bulk inserts, which do not update the documents.
+Run it with --missing periodically to build the documents deleted after
+changes to attributes, roles, schools, municipalities and sources.
+"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('--missing', action='store_true',
+        help='Only build the documents of users without one')
+
+  def handle(self, *args, **options):
+    def progress(done, total):
+      self.stdout.write('%d / %d' % (done, total))
+    count = documents.rebuild(progress=progress if options['verbosity'] > 1 else None,
+        missing=options['missing'])
+    self.stdout.write('Rebuilt %d documents' % count)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,67 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+from django.core.management.base import BaseCommand, CommandError
+from authdata import partitions
+from authdata.models import Source
+
+
+class Command(BaseCommand):
+  help = """Swaps the partition of a data source in a partitioned table.
+
+  staging  creates an empty table for the new rows of the source
+  attach   replaces the rows of the source with the staging table
+  detach   takes the partition of the source out of the table
+
+See authdata.partitions.
+"""
+
+  def add_arguments(self, parser):
+    parser.add_argument('action', choices=('staging', 'attach', 'detach'))
+    parser.add_argument('table', choices=sorted(partitions.MODELS))
+    parser.add_argument('source', help='Name of the data source')
+    parser.add_argument('--keep', action='store_true',
+        help='attach: keep the replaced partition as a plain table')
+    parser.add_argument('--drop', action='store_true',
+        help='detach: drop the detached partition')
+
+  def handle(self, *args, **options):
+    model = partitions.MODELS[options['table']]
+    try:
+      source = Source.objects.filter(name=options['source']).order_by('pk')[0]
+    except IndexError:
+      raise CommandError('Source %s does not exist' % options['source'])
+    try:
+      if options['action'] == 'staging':
+        self.stdout.write('Load the rows into %s' % partitions.create_staging(model, source))
+      elif options['action'] == 'attach':
+        count = partitions.attach(model, source, keep=options['keep'])
+        self.stdout.write('Attached %s, %d users changed' % (partitions.partition_name(model, source), count))
+      else:
+        count = partitions.detach(model, source, drop=options['drop'])
+        self.stdout.write('Detached %s, %d users changed' % (partitions.partition_name(model, source), count))
+    except partitions.PartitionError as e:
+      raise CommandError(unicode(e))
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,123 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Prometheus metrics.
+
+Metrics are collected in each process. Under gunicorn, set the
+``prometheus_multiproc_dir`` environment variable to an empty directory
+before the workers start (see project/gunicorn_conf.py) and ``metrics_view``
+exports the sum over all workers.
+"""
+
+import os
+from prometheus_client import CollectorRegistry
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import Counter
+from prometheus_client import Gauge
+from prometheus_client import Histogram
+from prometheus_client import REGISTRY
+from prometheus_client import generate_latest
+from prometheus_client import multiprocess
+from django.conf import settings
+from django.http import HttpResponse
+from django.http import HttpResponseForbidden
+
+
+REQUESTS = Counter('authdata_requests_total',
+    'HTTP requests by view, method and status code',
+    ['view', 'method', 'status'])
+REQUEST_LATENCY = Histogram('authdata_request_duration_seconds',
+    'HTTP request latency by view and method',
+    ['view', 'method'])
+REQUESTS_IN_PROGRESS = Gauge('authdata_requests_in_progress',
+    'HTTP requests being handled',
+    multiprocess_mode='livesum')
+
+BACKEND_CALLS = Counter('authdata_backend_calls_total',
+    'Calls to external sources by outcome, error means an exception was raised',
+    ['source', 'outcome'])
+BACKEND_LATENCY = Histogram('authdata_backend_duration_seconds',
+    'Latency of calls to external sources',
+    ['source'])
+
+PROVISIONED_USERS = Counter('authdata_provisioned_users_total',
+    'Users written to the local database by external sources',
+    ['source', 'created'])
+
+CACHE_LOOKUPS = Counter('authdata_cache_lookups_total',
+    'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result'])
+
+DB_POOL_CONNECTIONS = Gauge('authdata_db_pool_connections',
+    'Connections of the database connection pools by alias and state (in_use or idle)',
+    ['alias', 'state'],
+    multiprocess_mode='livesum')
+DB_POOL_SIZE = Gauge('authdata_db_pool_max_size',
+    'Maximum connections of the database connection pools by alias',
+    ['alias'],
+    multiprocess_mode='livesum')
+
+
+def observe_backend(source, seconds, error=False):
+  BACKEND_CALLS.labels(source, 'error' if error else 'ok').inc()
+  BACKEND_LATENCY.labels(source).observe(seconds)
+
+
+def observe_cache(cache, hit):
+  CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def observe_provisioning(source, created):
+  PROVISIONED_USERS.labels(source, 'true' if created else 'false').inc()
+
+
+def observe_pool(alias, max_size, in_use, idle):
+  DB_POOL_SIZE.labels(alias).set(max_size)
+  DB_POOL_CONNECTIONS.labels(alias, 'in_use').set(in_use)
+  DB_POOL_CONNECTIONS.labels(alias, 'idle').set(idle)
+
+
+def registry():
+  """
+  Registry to export, aggregated over processes in multiprocess mode
+  """
+  if 'prometheus_multiproc_dir' in os.environ:
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+  return REGISTRY
+
+
+def metrics_view(request):
+  """
+  Metrics in the Prometheus text format for the addresses in
+  settings.AUTHDATA_METRICS_ALLOWED_IPS
+  """
+  if request.META.get('REMOTE_ADDR') not in getattr(settings, 'AUTHDATA_METRICS_ALLOWED_IPS', ()):
+    return HttpResponseForbidden()
+  return HttpResponse(generate_latest(registry()), content_type=CONTENT_TYPE_LATEST)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
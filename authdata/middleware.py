@@ -0,0 +1,163 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import time
+import random
+import logging
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+from authdata import metrics
+from authdata import routers
+from authdata import timing
+
+LOG = logging.getLogger(__name__)
+
+
+def view_name(view_func):
+  view = getattr(view_func, 'cls', None) or view_func
+  return getattr(view, '__name__', repr(view))
+
+
+class MetricsMiddleware(MiddlewareMixin):
+  """
+  Counts requests and their latency per view in authdata.metrics
+  """
+
+  def process_request(self, request):
+    request.metrics_started = time.time()
+    request.metrics_view = 'unknown'
+    metrics.REQUESTS_IN_PROGRESS.inc()
+    return None
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    request.metrics_view = view_name(view_func)
+    return None
+
+  def process_response(self, request, response):
+    started = getattr(request, 'metrics_started', None)
+    if started is None:
+      # An earlier middleware answered before process_request
+      return response
+    metrics.REQUESTS_IN_PROGRESS.dec()
+    metrics.REQUESTS.labels(request.metrics_view, request.method, str(response.status_code)).inc()
+    metrics.REQUEST_LATENCY.labels(request.metrics_view, request.method).observe(time.time() - started)
+    return response
+
+
+class TimingMiddleware(MiddlewareMixin):
+  """
+  Times a sample of requests.
+
+  settings.AUTHDATA_TIMING_SAMPLE_RATE is the share of requests timed,
+  between 0 and 1. Timed requests get a Server-Timing header and are logged
+  with their database, external backend, cache and rendering timings.
+  Database queries are counted with Django's debug cursor, so it is only
+  turned on for timed requests, through a timing.QueryLog in place of the
+  query log of each connection.
+  """
+
+  def process_request(self, request):
+    rate = getattr(settings, 'AUTHDATA_TIMING_SAMPLE_RATE', 0.0)
+    if not rate or random.random() >= rate:
+      return None
+    request.timing = timing.start()
+    request.timing_queries = {}
+    for conn in connections.all():
+      request.timing_queries[conn.alias] = (conn.force_debug_cursor, conn.queries_log)
+      conn.force_debug_cursor = True
+      conn.queries_log = timing.QueryLog(conn.queries_log, request.timing)
+    return None
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    if getattr(request, 'timing', None) is not None:
+      request.timing_view = view_name(view_func)
+    return None
+
+  def process_response(self, request, response):
+    request_timing = getattr(request, 'timing', None)
+    if request_timing is None:
+      return response
+    timing.stop()
+    request.timing = None
+    for conn in connections.all():
+      if conn.alias not in request.timing_queries:
+        continue
+      conn.force_debug_cursor, conn.queries_log = request.timing_queries[conn.alias]
+    response['Server-Timing'] = request_timing.server_timing()
+    data = request_timing.log_data()
+    data.update({
+      'method': request.method,
+      'path': request.path,
+      'view': getattr(request, 'timing_view', None),
+      'status': response.status_code,
+    })
+    LOG.info('Request timing', extra={'data': data})
+    return response
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+  """
+  Sends the reads of read-only requests to a replica with
+  authdata.routers.
+
+  Views list the actions (or for plain views the lowercase HTTP methods)
+  that may read from a replica in ``replica_actions``. A ``changed_at``
+  listing newer than settings.AUTHDATA_REPLICA_LAG_WINDOW seconds stays on
+  the default database, since the changes it asks for may not have reached
+  the replicas yet.
+  """
+
+  def process_view(self, request, view_func, view_args, view_kwargs):
+    # Nothing is carried over from an earlier request in this thread
+    routers.stop()
+    if routers.replicas() and self.read_only(request, view_func):
+      routers.start()
+    return None
+
+  def process_response(self, request, response):
+    routers.stop()
+    return response
+
+  def read_only(self, request, view_func):
+    if request.method not in ('GET', 'HEAD'):
+      return False
+    actions = getattr(view_func, 'actions', None)
+    if actions:
+      action = actions.get('get')
+    else:
+      action = 'get'
+    if action not in getattr(getattr(view_func, 'cls', None), 'replica_actions', ()):
+      return False
+    if 'changed_at' in request.GET:
+      try:
+        changed_at = float(request.GET['changed_at'])
+      except ValueError:
+        return False
+      if changed_at > time.time() - getattr(settings, 'AUTHDATA_REPLICA_LAG_WINDOW', 300):
+        return False
+    return True
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
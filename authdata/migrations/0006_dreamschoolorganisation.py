@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authdata', '0005_auto_20151230_2139'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DreamschoolOrganisation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('modified', models.DateTimeField(auto_now=True)),
+                ('municipality', models.CharField(max_length=2048)),
+                ('school', models.CharField(max_length=2048)),
+                ('org_id', models.IntegerField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='dreamschoolorganisation',
+            unique_together=set([('municipality', 'school')]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authdata', '0006_dreamschoolorganisation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDocument',
+            fields=[
+                ('user', models.OneToOneField(related_name='document', primary_key=True, serialize=False, to='authdata.User', on_delete=django.db.models.deletion.CASCADE)),
+                ('username', models.CharField(max_length=150, unique=True)),
+                ('data', models.TextField()),
+                ('modified', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
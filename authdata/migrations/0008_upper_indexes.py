@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# UserFilter matches these with iexact, which is UPPER(column::text) =
+# UPPER(%s) on PostgreSQL and can only use an index on the same expression.
+INDEXES = (
+    ('authdata_municipality_name_upper', 'authdata_municipality', 'name'),
+    ('authdata_school_name_upper', 'authdata_school', 'name'),
+    ('authdata_attendance_group_upper', 'authdata_attendance', 'group'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s (UPPER(%s::text))' % (
+            schema_editor.quote_name(name), schema_editor.quote_name(table), schema_editor.quote_name(column)))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table, column in INDEXES:
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % schema_editor.quote_name(name))
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can not run in a transaction, the tables
+    # stay writable while the indexes are built
+    atomic = False
+
+    dependencies = [
+        ('authdata', '0007_userdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
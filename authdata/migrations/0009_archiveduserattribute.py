@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authdata', '0008_upper_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedUserAttribute',
+            fields=[
+                ('id', models.IntegerField(serialize=False, primary_key=True)),
+                ('value', models.CharField(default=None, max_length=2048, null=True, blank=True)),
+                ('created', models.DateTimeField()),
+                ('modified', models.DateTimeField(db_index=True)),
+                ('disabled_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+                ('attribute', models.ForeignKey(to='authdata.Attribute', on_delete=django.db.models.deletion.CASCADE)),
+                ('data_source', models.ForeignKey(to='authdata.Source', on_delete=django.db.models.deletion.CASCADE)),
+                ('user', models.ForeignKey(related_name='archived_attributes', to='authdata.User', on_delete=django.db.models.deletion.CASCADE)),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# Active attributes are read by user and by attribute and value, disabled
+# ones only by authdata.archive
+INDEXES = (
+    ('authdata_userattribute_active_user', 'user_id', 'disabled_at IS NULL'),
+    ('authdata_userattribute_active_value', 'attribute_id, value', 'disabled_at IS NULL'),
+    ('authdata_userattribute_disabled_at', 'disabled_at', 'disabled_at IS NOT NULL'),
+)
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, columns, condition in INDEXES:
+        schema_editor.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON authdata_userattribute (%s) WHERE %s' % (
+            schema_editor.quote_name(name), columns, condition))
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, columns, condition in INDEXES:
+        schema_editor.execute('DROP INDEX CONCURRENTLY IF EXISTS %s' % schema_editor.quote_name(name))
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY can not run in a transaction
+    atomic = False
+
+    dependencies = [
+        ('authdata', '0009_archiveduserattribute'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -90,6 +90,26 @@ class UserAttribute(TimeStampedModel):
     return u'%s: %s' % (self.attribute, self.value)
 
 
+class ArchivedUserAttribute(models.Model):
+  """
+  A UserAttribute disabled for longer than the retention, moved here by
+  authdata.archive with its id and timestamps. ``modified`` is when it was
+  disabled, changed_at listings still include the removal.
+  """
+  id = models.IntegerField(primary_key=True)
+  user = models.ForeignKey(User, related_name='archived_attributes')
+  attribute = models.ForeignKey(Attribute)
+  value = models.CharField(max_length=2048, blank=True, null=True, default=None)
+  data_source = models.ForeignKey(Source)
+  created = models.DateTimeField()
+  modified = models.DateTimeField(db_index=True)
+  disabled_at = models.DateTimeField()
+  archived_at = models.DateTimeField()
+
+  def __unicode__(self):
+    return u'%s: %s' % (self.attribute, self.value)
+
+
 class Role(TimeStampedModel):
   name = models.CharField(max_length=2048)
 
@@ -108,5 +128,50 @@ class Attendance(TimeStampedModel):
     return u'%s: %s / %s' % (self.role, self.school.name, self.school.municipality.name)
 
 
+class UserDocument(models.Model):
+  """
+  Denormalized copy of a user, maintained by authdata.documents. ``data`` is
+  the JSON of the /api/1/query response with the external id and source of
+  the user and the data source of each attribute added.
+
+  ``data`` is text rather than a PostgreSQL JSONField so that the model
+  works on every database the project supports, including the SQLite of
+  the default settings. Documents are only read whole, by user or
+  username, so no JSON operators are needed.
+  """
+  user = models.OneToOneField(User, primary_key=True, related_name='document')
+  username = models.CharField(max_length=150, unique=True)
+  data = models.TextField()
+  modified = models.DateTimeField(db_index=True)
+
+  def __unicode__(self):
+    return self.username
+
+
+class DreamschoolOrganisation(TimeStampedModel):
+  """
+  Maps a municipality and school to an organisation id in Dreamschool.
+  Extends and overrides settings.AUTHDATA_DREAMSCHOOL_ORG_MAP.
+  The names are stored in lowercase.
+  """
+  municipality = models.CharField(max_length=2048)
+  school = models.CharField(max_length=2048)
+  org_id = models.IntegerField()
+
+  class Meta:
+    unique_together = (('municipality', 'school'),)
+
+  def save(self, *args, **kwargs):
+    # Names are matched case-insensitively, lowercase keeps them unique
+    self.municipality = self.municipality.lower()
+    self.school = self.school.lower()
+    super(DreamschoolOrganisation, self).save(*args, **kwargs)
+
+  def __unicode__(self):
+    return u'%s / %s: %s' % (self.school, self.municipality, self.org_id)
+
+# Keeps UserDocuments up to date
+from authdata import documents  # pylint: disable=wrong-import-position
+
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
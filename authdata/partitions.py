@@ -0,0 +1,266 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+
+"""
+Optional PostgreSQL declarative partitioning of Attendance and
+UserAttribute by data source.
+
+``manage.py partition_tables`` converts the tables into tables partitioned
+by ``data_source_id`` with one partition per source and a default partition
+for sources added later. It needs PostgreSQL 11 or later and locks the
+tables while the rows are copied. Migrations altering these tables
+afterwards may need to be written by hand.
+
+A source is then reloaded by swapping its partition instead of deleting and
+inserting its rows one by one::
+
+  manage.py source_partition staging attendance <source>
+  # load the rows of the source into the printed table, e.g. with COPY
+  manage.py source_partition attach attendance <source>
+
+``attach`` replaces the rows of the source with the staging table in one
+transaction. ``detach`` takes the partition of a source out of the table,
+the rows are kept in a plain table unless it is dropped. UserDocuments of
+the affected users are rebuilt, see authdata.documents.
+"""
+
+from django.db import connection
+from django.db import transaction
+from authdata import documents
+from authdata.models import Attendance, UserAttribute, Source
+
+MODELS = {
+  'attendance': Attendance,
+  'userattribute': UserAttribute,
+}
+
+MIN_VERSION = 110000
+
+
+class PartitionError(Exception):
+  pass
+
+
+def quote(name):
+  return connection.ops.quote_name(name)
+
+
+def table_name(model):
+  return model._meta.db_table
+
+
+def partition_name(model, source):
+  return '%s_p%d' % (table_name(model), source.pk)
+
+
+def default_name(model):
+  return '%s_default' % table_name(model)
+
+
+def staging_name(model, source):
+  return '%s_staging' % partition_name(model, source)
+
+
+def check():
+  if connection.vendor != 'postgresql' or connection.pg_version < MIN_VERSION:
+    raise PartitionError('Partitioning needs PostgreSQL 11 or later')
+
+
+def exists(cursor, name):
+  cursor.execute('SELECT to_regclass(%s) IS NOT NULL', [name])
+  return cursor.fetchone()[0]
+
+
+def is_partitioned(cursor, model):
+  cursor.execute('SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s',
+      [table_name(model)])
+  return cursor.fetchone() is not None
+
+
+def partition_sql(model, source_ids, sequence, indexes, foreign_keys):
+  """
+  Statements converting the table of ``model`` to a partitioned table.
+  ``indexes`` are the CREATE INDEX statements and ``foreign_keys`` the
+  (name, definition) pairs of the current table.
+  """
+  table = table_name(model)
+  old = '%s_unpartitioned' % table
+  statements = [
+    'ALTER TABLE %s RENAME TO %s' % (quote(table), quote(old)),
+    'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY LIST (data_source_id)' % (
+        quote(table), quote(old)),
+  ]
+  for source_id in sorted(source_ids):
+    statements.append('CREATE TABLE %s PARTITION OF %s FOR VALUES IN (%d)' % (
+        quote('%s_p%d' % (table, source_id)), quote(table), source_id))
+  statements += [
+    'CREATE TABLE %s PARTITION OF %s DEFAULT' % (quote(default_name(model)), quote(table)),
+    'INSERT INTO %s SELECT * FROM %s' % (quote(table), quote(old)),
+    'ALTER SEQUENCE %s OWNED BY %s.id' % (sequence, quote(table)),
+    'DROP TABLE %s' % quote(old),
+    # The partition key must be a part of the primary key, ids stay unique
+    # as they come from the sequence
+    'ALTER TABLE %s ADD PRIMARY KEY (id, data_source_id)' % quote(table),
+  ]
+  # Indexes of a partitioned table are created on every partition
+  statements += list(indexes)
+  for name, definition in foreign_keys:
+    statements.append('ALTER TABLE %s ADD CONSTRAINT %s %s' % (quote(table), quote(name), definition))
+  return statements
+
+
+def partition(model):
+  """
+  Convert the table of ``model`` to a table partitioned by data source
+  """
+  check()
+  table = table_name(model)
+  with transaction.atomic(), connection.cursor() as cursor:
+    if is_partitioned(cursor, model):
+      raise PartitionError('%s is already partitioned' % table)
+    cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, 'id'])
+    sequence = cursor.fetchone()[0]
+    cursor.execute('SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i '
+        'WHERE i.indrelid = %s::regclass AND NOT i.indisprimary ORDER BY i.indexrelid', [table])
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint '
+        "WHERE conrelid = %s::regclass AND contype = 'f' ORDER BY conname", [table])
+    foreign_keys = cursor.fetchall()
+    source_ids = set(Source.objects.values_list('id', flat=True))
+    for statement in partition_sql(model, source_ids, sequence, indexes, foreign_keys):
+      cursor.execute(statement)
+
+
+def staging_sql(model, source):
+  """
+  Statements creating the staging table of a source. The check constraint
+  keeps other rows out and lets PostgreSQL attach the table without
+  scanning it.
+  """
+  staging = staging_name(model, source)
+  return [
+    'CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS)' % (quote(staging), quote(table_name(model))),
+    'ALTER TABLE %s ADD CONSTRAINT %s CHECK (data_source_id IS NOT NULL AND data_source_id = %d)' % (
+        quote(staging), quote('%s_source' % staging), source.pk),
+  ]
+
+
+def attach_sql(model, source, current, keep=False):
+  """
+  Statements replacing the rows of a source with its staging table.
+  ``current`` tells if the source has a partition already, otherwise its
+  rows are in the default partition.
+  """
+  table = table_name(model)
+  partition = partition_name(model, source)
+  statements = []
+  if current:
+    statements.append('ALTER TABLE %s DETACH PARTITION %s' % (quote(table), quote(partition)))
+    if keep:
+      statements.append('ALTER TABLE %s RENAME TO %s' % (quote(partition), quote('%s_detached' % partition)))
+    else:
+      statements.append('DROP TABLE %s' % quote(partition))
+  else:
+    statements.append('DELETE FROM %s WHERE data_source_id = %d' % (quote(default_name(model)), source.pk))
+  statements += [
+    'ALTER TABLE %s RENAME TO %s' % (quote(staging_name(model, source)), quote(partition)),
+    'ALTER TABLE %s ATTACH PARTITION %s FOR VALUES IN (%d)' % (quote(table), quote(partition), source.pk),
+  ]
+  return statements
+
+
+def detach_sql(model, source, drop=False):
+  """
+  Statements taking the partition of a source out of the table
+  """
+  partition = partition_name(model, source)
+  statements = ['ALTER TABLE %s DETACH PARTITION %s' % (quote(table_name(model)), quote(partition))]
+  if drop:
+    statements.append('DROP TABLE %s' % quote(partition))
+  return statements
+
+
+def _user_ids(cursor, table):
+  cursor.execute('SELECT DISTINCT user_id FROM %s' % quote(table))
+  return set(row[0] for row in cursor.fetchall())
+
+
+def _source_partition(cursor, model, source):
+  check()
+  if not is_partitioned(cursor, model):
+    raise PartitionError('%s is not partitioned, run manage.py partition_tables' % table_name(model))
+  return exists(cursor, partition_name(model, source))
+
+
+def create_staging(model, source):
+  """
+  Create the staging table of a source. Returns its name.
+  """
+  with transaction.atomic(), connection.cursor() as cursor:
+    _source_partition(cursor, model, source)
+    if exists(cursor, staging_name(model, source)):
+      raise PartitionError('%s exists already' % staging_name(model, source))
+    for statement in staging_sql(model, source):
+      cursor.execute(statement)
+  return staging_name(model, source)
+
+
+def attach(model, source, keep=False):
+  """
+  Replace the rows of a source with its staging table. Returns the number
+  of users whose data changed.
+  """
+  with transaction.atomic(), connection.cursor() as cursor:
+    current = _source_partition(cursor, model, source)
+    staging = staging_name(model, source)
+    if not exists(cursor, staging):
+      raise PartitionError('%s does not exist' % staging)
+    if current:
+      user_ids = _user_ids(cursor, partition_name(model, source))
+    else:
+      cursor.execute('SELECT DISTINCT user_id FROM %s WHERE data_source_id = %%s' % quote(default_name(model)), [source.pk])
+      user_ids = set(row[0] for row in cursor.fetchall())
+    user_ids |= _user_ids(cursor, staging)
+    for statement in attach_sql(model, source, current, keep):
+      cursor.execute(statement)
+    documents.schedule(user_ids)
+  return len(user_ids)
+
+
+def detach(model, source, drop=False):
+  """
+  Take the partition of a source out of the table. Returns the number of
+  users whose data changed.
+  """
+  with transaction.atomic(), connection.cursor() as cursor:
+    if not _source_partition(cursor, model, source):
+      raise PartitionError('%s has no partition for %s' % (table_name(model), source.name))
+    user_ids = _user_ids(cursor, partition_name(model, source))
+    for statement in detach_sql(model, source, drop):
+      cursor.execute(statement)
+    documents.schedule(user_ids)
+  return len(user_ids)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
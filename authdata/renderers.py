@@ -0,0 +1,85 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+import logging
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework import renderers
+from authdata import timing
+
+LOG = logging.getLogger(__name__)
+
+_dumps = {}
+
+
+def simplejson_dumps(data, ensure_ascii, allow_nan, default):
+  """
+  Compact JSON with simplejson's C speedups
+  """
+  import simplejson
+  return simplejson.dumps(data, ensure_ascii=ensure_ascii, allow_nan=allow_nan,
+      default=default, separators=(',', ':'))
+
+
+def get_dumps():
+  """
+  The function named by settings.AUTHDATA_JSON_DUMPS or None for
+  rest_framework's own encoding. A function which can not be imported is
+  logged once and rest_framework's encoding used instead.
+  """
+  path = getattr(settings, 'AUTHDATA_JSON_DUMPS', None)
+  if path not in _dumps:
+    func = None
+    if path:
+      try:
+        func = import_string(path)
+      except ImportError:
+        LOG.error('Can not import JSON encoder', extra={'data': {'path': repr(path)}})
+    _dumps[path] = func
+  return _dumps[path]
+
+
+class JSONRenderer(renderers.JSONRenderer):
+  """
+  JSONRenderer recording the rendering time of timed requests.
+
+  Compact output is encoded with the function named by
+  settings.AUTHDATA_JSON_DUMPS. It is called with the data, ensure_ascii,
+  allow_nan and the default function of rest_framework's encoder.
+  """
+
+  def render(self, data, accepted_media_type=None, renderer_context=None):
+    with timing.render():
+      dumps = get_dumps()
+      if (dumps is None or data is None or not self.compact
+          or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+        return super(JSONRenderer, self).render(data, accepted_media_type, renderer_context)
+      ret = dumps(data, self.ensure_ascii, not self.strict, self.encoder_class().default)
+      if isinstance(ret, unicode):
+        # escaped like rest_framework does
+        ret = ret.replace(u'\u2028', u'\\u2028').replace(u'\u2029', u'\\u2029')
+        return ret.encode('utf-8')
+      return ret
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,111 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Read replica routing.
+
+ReplicaRouter sends reads to the databases in settings.AUTHDATA_READ_REPLICAS
+only while the current thread is serving a request ReplicaMiddleware has
+marked read-only. Everything else, including all writes, migrations and
+management commands, uses the default database. The first write during a
+request pins the rest of the request to the default database, so data the
+request has written is also read back from there.
+"""
+
+import random
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+
+
+_local = threading.local()
+
+
+def replicas():
+  return tuple(getattr(settings, 'AUTHDATA_READ_REPLICAS', ()))
+
+
+def start():
+  """
+  Allow reads from a replica in this thread until stop() or a write
+  """
+  _local.replica = random.choice(replicas()) if replicas() else None
+  _local.pinned = False
+
+
+def stop():
+  _local.replica = None
+  _local.pinned = False
+
+
+@contextmanager
+def read_only():
+  start()
+  try:
+    yield
+  finally:
+    stop()
+
+
+def pin():
+  """
+  Read from the default database until stop()
+  """
+  _local.pinned = True
+
+
+def pinned():
+  return getattr(_local, 'pinned', False)
+
+
+def current_replica():
+  """
+  Alias of the replica reads are sent to in this thread or None
+  """
+  replica = getattr(_local, 'replica', None)
+  if replica is None or pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+    return None
+  return replica
+
+
+class ReplicaRouter(object):
+
+  def db_for_read(self, model, **hints):
+    return current_replica()
+
+  def db_for_write(self, model, **hints):
+    if getattr(_local, 'replica', None) is not None:
+      pin()
+    return DEFAULT_DB_ALIAS
+
+  def allow_relation(self, obj1, obj2, **hints):
+    # Replicas have the same data as the default database
+    return True
+
+  def allow_migrate(self, db, app_label, model_name=None, **hints):
+    return db not in replicas()
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
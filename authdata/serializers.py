@@ -24,8 +24,81 @@
 #
 
 
+from collections import OrderedDict
+from django.db.models import Prefetch
 from rest_framework import serializers
-from authdata.models import User, Attribute, UserAttribute, Municipality, School, Role, Attendance, Source
+from authdata import cache
+from authdata.models import User, Attribute, UserAttribute, Municipality, School, Role, Attendance
+
+
+def prefetch_user_data(queryset):
+  """
+  Prefetch everything QuerySerializer and UserSerializer read from a User
+  queryset, so serializing takes the same number of queries regardless of
+  the number of users, roles and attributes.
+  """
+  return queryset.prefetch_related(
+    Prefetch('attendances', queryset=Attendance.objects.select_related('school__municipality', 'role').order_by('id')),
+    Prefetch('attributes', to_attr='active_attributes',
+        queryset=UserAttribute.objects.filter(disabled_at__isnull=True).select_related('attribute', 'data_source').order_by('id')),
+  )
+
+
+def user_list_data(rows, source):
+  """
+  UserSerializer output of user_list_values() rows for the requesting
+  ``source``. Roles and attributes are read in one query each and only the
+  columns in the output are fetched.
+  """
+  users = list(rows)
+  ids = [u['id'] for u in users]
+  roles = {}
+  attendances = Attendance.objects.filter(user_id__in=ids).order_by('id').values_list(
+      'user_id', 'school__school_id', 'group', 'role__name', 'school__municipality__municipality_id')
+  for user_id, school_id, group, role, municipality_id in attendances:
+    d = {}
+    d['school'] = school_id
+    d['group'] = group
+    d['role'] = role
+    d['municipality'] = municipality_id
+    roles.setdefault(user_id, []).append(d)
+  attributes = {}
+  user_attributes = UserAttribute.objects.filter(user_id__in=ids, disabled_at__isnull=True,
+      data_source__name=source).order_by('id').values_list('user_id', 'attribute__name', 'value')
+  for user_id, name, value in user_attributes:
+    d = {}
+    d['name'] = name
+    d['value'] = value
+    attributes.setdefault(user_id, []).append(d)
+  data = []
+  for u in users:
+    data.append(OrderedDict((
+      ('username', u['username']),
+      ('first_name', u['first_name']),
+      ('last_name', u['last_name']),
+      ('external_id', u['external_id']),
+      ('roles', roles.get(u['id'], [])),
+      ('attributes', attributes.get(u['id'], [])),
+    )))
+  return data
+
+
+def user_list_values(queryset):
+  """
+  The user columns user_list_data() reads, for paginating a listing before
+  the roles and attributes are fetched
+  """
+  return queryset.prefetch_related(None).values('id', 'username', 'first_name', 'last_name', 'external_id')
+
+
+def active_attributes(obj):
+  """
+  UserAttributes of the user which are not disabled
+  """
+  try:
+    return obj.active_attributes
+  except AttributeError:
+    return obj.attributes.filter(disabled_at__isnull=True).select_related('attribute', 'data_source')
 
 
 class QuerySerializer(serializers.ModelSerializer):
@@ -36,6 +109,19 @@ class QuerySerializer(serializers.ModelSerializer):
     model = User
     fields = ('username', 'first_name', 'last_name', 'roles', 'attributes')
 
+  def to_representation(self, obj):
+    # The output is read-only, it is built directly instead of going
+    # through the fields
+    data = OrderedDict()
+    for name in self.Meta.fields:
+      if name == 'roles':
+        data[name] = self.role_data(obj)
+      elif name == 'attributes':
+        data[name] = self.attribute_data(obj)
+      else:
+        data[name] = getattr(obj, name)
+    return data
+
   def role_data(self, obj):
     data = []
     for a in obj.attendances.all():
@@ -49,7 +135,7 @@ class QuerySerializer(serializers.ModelSerializer):
 
   def attribute_data(self, obj):
     data = []
-    for a in obj.attributes.filter(disabled_at__isnull=True):
+    for a in active_attributes(obj):
       d = {}
       d['name'] = a.attribute.name
       d['value'] = a.value
@@ -62,10 +148,10 @@ class UserSerializer(QuerySerializer):
   def attribute_data(self, obj):
     # attribute data is filtered. only attributes where source is requesting user's username are returned
     data = []
+    attribute_qs = active_attributes(obj)
     if 'request' in self.context:
-      attribute_qs = obj.attributes.filter(disabled_at__isnull=True, data_source__name=self.context['request'].user.username)
-    else:
-      attribute_qs = obj.attributes.filter(disabled_at__isnull=True)
+      username = self.context['request'].user.username
+      attribute_qs = [a for a in attribute_qs if a.data_source.name == username]
     for a in attribute_qs:
       d = {}
       d['name'] = a.attribute.name
@@ -88,9 +174,27 @@ class AttributeSerializer(serializers.ModelSerializer):
 
 
 
+class CachedSlugRelatedField(serializers.SlugRelatedField):
+  """
+  SlugRelatedField looking up objects from an authdata.cache.ReferenceCache
+  """
+
+  def __init__(self, cache, **kwargs):
+    self.cache = cache
+    super(CachedSlugRelatedField, self).__init__(slug_field=cache.field, queryset=cache.model.objects.all(), **kwargs)
+
+  def to_internal_value(self, data):
+    if not isinstance(data, basestring):
+      self.fail('invalid')
+    obj = self.cache.get(data)
+    if obj is None:
+      self.fail('does_not_exist', slug_name=self.slug_field, value=data)
+    return obj
+
+
 class UserAttributeSerializer(serializers.ModelSerializer):
   data_source = serializers.PrimaryKeyRelatedField(read_only=True)
-  attribute = serializers.SlugRelatedField(slug_field='name', queryset=Attribute.objects.all())
+  attribute = CachedSlugRelatedField(cache.ATTRIBUTES)
   user = serializers.SlugRelatedField(slug_field='username', queryset=User.objects.all())
 
   class Meta:
@@ -101,7 +205,7 @@ class UserAttributeSerializer(serializers.ModelSerializer):
 
   def save(self, *args, **kwargs):
     username = self.context['request'].user.username
-    data_source_obj, _ = Source.objects.get_or_create(name=username)
+    data_source_obj, _ = cache.SOURCES.get_or_create(username)
     kwargs['data_source'] = data_source_obj
     return super(UserAttributeSerializer, self).save(*args, **kwargs)
 
@@ -117,7 +221,7 @@ class MunicipalitySerializer(serializers.ModelSerializer):
 
   def save(self, *args, **kwargs):
     username = self.context['request'].user.username
-    data_source_obj, _ = Source.objects.get_or_create(name=username)
+    data_source_obj, _ = cache.SOURCES.get_or_create(username)
     kwargs['data_source'] = data_source_obj
     return super(MunicipalitySerializer, self).save(*args, **kwargs)
 
@@ -132,7 +236,7 @@ class SchoolSerializer(serializers.ModelSerializer):
 
   def save(self, *args, **kwargs):
     username = self.context['request'].user.username
-    data_source_obj, _ = Source.objects.get_or_create(name=username)
+    data_source_obj, _ = cache.SOURCES.get_or_create(username)
     kwargs['data_source'] = data_source_obj
     return super(SchoolSerializer, self).save(*args, **kwargs)
 
@@ -154,7 +258,7 @@ class AttendanceSerializer(serializers.ModelSerializer):
 
   def save(self, *args, **kwargs):
     username = self.context['request'].user.username
-    data_source_obj, _ = Source.objects.get_or_create(name=username)
+    data_source_obj, _ = cache.SOURCES.get_or_create(username)
     kwargs['data_source'] = data_source_obj
     return super(AttendanceSerializer, self).save(*args, **kwargs)
 
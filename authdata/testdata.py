@@ -0,0 +1,160 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Bulk generator for test and benchmark data.
+
+Produces the same shape of data as the ``factory_boy`` factories in
+``authdata.tests.factories`` but inserts it in large batches, so that data
+sets of a million users can be created in minutes. The generated data is
+deterministic for a given seed.
+"""
+
+import string
+import random
+from StringIO import StringIO
+from django.db import connection, transaction
+from django.utils import timezone
+from authdata import documents
+from authdata.models import User, Role, Attribute, UserAttribute, Municipality, School, Attendance, Source
+
+
+USERNAME_PREFIX = '1.2.246.562.24.'
+
+
+class TestDataGenerator(object):
+  """
+  Creates ``users`` users split evenly between ``municipalities``, each
+  having ``schools`` schools. Every user gets a value for each of the
+  ``attributes`` attributes and 1-``max_attendances`` attendances with one
+  role in the schools of their municipality.
+
+  Rows are written ``batch_size`` users at a time, each batch in its own
+  transaction. On PostgreSQL user attributes and attendances are written
+  with COPY unless ``use_copy`` is False.
+  """
+
+  def __init__(self, users=10000, municipalities=10, schools=10, attributes=10,
+      max_attendances=10, seed=0, batch_size=5000, use_copy=True, source_name='autogentest'):
+    self.users = users
+    self.municipalities = municipalities
+    self.schools = schools
+    self.attributes = attributes
+    self.max_attendances = max_attendances
+    self.batch_size = batch_size
+    self.use_copy = use_copy and connection.vendor == 'postgresql'
+    self.source_name = source_name
+    self.random = random.Random(seed)
+    self.now = timezone.now()
+
+  def generate(self, progress=None):
+    """
+    Insert the data set. ``progress`` is called with the number of users
+    created so far after every batch.
+    """
+    self.source, _ = Source.objects.get_or_create(name=self.source_name)
+    self.attribute_objs = [Attribute.objects.get_or_create(name='attribute%d' % i)[0] for i in xrange(self.attributes)]
+    self.roles = [Role.objects.get_or_create(name=name)[0] for name in ('teacher', 'student')]
+    # Continue the numbering of earlier runs like the usernames do
+    first_municipality = Municipality.objects.filter(name__startswith='Municipality').count()
+    self.first_school = School.objects.filter(name__startswith='School').count()
+    self.school_ids = [self.create_schools(first_municipality + m, m) for m in xrange(self.municipalities)]
+    self.attendance_count = 0
+    first = User.objects.filter(username__startswith=USERNAME_PREFIX).count()
+    for start in xrange(0, self.users, self.batch_size):
+      end = min(start + self.batch_size, self.users)
+      with transaction.atomic():
+        self.create_batch(first, start, end)
+      if progress:
+        progress(end)
+
+  def create_schools(self, index, n):
+    """
+    Create municipality ``index`` with its schools, the ``n``th one of this
+    run. Returns the ids of the schools.
+    """
+    municipality = Municipality.objects.create(name='Municipality%d' % index,
+        municipality_id='%07d-8' % index, data_source=self.source)
+    schools = School.objects.bulk_create([School(name='School%d-%d' % (index, i),
+        school_id='%d' % (self.first_school + n * self.schools + i), municipality=municipality,
+        data_source=self.source) for i in xrange(self.schools)])
+    if connection.features.can_return_ids_from_bulk_insert:
+      return [s.id for s in schools]
+    return list(School.objects.filter(municipality=municipality).order_by('id').values_list('id', flat=True))
+
+  def create_batch(self, first, start, end):
+    rng = self.random
+    users = []
+    for n in xrange(start, end):
+      first_name = 'First%d' % (first + n)
+      last_name = 'Last%d' % (first + n)
+      users.append(User(username='%s%011d' % (USERNAME_PREFIX, first + n),
+          first_name=first_name, last_name=last_name, password='!',
+          email='%s.%s@example.com' % (first_name, last_name), last_login=self.now))
+    users = User.objects.bulk_create(users)
+    if connection.features.can_return_ids_from_bulk_insert:
+      user_ids = [u.id for u in users]
+    else:
+      # Usernames are zero padded so the batch is a contiguous range
+      by_username = dict(User.objects.filter(username__range=(users[0].username, users[-1].username)).values_list('username', 'id'))
+      user_ids = [by_username[u.username] for u in users]
+
+    user_attributes = []
+    attendances = []
+    for n, user_id in enumerate(user_ids, start):
+      for attribute in self.attribute_objs:
+        value = ''.join(rng.choice(string.ascii_letters) for i in xrange(10))
+        user_attributes.append((user_id, attribute.id, value))
+      school_ids = self.school_ids[n * self.municipalities // self.users]
+      role_id = rng.choice(self.roles).id
+      for i in xrange(rng.randint(1, self.max_attendances)):
+        attendances.append((user_id, rng.choice(school_ids), role_id, 'Group%d' % self.attendance_count))
+        self.attendance_count += 1
+
+    if self.use_copy:
+      self.copy(UserAttribute, ('user_id', 'attribute_id', 'value'), user_attributes)
+      self.copy(Attendance, ('user_id', 'school_id', 'role_id', 'group'), attendances)
+    else:
+      UserAttribute.objects.bulk_create([UserAttribute(user_id=u, attribute_id=a, value=v,
+          data_source=self.source) for u, a, v in user_attributes], batch_size=self.batch_size)
+      Attendance.objects.bulk_create([Attendance(user_id=u, school_id=s, role_id=r, group=g,
+          data_source=self.source) for u, s, r, g in attendances], batch_size=self.batch_size)
+    if documents.enabled():
+      documents.refresh(user_ids)
+
+  def copy(self, model, columns, rows):
+    """
+    Write rows with PostgreSQL COPY. The generated values never contain
+    tabs, newlines or backslashes so they need no escaping.
+    """
+    columns = columns + ('data_source_id', 'created', 'modified')
+    extra = u'\t%s\t%s\t%s\n' % (self.source.id, self.now.isoformat(), self.now.isoformat())
+    data = StringIO(u''.join(u'\t'.join(unicode(c) for c in row) + extra for row in rows).encode('utf-8'))
+    sql = 'COPY %s (%s) FROM STDIN' % (connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(c) for c in columns))
+    with connection.cursor() as cursor:
+      cursor.copy_expert(sql, data)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
@@ -105,5 +105,14 @@ class AttendanceFactory(factory.django.DjangoModelFactory):
   data_source = factory.SubFactory(SourceFactory)
 
 
+class DreamschoolOrganisationFactory(factory.django.DjangoModelFactory):
+  class Meta:
+    model = models.DreamschoolOrganisation
+
+  municipality = factory.Sequence(lambda n: 'municipality{0}'.format(n))
+  school = factory.Sequence(lambda n: 'school{0}'.format(n))
+  org_id = factory.Sequence(lambda n: 1000 + n)
+
+
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
@@ -0,0 +1,134 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Query budget helpers for tests.
+
+``max_queries`` fails a block or a test which runs more queries than its
+budget. ``QueryCountMixin.assertConstantQueries`` runs a request against
+fixtures of several sizes and fails if the number of queries changes with
+the size, which catches N+1 query patterns.
+"""
+
+import functools
+from django.db import DEFAULT_DB_ALIAS
+from django.db import connections
+from django.db import transaction
+from django.test.utils import CaptureQueriesContext
+from authdata.tests import factories as f
+
+
+SIZES = (1, 3, 6)
+
+
+def format_queries(context):
+  return '\n'.join('%d. %s' % (i, q['sql']) for i, q in enumerate(context.captured_queries, 1))
+
+
+class max_queries(object):
+  """
+  Context manager and decorator failing if the block or the function runs
+  more than ``budget`` queries on the database ``using``.
+  """
+
+  def __init__(self, budget, using=DEFAULT_DB_ALIAS):
+    self.budget = budget
+    self.using = using
+    self.context = None
+
+  def __enter__(self):
+    self.context = CaptureQueriesContext(connections[self.using])
+    return self.context.__enter__()
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.context.__exit__(exc_type, exc_value, traceback)
+    if exc_type is None and len(self.context) > self.budget:
+      raise AssertionError('%d queries executed, budget is %d:\n%s' % (
+          len(self.context), self.budget, format_queries(self.context)))
+
+  def __call__(self, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+      with max_queries(self.budget, self.using):
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def create_users(count, attendances=1, attributes=1, data_source=None, school=None):
+  """
+  Fixture of ``count`` users, each with ``attendances`` attendances and
+  ``attributes`` attributes. Attendances are in different schools unless
+  ``school`` is given.
+  """
+  data_source = data_source or f.SourceFactory()
+  users = []
+  for i in xrange(count):
+    user = f.UserFactory()
+    for j in xrange(attendances):
+      if school is None:
+        f.AttendanceFactory(user=user, data_source=data_source,
+            school__data_source=data_source, school__municipality__data_source=data_source)
+      else:
+        f.AttendanceFactory(user=user, data_source=data_source, school=school, group='7A')
+    for j in xrange(attributes):
+      f.UserAttributeFactory(user=user, data_source=data_source)
+    users.append(user)
+  return users
+
+
+class QueryCountMixin(object):
+  """
+  Query budget assertions for TestCase
+  """
+
+  def assertMaxQueries(self, budget, using=DEFAULT_DB_ALIAS):
+    return max_queries(budget, using)
+
+  def assertConstantQueries(self, fixture, request, budget, sizes=SIZES, using=DEFAULT_DB_ALIAS):
+    """
+    For each size, call ``fixture(size)`` and pass its result to
+    ``request``. The queries run by ``request`` must be the same in number
+    for every size and at most ``budget``. Fixtures are rolled back after
+    each size.
+    """
+    counts = []
+    for size in sizes:
+      savepoint = transaction.savepoint(using=using)
+      try:
+        value = fixture(size)
+        with CaptureQueriesContext(connections[using]) as context:
+          request(value)
+      finally:
+        transaction.savepoint_rollback(savepoint, using=using)
+      counts.append(len(context))
+      if len(context) > budget:
+        self.fail('%d queries with size %d, budget is %d:\n%s' % (
+            len(context), size, budget, format_queries(context)))
+    if len(set(counts)) != 1:
+      self.fail('Query count changes with size: %s\nQueries with size %d:\n%s' % (
+          ', '.join('%d: %d' % pair for pair in zip(sizes, counts)), sizes[-1], format_queries(context)))
+    return counts[0]
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
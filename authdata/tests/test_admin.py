@@ -58,6 +58,10 @@ class TestAdmin(TestCase):
     obj = admin.UserAdmin(Mock(), Mock())
     self.assertTrue(obj)
 
+  def test_dreamschoolorganisation(self):
+    obj = admin.DreamschoolOrganisationAdmin(Mock(), Mock())
+    self.assertTrue(obj)
+
 
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
@@ -0,0 +1,83 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import datetime
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from authdata import archive
+from authdata import models
+from authdata.tests import factories as f
+import authdata.views
+
+
+class TestArchive(TestCase):
+
+  def setUp(self):
+    self.now = timezone.now()
+    self.user = f.UserFactory()
+    self.active = f.UserAttributeFactory(user=self.user)
+    self.old = [self.disabled(days=40) for _ in xrange(3)]
+    self.recent = self.disabled(days=1)
+
+  def disabled(self, days):
+    user_attribute = f.UserAttributeFactory(user=self.user)
+    models.UserAttribute.objects.filter(pk=user_attribute.pk).update(
+        disabled_at=self.now - datetime.timedelta(days=days), modified=self.now - datetime.timedelta(days=days))
+    return user_attribute
+
+  def test_archive(self):
+    self.assertEqual(archive.archive(batch_size=2), 3)
+    self.assertEqual(set(models.UserAttribute.objects.values_list('id', flat=True)), set([self.active.pk, self.recent.pk]))
+    archived = models.ArchivedUserAttribute.objects.get(pk=self.old[0].pk)
+    self.assertEqual((archived.user, archived.attribute, archived.value, archived.data_source),
+        (self.user, self.old[0].attribute, self.old[0].value, self.old[0].data_source))
+    self.assertEqual(archived.modified, self.now - datetime.timedelta(days=40))
+    self.assertEqual(archive.archive(), 0)
+
+  def test_before(self):
+    self.assertEqual(archive.archive(before=self.now), 4)
+
+  def test_changed_at(self):
+    archive.archive()
+    changed_at = self.now - datetime.timedelta(days=41)
+    # only the archived removal changed the user after changed_at
+    models.User.objects.filter(pk=self.user.pk).update(modified=changed_at)
+    models.UserAttribute.objects.update(modified=changed_at)
+    models.Attribute.objects.update(modified=changed_at)
+    queryset = authdata.views.UserFilter().timestamp_filter(models.User.objects.all(),
+        str((changed_at + datetime.timedelta(seconds=1) - datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)).total_seconds()))
+    self.assertEqual(list(queryset), [self.user])
+
+  def test_command(self):
+    out = StringIO()
+    call_command('archive_user_attributes', days=0, stdout=out)
+    self.assertEqual(out.getvalue().strip(), 'Archived 4 attributes')
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,102 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import json
+from StringIO import StringIO
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from authdata import benchmark
+from authdata import cache
+from authdata import models
+from authdata.testdata import TestDataGenerator
+
+
+class TestPercentile(TestCase):
+
+  def test_percentile(self):
+    values = range(1, 101)
+    self.assertEqual(benchmark.percentile(values, 50), 50)
+    self.assertEqual(benchmark.percentile(values, 95), 95)
+    self.assertEqual(benchmark.percentile(values, 99), 99)
+    self.assertEqual(benchmark.percentile([3, 1, 2], 50), 2)
+    self.assertEqual(benchmark.percentile([5], 99), 5)
+    self.assertEqual(benchmark.percentile([], 50), None)
+
+
+class TestBenchmark(TestCase):
+
+  def setUp(self):
+    TestDataGenerator(users=10, attributes=2, municipalities=2, schools=2, seed=1).generate()
+
+  def test_run(self):
+    bench = benchmark.Benchmark(requests=3, list_requests=2, csv_rows=5, seed=1)
+    results = bench.run()
+    self.assertEqual(results['dataset']['municipalities'], 2)
+    # query_connection closes the connection, it is skipped in a transaction
+    scenarios = [name for name in benchmark.SCENARIOS if name != 'query_connection']
+    self.assertEqual([r['scenario'] for r in results['results']], scenarios)
+    for result in results['results']:
+      self.assertEqual(result['errors'], 0, result['scenario'])
+      self.assertTrue(result['p50_ms'] <= result['p95_ms'] <= result['p99_ms'])
+      self.assertTrue(result['queries_per_request'] > 0)
+    self.assertEqual(models.User.objects.filter(username__startswith='1.2.246.562.99.').count(), 5)
+
+  def test_changed_at(self):
+    bench = benchmark.Benchmark(seed=1)
+    response = bench.client.get('/api/1/user/', {'changed_at': '0'})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(response.data), models.User.objects.count())
+    response = bench.client.get('/api/1/user/', {'changed_at': '4102444800'})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(response.data), 0)
+
+  def test_command(self):
+    out = StringIO()
+    call_command('benchmark', requests=2, scenarios=['query_username', 'user_school'], seed=1, stdout=out)
+    results = json.loads(out.getvalue())
+    self.assertEqual([r['scenario'] for r in results['results']], ['query_username', 'user_school'])
+    self.assertEqual(results['results'][0]['requests'], 2)
+
+
+class TestBenchmarkConnection(TransactionTestCase):
+
+  def setUp(self):
+    TestDataGenerator(users=10, attributes=2, municipalities=2, schools=2, seed=1).generate()
+
+  def tearDown(self):
+    cache.invalidate_all()
+
+  def test_query_connection(self):
+    bench = benchmark.Benchmark(requests=3, seed=1)
+    results = bench.run(['query_connection'])
+    result, = results['results']
+    self.assertEqual(result['scenario'], 'query_connection')
+    self.assertEqual(result['errors'], 0)
+    self.assertIn('connection_setup_ms', result)
+    self.assertIn('new_connection_p50_ms', result)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
@@ -0,0 +1,168 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import json
+
+from rest_framework.test import APITestCase
+
+from django.test import override_settings
+
+from authdata import documents
+from authdata import models
+from authdata.tests import factories as f
+
+
+class TestBulk(APITestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client.force_authenticate(user=self.user)
+    self.source = f.SourceFactory(name=self.user.username)
+    self.users = f.UserFactory.create_batch(3)
+    self.school = f.SchoolFactory(school_id='00001')
+    self.role = f.RoleFactory(name='student')
+    self.attribute = f.AttributeFactory(name='oid')
+
+  def post(self, path, data, mode=None, **kwargs):
+    if mode:
+      path += '?mode=%s' % mode
+    kwargs.setdefault('content_type', 'application/json')
+    if kwargs['content_type'] == 'application/json':
+      data = json.dumps(data)
+    return self.client.post(path, data, **kwargs)
+
+  def attendances(self, group='7A'):
+    return [{'user': u.username, 'school': '00001', 'role': 'student', 'group': group} for u in self.users]
+
+  def test_create_attendances(self):
+    response = self.post('/api/1/attendance/bulk/', self.attendances())
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.data, {'created': 3, 'updated': 0, 'unchanged': 0})
+    attendance = models.Attendance.objects.get(user=self.users[0])
+    self.assertEqual((attendance.school, attendance.role, attendance.group, attendance.data_source),
+        (self.school, self.role, '7A', self.source))
+    response = self.post('/api/1/attendance/bulk/', self.attendances())
+    self.assertEqual(response.data, {'created': 0, 'updated': 0, 'unchanged': 3})
+    self.assertEqual(models.Attendance.objects.count(), 3)
+
+  def test_attendance_without_group(self):
+    rows = self.attendances()
+    for row in rows:
+      del row['group']
+    response = self.post('/api/1/attendance/bulk/', rows)
+    self.assertEqual(response.data['created'], 3)
+    self.assertEqual(set(models.Attendance.objects.values_list('group', flat=True)), set(['']))
+    response = self.post('/api/1/attendance/bulk/', self.attendances(group=''))
+    self.assertEqual(response.data['unchanged'], 3)
+
+  def test_ndjson(self):
+    data = '\n'.join(json.dumps(row) for row in self.attendances()) + '\n'
+    response = self.post('/api/1/attendance/bulk/', data, content_type='application/x-ndjson')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.data['created'], 3)
+
+  def test_ndjson_parse_error(self):
+    response = self.post('/api/1/attendance/bulk/', '{"user":\n', content_type='application/x-ndjson')
+    self.assertEqual(response.status_code, 400)
+
+  def test_upsert_attributes(self):
+    disabled = f.UserAttributeFactory(user=self.users[0], attribute=self.attribute, data_source=self.source,
+        value='old', disabled_at='2018-01-01T00:00Z')
+    rows = [{'user': u.username, 'attribute': 'oid', 'value': 'v%d' % i} for i, u in enumerate(self.users)]
+    with self.assertNumQueries(8):
+      response = self.post('/api/1/userattribute/bulk/', rows)
+    self.assertEqual(response.data, {'created': 2, 'updated': 1, 'unchanged': 0})
+    disabled.refresh_from_db()
+    self.assertEqual((disabled.value, disabled.disabled_at), ('v0', None))
+    self.assertEqual(sorted(models.UserAttribute.objects.values_list('value', flat=True)), ['v0', 'v1', 'v2'])
+
+  def test_other_source_not_updated(self):
+    other = f.UserAttributeFactory(user=self.users[0], attribute=self.attribute, value='other')
+    response = self.post('/api/1/userattribute/bulk/', [{'user': self.users[0].username, 'attribute': 'oid', 'value': 'x'}])
+    self.assertEqual(response.data['created'], 1)
+    other.refresh_from_db()
+    self.assertEqual(other.value, 'other')
+
+  def test_update_missing(self):
+    response = self.post('/api/1/municipality/bulk/', [{'name': 'Foo', 'municipality_id': '1'}], mode='update')
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual(response.data['errors'][0]['index'], 0)
+
+  def test_schools(self):
+    municipality = f.MunicipalityFactory(municipality_id='123', data_source=self.source)
+    f.SchoolFactory(school_id='1', name='Old', data_source=self.source)
+    rows = [{'name': 'New', 'school_id': '1', 'municipality': '123'},
+        {'name': 'Other', 'school_id': '2', 'municipality': '123'}]
+    response = self.post('/api/1/school/bulk/', rows)
+    self.assertEqual(response.data, {'created': 1, 'updated': 1, 'unchanged': 0})
+    self.assertEqual(set(models.School.objects.filter(municipality=municipality).values_list('name', flat=True)),
+        set(['New', 'Other']))
+
+  @override_settings(AUTHDATA_USER_DOCUMENTS=True)
+  def test_schools_documents(self):
+    school = f.SchoolFactory(school_id='1', name='Old', data_source=self.source)
+    f.AttendanceFactory(user=self.users[0], school=school)
+    documents.refresh(u.pk for u in self.users)
+    response = self.post('/api/1/school/bulk/', [{'name': 'New', 'school_id': '1', 'municipality': school.municipality.municipality_id}])
+    self.assertEqual(response.data['updated'], 1)
+    # Users of the school are served from the tables until their documents are rebuilt
+    self.assertEqual(set(models.UserDocument.objects.values_list('user_id', flat=True)),
+        set([self.users[1].pk, self.users[2].pk]))
+
+  def test_validation(self):
+    rows = self.attendances()
+    rows[0]['user'] = 'missing'
+    rows[1]['group'] = None
+    rows.append(dict(rows[2]))
+    rows.append('foo')
+    response = self.post('/api/1/attendance/bulk/', rows)
+    self.assertEqual(response.status_code, 400)
+    errors = dict((e['index'], e['errors']) for e in response.data['errors'])
+    self.assertEqual(sorted(errors), [0, 1, 3, 4])
+    self.assertIn('user', errors[0])
+    self.assertIn('group', errors[1])
+    self.assertFalse(models.Attendance.objects.exists())
+
+  def test_ambiguous(self):
+    f.SchoolFactory(school_id='00001')
+    response = self.post('/api/1/attendance/bulk/', self.attendances())
+    self.assertEqual(response.status_code, 400)
+
+  def test_mode(self):
+    response = self.post('/api/1/attendance/bulk/', self.attendances(), mode='foo')
+    self.assertEqual(response.status_code, 400)
+
+  @override_settings(AUTHDATA_BULK_MAX_ROWS=2)
+  def test_max_rows(self):
+    response = self.post('/api/1/attendance/bulk/', self.attendances())
+    self.assertEqual(response.status_code, 400)
+
+  def test_not_a_list(self):
+    response = self.post('/api/1/attendance/bulk/', {'user': 'foo'})
+    self.assertEqual(response.status_code, 400)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
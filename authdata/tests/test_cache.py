@@ -0,0 +1,131 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+from rest_framework.test import APITestCase
+
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.test import override_settings
+
+from authdata import cache
+from authdata import models
+from authdata.tests import factories as f
+
+
+class TestReferenceCache(TransactionTestCase):
+
+  def tearDown(self):
+    cache.invalidate_all()
+
+  def test_get(self):
+    source = f.SourceFactory(name='foo')
+    self.assertEqual(cache.SOURCES.get('foo'), source)
+    with self.assertNumQueries(0):
+      self.assertEqual(cache.SOURCES.get('foo'), source)
+    self.assertEqual(cache.SOURCES.get('bar'), None)
+
+  def test_get_or_create(self):
+    source, created = cache.SOURCES.get_or_create('foo')
+    self.assertTrue(created)
+    with self.assertNumQueries(0):
+      self.assertEqual(cache.SOURCES.get_or_create('foo'), (source, False))
+
+  def test_defaults(self):
+    municipality = f.MunicipalityFactory()
+    school, created = cache.SCHOOLS.get_or_create('123', defaults={'name': 'Foo',
+        'municipality': municipality, 'data_source': municipality.data_source})
+    self.assertTrue(created)
+    self.assertEqual(school.name, 'Foo')
+
+  def test_created_elsewhere(self):
+    cache.SOURCES.get('foo')
+    # Not in the snapshot, but still found
+    models.Source.objects.bulk_create([models.Source(name='foo')])
+    self.assertEqual(cache.SOURCES.get('foo').name, 'foo')
+
+  def test_changed(self):
+    role = f.RoleFactory(name='teacher')
+    cache.ROLES.get('teacher')
+    role.name = 'principal'
+    role.save()
+    self.assertEqual(cache.ROLES.get('teacher'), None)
+    self.assertEqual(cache.ROLES.get('principal'), role)
+    role.delete()
+    self.assertEqual(cache.ROLES.get('principal'), None)
+
+  def test_rollback(self):
+    cache.SOURCES.get('foo')
+    with self.assertRaises(ValueError):
+      with transaction.atomic():
+        cache.SOURCES.get_or_create('foo')
+        raise ValueError
+    self.assertEqual(cache.SOURCES.get('foo'), None)
+
+  @override_settings(AUTHDATA_REFERENCE_CACHE_TTL=0)
+  def test_ttl(self):
+    cache.SOURCES.get('foo')
+    models.Source.objects.create(name='foo')
+    models.Source.objects.filter(name='foo').update(name='bar')
+    self.assertEqual(cache.SOURCES.get('bar').name, 'bar')
+    self.assertEqual(cache.SOURCES.get('foo'), None)
+
+  def test_query_missing(self):
+    cache.SOURCES.get('foo')
+    models.Source.objects.bulk_create([models.Source(name='foo')])
+    with self.assertNumQueries(0):
+      self.assertEqual(cache.SOURCES.get('foo', query_missing=False), None)
+    with override_settings(AUTHDATA_REFERENCE_CACHE_MISS_TTL=0):
+      self.assertEqual(cache.SOURCES.get('foo', query_missing=False).name, 'foo')
+
+  @override_settings(AUTHDATA_REFERENCE_CACHE_MISS_TTL=0)
+  def test_query_missing_transaction(self):
+    cache.SOURCES.get('foo')
+    with transaction.atomic():
+      models.Source.objects.bulk_create([models.Source(name='foo')])
+      # The snapshot is not reloaded inside a transaction
+      self.assertEqual(cache.SOURCES.get('foo', query_missing=False).name, 'foo')
+      self.assertEqual(cache.SOURCES.get('bar', query_missing=False), None)
+
+
+class TestCachedSlugRelatedField(APITestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client.force_authenticate(user=self.user)
+
+  def test_attribute(self):
+    user = f.UserFactory()
+    f.AttributeFactory(name='oid')
+    response = self.client.post('/api/1/userattribute/', {'user': user.username, 'attribute': 'oid', 'value': 'foo'})
+    self.assertEqual(response.status_code, 201)
+    attribute = models.UserAttribute.objects.get(user=user)
+    self.assertEqual((attribute.attribute.name, attribute.data_source.name), ('oid', self.user.username))
+    response = self.client.post('/api/1/userattribute/', {'user': user.username, 'attribute': 'missing', 'value': 'foo'})
+    self.assertEqual(response.status_code, 400)
+    self.assertIn('attribute', response.data)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
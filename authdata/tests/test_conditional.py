@@ -0,0 +1,175 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import time
+
+from rest_framework.test import APIClient
+from rest_framework.test import APITestCase
+
+from django.test import TransactionTestCase
+from django.test import override_settings
+from django.utils.http import http_date
+
+from authdata import cache
+from authdata import documents
+from authdata import models
+from authdata.tests import factories as f
+
+
+class TestQueryConditional(APITestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client.force_authenticate(user=self.user)
+    self.other = f.UserFactory(username='other')
+    self.attribute = f.UserAttributeFactory(user=self.other, attribute__name='oid', value='123')
+    self.attendance = f.AttendanceFactory(user=self.other)
+
+  def get(self, path='/api/1/query/other', data=None, **headers):
+    return self.client.get(path, data or {}, **headers)
+
+  def etag(self, path='/api/1/query/other', data=None):
+    return self.client.head(path, data or {})['ETag']
+
+  def test_validators(self):
+    response = self.get(HTTP_IF_NONE_MATCH='""')
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response['ETag'].startswith('"'))
+    self.assertFalse(response.has_header('Last-Modified'))
+    self.assertEqual(response['ETag'], self.etag())
+
+  def test_unconditional(self):
+    response = self.get()
+    self.assertEqual(response.status_code, 200)
+    self.assertFalse(response.has_header('ETag'))
+
+  def test_not_modified(self):
+    etag = self.etag()
+    response = self.get(HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 304)
+    self.assertEqual(response['ETag'], etag)
+
+  def test_if_modified_since(self):
+    self.attendance.delete()
+    response = self.get(HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.data['roles'], [])
+
+  def test_attribute_query(self):
+    etag = self.etag('/api/1/query', {'oid': '123'})
+    self.assertEqual(self.get('/api/1/query', {'oid': '123'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+  def test_changed(self):
+    etag = self.etag()
+    self.attribute.value = '456'
+    self.attribute.save()
+    response = self.get(HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 200)
+    self.assertNotEqual(response['ETag'], etag)
+
+  def test_deleted(self):
+    etag = self.etag()
+    self.attendance.delete()
+    self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+  def test_requester(self):
+    etag = self.etag()
+    self.client.force_authenticate(user=self.other)
+    self.assertNotEqual(self.etag(), etag)
+
+  def test_not_found(self):
+    response = self.get('/api/1/query/foo', HTTP_IF_NONE_MATCH='""')
+    self.assertEqual(response.status_code, 404)
+    self.assertFalse(response.has_header('ETag'))
+
+  def test_external_user(self):
+    self.other.external_source = 'doesntexist'
+    self.other.external_id = '1'
+    self.other.save()
+    self.assertFalse(self.get(HTTP_IF_NONE_MATCH='""').has_header('ETag'))
+
+
+class TestUserListConditional(APITestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client.force_authenticate(user=self.user)
+    self.attendance = f.AttendanceFactory(group='7A')
+    f.AttendanceFactory(school=self.attendance.school, group='7B')
+
+  def test_filtered(self):
+    params = {'school': self.attendance.school.name}
+    etag = self.client.head('/api/1/user/', params)['ETag']
+    self.assertEqual(self.client.get('/api/1/user/', params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+    f.AttendanceFactory(school=self.attendance.school)
+    self.assertEqual(self.client.get('/api/1/user/', params, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+  def test_deleted(self):
+    params = {'school': self.attendance.school.name}
+    etag = self.client.head('/api/1/user/', params)['ETag']
+    self.attendance.delete()
+    response = self.client.get('/api/1/user/', params, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(response.data), 1)
+
+  def test_if_modified_since(self):
+    params = {'school': self.attendance.school.name}
+    self.attendance.delete()
+    response = self.client.get('/api/1/user/', params, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(len(response.data), 1)
+
+  def test_unfiltered(self):
+    self.assertFalse(self.client.head('/api/1/user/').has_header('ETag'))
+
+
+@override_settings(AUTHDATA_USER_DOCUMENTS=True)
+class TestDocumentConditional(TransactionTestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client = APIClient()
+    self.client.force_authenticate(user=self.user)
+    self.attendance = f.AttendanceFactory(user=f.UserFactory(username='other'))
+    documents.rebuild()
+
+  def tearDown(self):
+    cache.invalidate_all()
+
+  def test_not_modified(self):
+    etag = self.client.head('/api/1/query/other')['ETag']
+    self.assertEqual(self.client.get('/api/1/query/other', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+    self.attendance.delete()
+    self.assertEqual(self.client.get('/api/1/query/other', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+  def test_missing_document(self):
+    f.AttendanceFactory(group='7A')
+    models.UserDocument.objects.all().delete()
+    response = self.client.get('/api/1/user/', {'group': '7A'}, HTTP_IF_NONE_MATCH='""')
+    self.assertEqual(response.status_code, 200)
+    self.assertFalse(response.has_header('ETag'))
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -25,7 +25,9 @@
 # pylint: disable=locally-disabled, no-member, protected-access
 
 import base64
+import pickle
 
+import ldap
 import mock
 import requests
 
@@ -34,7 +36,11 @@ from django.test import RequestFactory
 from django.test import override_settings
 
 from authdata import models
+from authdata.tests import factories as f
 from authdata.datasources.base import ExternalDataSource
+from authdata.datasources.base import LRUCache
+from authdata.datasources.base import UserRecord
+import authdata.datasources.base
 import authdata.datasources.dreamschool
 import authdata.datasources.ldap_base
 import authdata.datasources.oulu
@@ -87,6 +93,18 @@ class TestExternalDataSource(TestCase):
     with self.assertRaises(NotImplementedError):
       self.o.get_oid(username='foo')
 
+  def test_make_oid(self):
+    oid = self.o.make_oid('ldap_test', 'abc-123')
+    self.assertEqual(oid, 'MPASSOID.c5af545a6479eb503ce5d')
+    self.assertEqual(authdata.datasources.base.OID_CACHE.get(('ldap_test', 'abc-123')), oid)
+    self.assertNotEqual(self.o.make_oid('dreamschool', 'abc-123'), oid)
+
+  def test_resolve_oid(self):
+    self.assertEqual(self.o.resolve_oid('oid'), None)
+    self.o.external_source = 'foo'
+    self.o.provision_user(oid='oid', external_id='bar')
+    self.assertEqual(self.o.resolve_oid('oid'), ('foo', 'bar'))
+
   def test_data(self):
     with self.assertRaises(NotImplementedError):
       self.o.get_data(external_id='foo')
@@ -95,6 +113,63 @@ class TestExternalDataSource(TestCase):
     with self.assertRaises(NotImplementedError):
       self.o.get_user_data(request='foo')
 
+  def test_iter_user_data(self):
+    with self.assertRaises(NotImplementedError):
+      list(self.o.iter_user_data(request='foo'))
+
+    listing = self.o.user_listing([{'username': 'foo'}])
+    with mock.patch.object(self.o, 'get_user_data', return_value=listing):
+      self.assertEqual(list(self.o.iter_user_data(request='foo')), [{'username': 'foo'}])
+
+  def test_user_listing(self):
+    users = iter([{'username': 'foo'}, {'username': 'bar'}])
+    self.assertEqual(self.o.user_listing(users), {
+      'count': 2,
+      'next': None,
+      'previous': None,
+      'results': [{'username': 'foo'}, {'username': 'bar'}],
+    })
+
+
+class TestLRUCache(TestCase):
+
+  def test_get_set(self):
+    cache = LRUCache(2)
+    self.assertEqual(cache.get('a'), None)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    self.assertEqual(cache.get('a'), 1)
+    cache.set('c', 3)
+    # b was the least recently used
+    self.assertEqual(cache.get('b'), None)
+    self.assertEqual(cache.get('a'), 1)
+    self.assertEqual(cache.get('c'), 3)
+    self.assertEqual(len(cache), 2)
+    cache.clear()
+    self.assertEqual(len(cache), 0)
+
+
+class TestUserRecord(TestCase):
+
+  def test_init(self):
+    roles = ({'role': 'teacher'} for _ in xrange(2))
+    record = UserRecord(username='oid', first_name='First', last_name='Last', roles=roles)
+    self.assertEqual(record, {
+      'username': 'oid',
+      'first_name': 'First',
+      'last_name': 'Last',
+      'roles': [{'role': 'teacher'}, {'role': 'teacher'}],
+      'attributes': [],
+    })
+    self.assertEqual(type(record['roles']), list)
+
+  def test_pickle(self):
+    record = UserRecord('oid', 'First', 'Last', [{'role': 'teacher'}], [{'name': 'a', 'value': 'b'}])
+    for protocol in xrange(pickle.HIGHEST_PROTOCOL + 1):
+      copy = pickle.loads(pickle.dumps(record, protocol))
+      self.assertEqual(type(copy), UserRecord)
+      self.assertEqual(copy, record)
+
 
 @override_settings(AUTH_EXTERNAL_SOURCES=AUTH_EXTERNAL_SOURCES)
 @override_settings(AUTH_EXTERNAL_ATTRIBUTE_BINDING=AUTH_EXTERNAL_ATTRIBUTE_BINDING)
@@ -173,6 +248,18 @@ class TestDreamschoolDataSource(TestCase):
     ]
     self.assertEqual(roles, expected_roles)
 
+  def test_iter_user_data(self):
+    d = {'municipality': 'Bar', 'school': 'school1', 'group': 'Group1'}
+    request = self.factory.get('/foo', d)
+
+    users = self.o.iter_user_data(request=request)
+    # Nothing is fetched or provisioned before the first user is consumed
+    self.assertFalse(authdata.datasources.dreamschool.requests.get.called)
+    user = next(users)
+    self.assertEqual(user['username'], 'MPASSOID.ea5f9ca03f6edf5a0409d')
+    self.assertEqual(models.User.objects.filter(username=user['username']).count(), 1)
+    self.assertEqual(list(users), [])
+
   def test_user_data_api_fail(self):
     response_mock = mock.Mock()
     response_mock.status_code = 500
@@ -297,6 +384,41 @@ class TestDreamschoolDataSource(TestCase):
     org_id = self.o._get_org_id(municipality=municipality, school=school)
     self.assertEqual(org_id, expected_org_id)
 
+  def test_org_map_from_db(self):
+    f.DreamschoolOrganisationFactory(municipality=u'Bar', school=u'Uusi Koulu', org_id=7)
+    # Overrides settings
+    f.DreamschoolOrganisationFactory(municipality=u'bar', school=u'school1', org_id=8)
+    self.assertEqual(self.o._get_org_id(municipality=u'bar', school=u'uusi koulu'), 7)
+    self.assertEqual(self.o._get_org_id(municipality=u'Bar', school=u'School1'), 8)
+    self.assertEqual(self.o._get_org_id(municipality=u'Bar', school=u'äö school'), 1)
+    self.assertEqual(self.o._get_municipality_by_org_id('7'), u'Bar')
+
+  def test_org_index_cache(self):
+    with mock.patch('authdata.datasources.dreamschool.connection') as connection_mock:
+      connection_mock.in_atomic_block = False
+      index = authdata.datasources.dreamschool.get_org_index()
+      self.assertIs(authdata.datasources.dreamschool.get_org_index(), index)
+      self.assertNotIn(9, index.municipalities)
+
+      f.DreamschoolOrganisationFactory(municipality=u'bar', school=u'uusi koulu', org_id=9)
+      index = authdata.datasources.dreamschool.get_org_index()
+      self.assertIn(9, index.municipalities)
+      self.assertIs(authdata.datasources.dreamschool.get_org_index(), index)
+
+      with override_settings(AUTHDATA_DREAMSCHOOL_ORG_MAP={}):
+        self.assertNotIn(1, authdata.datasources.dreamschool.get_org_index().municipalities)
+    authdata.datasources.dreamschool.invalidate_org_index()
+
+  def test_get_roles_loads_index_once(self):
+    userdata = {
+        'roles': [],
+        'user_groups': [{'organisation': {'id': 1, 'title': 'School'}, 'title': 'Group%d' % i} for i in xrange(3)],
+    }
+    # Inside the test transaction the index is not cached
+    with self.assertNumQueries(1):
+      roles = self.o._get_roles(userdata)
+    self.assertEqual([role['municipality'] for role in roles], [u'Bar'] * 3)
+
   def test_get_data(self):
     external_id = '123'
     data = {
@@ -328,7 +450,8 @@ class TestDreamschoolDataSource(TestCase):
 
     authdata.datasources.dreamschool.requests.get.return_value = response_mock
     data = self.o.get_data(external_id=external_id)
-    data['roles'] = list(data['roles'])
+    self.assertEqual(type(data), UserRecord)
+    self.assertEqual(type(data['roles']), list)
     expected_data = {
       'attributes': [],
       'username': 'MPASSOID.08153889bda7b8ffd5a4d',
@@ -551,6 +674,43 @@ class TestLdapTest(TestCase):
     # User is provisioned
     self.assertEquals(authdata.models.User.objects.count(), 1)
 
+  def test_get_user_data_keeps_base_dn(self):
+    mock_request = mock.Mock()
+    mock_request.GET = {'school': u'LdapKoulu1'}
+    with mock.patch.object(self.obj, 'query', return_value=[]) as mock_query:
+      self.obj.get_user_data(request=mock_request)
+      self.obj.get_user_data(request=mock_request)
+    self.assertEqual(self.obj.ldap_base_dn, 'ou=KuntaYksi,dc=mpass-test,dc=csc,dc=fi')
+    self.assertEqual(mock_query.call_args[1]['base_dn'],
+        u'ou=LdapKoulu1,ou=KuntaYksi,dc=mpass-test,dc=csc,dc=fi')
+
+  def test_get_listing_query(self):
+    listing_query = self.obj.get_listing_query({})
+    self.assertEqual(listing_query.base_dn, 'ou=KuntaYksi,dc=mpass-test,dc=csc,dc=fi')
+    self.assertEqual(listing_query.filterstr, u'(objectClass=inetOrgPerson)')
+    self.assertEqual(listing_query.scope, ldap.SCOPE_SUBTREE)
+
+    listing_query = self.obj.get_listing_query({'school': u'Koulu, 1', 'group': u'9*)'})
+    self.assertEqual(listing_query.base_dn, u'ou=Koulu\\, 1,ou=KuntaYksi,dc=mpass-test,dc=csc,dc=fi')
+    self.assertEqual(listing_query.filterstr,
+        u'(&(objectClass=inetOrgPerson)(departmentNumber=9\\2a\\29))')
+
+  def test_get_listing_query_empty_values(self):
+    listing_query = self.obj.get_listing_query({'school': u'', 'group': u''})
+    self.assertEqual(listing_query, self.obj.get_listing_query({}))
+
+  def test_get_listing_query_cached(self):
+    params = {'school': u'LdapKoulu1', 'group': u'9A'}
+    self.assertIs(self.obj.get_listing_query(params), self.obj.get_listing_query(params))
+
+  def test_get_listing_query_onelevel(self):
+    class OneLevel(authdata.datasources.ldap_base.TestLDAPDataSource):
+      listing_scope = ldap.SCOPE_ONELEVEL
+    obj = OneLevel(host='host', username='foo', password='bar')
+    listing_query = obj.get_listing_query({'school': u'LdapKoulu1'})
+    self.assertEqual(listing_query.scope, ldap.SCOPE_ONELEVEL)
+    self.assertEqual(self.obj.get_listing_query({'school': u'LdapKoulu1'}).scope, ldap.SCOPE_SUBTREE)
+
 
 class TestOuluLDAPDataSource(TestCase):
 
@@ -696,5 +856,11 @@ class TestOuluLDAPDataSource(TestCase):
     # User is provisioned
     self.assertEquals(authdata.models.User.objects.count(), 1)
 
+  def test_get_listing_query(self):
+    listing_query = self.obj.get_listing_query({'school': u'Herukan koulu', 'group': u'(7A)'})
+    self.assertEqual(listing_query.base_dn, 'base')
+    self.assertEqual(listing_query.filterstr,
+        u'(&(objectCategory=person)(objectClass=user)(department=\\287A\\29)(physicalDeliveryOfficeName=Herukan koulu))')
+
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
@@ -0,0 +1,151 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import threading
+
+import mock
+from prometheus_client import REGISTRY
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from authdata.db.pool import ConnectionPool
+from authdata.db.pool import PoolTimeout
+from authdata.db.postgresql.base import DatabaseWrapper
+
+
+class TestConnectionPool(SimpleTestCase):
+
+  def setUp(self):
+    self.connect = mock.Mock(side_effect=lambda: mock.Mock())
+
+  def test_reuse(self):
+    pool = ConnectionPool(self.connect, max_size=2)
+    first = pool.get()
+    pool.put(first)
+    self.assertIs(pool.get(), first)
+    self.assertEqual(self.connect.call_count, 1)
+
+  def test_discard(self):
+    pool = ConnectionPool(self.connect, max_size=2)
+    first = pool.get()
+    pool.put(first, discard=True)
+    self.assertTrue(first.close.called)
+    self.assertIsNot(pool.get(), first)
+
+  def test_max_idle(self):
+    pool = ConnectionPool(self.connect, max_size=2, max_idle=1)
+    first, second = pool.get(), pool.get()
+    pool.put(first)
+    pool.put(second)
+    self.assertEqual(pool.idle, [first])
+    self.assertTrue(second.close.called)
+
+  def test_timeout(self):
+    pool = ConnectionPool(self.connect, max_size=1, timeout=0.01)
+    pool.get()
+    with self.assertRaises(PoolTimeout):
+      pool.get()
+
+  def test_wait(self):
+    pool = ConnectionPool(self.connect, max_size=1, timeout=5)
+    first = pool.get()
+    timer = threading.Timer(0.05, pool.put, [first])
+    timer.start()
+    self.assertIs(pool.get(), first)
+    timer.join()
+
+  def test_connect_error(self):
+    pool = ConnectionPool(mock.Mock(side_effect=IOError), max_size=1, timeout=0.01)
+    with self.assertRaises(IOError):
+      pool.get()
+    self.assertEqual(pool.in_use, 0)
+
+  def test_metrics(self):
+    def sample(name, **labels):
+      return REGISTRY.get_sample_value(name, dict(alias='pooltest', **labels))
+    pool = ConnectionPool(self.connect, max_size=3, name='pooltest')
+    self.assertEqual(sample('authdata_db_pool_max_size'), 3)
+    first, second = pool.get(), pool.get()
+    self.assertEqual(sample('authdata_db_pool_connections', state='in_use'), 2)
+    self.assertEqual(sample('authdata_db_pool_connections', state='idle'), 0)
+    pool.put(first)
+    self.assertEqual(sample('authdata_db_pool_connections', state='in_use'), 1)
+    self.assertEqual(sample('authdata_db_pool_connections', state='idle'), 1)
+    pool.put(second, discard=True)
+    pool.close()
+    self.assertEqual(sample('authdata_db_pool_connections', state='in_use'), 0)
+    self.assertEqual(sample('authdata_db_pool_connections', state='idle'), 0)
+
+
+class TestDatabaseWrapper(SimpleTestCase):
+
+  def wrapper(self, **settings):
+    settings_dict = dict(connection.settings_dict, ENGINE='authdata.db.postgresql', NAME='authdata', **settings)
+    wrapper = DatabaseWrapper(settings_dict, alias='health')
+    wrapper.connection = mock.Mock()
+    wrapper.autocommit = True
+    return wrapper
+
+  def test_health_check(self):
+    wrapper = self.wrapper(CONN_HEALTH_CHECKS=True)
+    with mock.patch.object(wrapper, 'is_usable', return_value=False), \
+        mock.patch.object(wrapper, 'close') as close, \
+        mock.patch.object(wrapper, 'connect'):
+      wrapper.ensure_connection()
+      wrapper.ensure_connection()
+    self.assertEqual(close.call_count, 1)
+
+  def test_health_check_once_per_request(self):
+    wrapper = self.wrapper(CONN_HEALTH_CHECKS=True)
+    with mock.patch.object(wrapper, 'is_usable', return_value=True) as is_usable:
+      wrapper.ensure_connection()
+      wrapper.ensure_connection()
+      self.assertEqual(is_usable.call_count, 1)
+      wrapper.close_if_unusable_or_obsolete()
+      wrapper.ensure_connection()
+      self.assertEqual(is_usable.call_count, 2)
+
+  def test_no_health_check(self):
+    wrapper = self.wrapper()
+    with mock.patch.object(wrapper, 'is_usable') as is_usable:
+      wrapper.ensure_connection()
+    self.assertFalse(is_usable.called)
+
+  def test_pool(self):
+    pooled = mock.Mock(closed=0, autocommit=True, isolation_level=None)
+    pooled.get_transaction_status.return_value = 0
+    wrapper = self.wrapper(POOL={'MAX_SIZE': 1})
+    with mock.patch('authdata.db.postgresql.base.psycopg2.connect', return_value=pooled) as connect:
+      self.assertIs(wrapper.get_new_connection(wrapper.get_connection_params()), pooled)
+      wrapper.connection = pooled
+      wrapper._close()
+      self.assertFalse(pooled.close.called)
+      self.assertIs(wrapper.get_new_connection(wrapper.get_connection_params()), pooled)
+    self.assertEqual(connect.call_count, 1)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
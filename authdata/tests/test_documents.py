@@ -0,0 +1,229 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import json
+import time
+import threading
+import unittest
+from StringIO import StringIO
+
+import mock
+
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.test import APITestCase
+
+from django.core.management import call_command
+from django.db import connection
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.test import override_settings
+
+from authdata import cache
+from authdata import documents
+from authdata import models
+from authdata.tests import factories as f
+from authdata.tests.querycount import create_users
+from authdata.views import UserViewSet
+
+
+class TestDocumentViews(APITestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client.force_authenticate(user=self.user)
+    self.data_source = f.SourceFactory(name=self.user.username)
+    self.users = create_users(3, attendances=2, attributes=2, data_source=self.data_source)
+    create_users(2, attendances=1, attributes=1)
+    documents.rebuild()
+
+  def compare(self, path, data=None):
+    response = self.client.get(path, data or {})
+    with override_settings(AUTHDATA_USER_DOCUMENTS=True):
+      fast = self.client.get(path, data or {})
+    self.assertEqual(fast.status_code, response.status_code)
+    return json.loads(response.content), json.loads(fast.content)
+
+  def test_query(self):
+    expected, data = self.compare('/api/1/query/%s' % self.users[0].username)
+    self.assertEqual(data, expected)
+    self.assertEqual(len(data['roles']), 2)
+
+  def test_list(self):
+    expected, data = self.compare('/api/1/user/')
+    key = lambda d: d['username']
+    self.assertEqual(sorted(data, key=key), sorted(expected, key=key))
+    self.assertEqual(len(data), 6)
+
+  def test_list_filter(self):
+    school = models.Attendance.objects.filter(user=self.users[0])[0].school
+    expected, data = self.compare('/api/1/user/', {'school': school.name})
+    self.assertEqual(data, expected)
+    self.assertEqual(len(data), 1)
+
+  def test_changed_at(self):
+    models.UserDocument.objects.update(modified='2000-01-01T00:00Z')
+    models.UserDocument.objects.filter(user=self.users[1]).update(modified='2030-01-01T00:00Z')
+    with override_settings(AUTHDATA_USER_DOCUMENTS=True):
+      response = self.client.get('/api/1/user/', {'changed_at': str(time.time())})
+    self.assertEqual([u['username'] for u in response.data], [self.users[1].username])
+
+  def test_list_paginated(self):
+    models.UserDocument.objects.filter(user=self.users[1]).delete()
+    with mock.patch.object(UserViewSet, 'pagination_class', LimitOffsetPagination):
+      expected, data = self.compare('/api/1/user/', {'limit': 2, 'offset': 1})
+    self.assertEqual(data, expected)
+    self.assertEqual((data['count'], len(data['results'])), (6, 2))
+
+  def test_missing_document(self):
+    models.UserDocument.objects.filter(user=self.users[0]).delete()
+    expected, data = self.compare('/api/1/user/')
+    key = lambda d: d['username']
+    self.assertEqual(sorted(data, key=key), sorted(expected, key=key))
+    # Listings do not write, the document is built by rebuild_user_documents
+    self.assertFalse(models.UserDocument.objects.filter(user=self.users[0]).exists())
+
+  def test_external_user(self):
+    user = self.users[0]
+    user.external_source = 'dreamschool'
+    user.external_id = '123'
+    user.save()
+    documents.refresh([user.pk])
+    self.assertEqual(documents.query_document(user.username), None)
+
+  def test_command(self):
+    models.UserDocument.objects.all().delete()
+    out = StringIO()
+    call_command('rebuild_user_documents', stdout=out)
+    self.assertEqual(models.UserDocument.objects.count(), 6)
+    self.assertIn('Rebuilt 6 documents', out.getvalue())
+
+  def test_command_missing(self):
+    models.UserDocument.objects.filter(user=self.users[0]).delete()
+    out = StringIO()
+    with mock.patch('authdata.documents.refresh', wraps=documents.refresh) as refresh:
+      call_command('rebuild_user_documents', missing=True, stdout=out)
+    refresh.assert_called_once_with([self.users[0].pk])
+    self.assertEqual(models.UserDocument.objects.count(), 6)
+    self.assertIn('Rebuilt 1 documents', out.getvalue())
+
+
+@override_settings(AUTHDATA_USER_DOCUMENTS=True)
+class TestDocumentSignals(TransactionTestCase):
+
+  def tearDown(self):
+    # The flush after the test does not send signals
+    cache.invalidate_all()
+
+  def data(self, user):
+    return json.loads(models.UserDocument.objects.get(user=user).data)
+
+  def test_user(self):
+    user = f.UserFactory(first_name='Foo')
+    self.assertEqual(self.data(user)['first_name'], 'Foo')
+
+  def test_attendance(self):
+    attendance = f.AttendanceFactory()
+    self.assertEqual(len(self.data(attendance.user)['roles']), 1)
+    attendance.delete()
+    self.assertEqual(self.data(attendance.user)['roles'], [])
+
+  def test_related_names(self):
+    attendance = f.AttendanceFactory()
+    role = attendance.role
+    role.name = 'principal'
+    role.save()
+    self.assertFalse(models.UserDocument.objects.filter(user=attendance.user).exists())
+    documents.rebuild(missing=True)
+    self.assertEqual(self.data(attendance.user)['roles'][0]['role'], 'principal')
+    attribute = f.UserAttributeFactory(user=attendance.user).attribute
+    with mock.patch('authdata.documents.refresh') as refresh:
+      attribute.name = 'renamed'
+      attribute.save()
+    self.assertFalse(refresh.called)
+    self.assertFalse(models.UserDocument.objects.filter(user=attendance.user).exists())
+    documents.rebuild(missing=True)
+    self.assertEqual(self.data(attendance.user)['attributes'][0]['name'], 'renamed')
+
+  def test_transaction(self):
+    with mock.patch('authdata.documents.refresh', wraps=documents.refresh) as refresh:
+      with transaction.atomic():
+        user = f.UserFactory()
+        f.AttendanceFactory(user=user)
+        f.UserAttributeFactory(user=user)
+        self.assertFalse(refresh.called)
+    self.assertEqual(refresh.call_count, 1)
+    data = self.data(user)
+    self.assertEqual((len(data['roles']), len(data['attributes'])), (1, 1))
+
+  def test_rollback(self):
+    with self.assertRaises(ValueError):
+      with transaction.atomic():
+        f.UserFactory()
+        raise ValueError
+    with transaction.atomic():
+      user = f.UserFactory()
+    self.assertTrue(models.UserDocument.objects.filter(user=user).exists())
+
+  def test_savepoint_rollback(self):
+    with transaction.atomic():
+      with self.assertRaises(ValueError):
+        with transaction.atomic():
+          f.UserFactory()
+          raise ValueError
+      user = f.UserFactory()
+    self.assertTrue(models.UserDocument.objects.filter(user=user).exists())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Needs concurrent connections')
+class TestConcurrentRefresh(TransactionTestCase):
+
+  def tearDown(self):
+    cache.invalidate_all()
+
+  def test_refresh(self):
+    ids = [user.id for user in create_users(20, attendances=1, attributes=1)]
+    errors = []
+
+    def refresh():
+      try:
+        documents.refresh(ids)
+      except Exception as e:  # pylint: disable=broad-except
+        errors.append(e)
+      finally:
+        connection.close()
+
+    for i in xrange(5):
+      models.UserDocument.objects.all().delete()
+      threads = [threading.Thread(target=refresh) for j in xrange(4)]
+      for thread in threads:
+        thread.start()
+      for thread in threads:
+        thread.join()
+      self.assertEqual(errors, [])
+      self.assertEqual(models.UserDocument.objects.count(), len(ids))
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
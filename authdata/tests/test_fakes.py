@@ -0,0 +1,163 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import base64
+
+import ldap
+import mock
+import requests
+
+from django.test import TestCase
+from django.test import RequestFactory
+from django.test import override_settings
+
+from authdata import models
+from authdata.datasources import fakes
+from authdata.datasources.dreamschool import DreamschoolDataSource
+from authdata.datasources.gafe import GafeDataSource
+from authdata.datasources.opinsys import OpinsysDataSource
+from authdata.datasources.wilma import WilmaDataSource
+
+
+class TestParseFilter(TestCase):
+
+  def test_parse(self):
+    self.assertEqual(fakes.parse_filter(u'(cn=Foo)'), ('=', 'cn', 'foo'))
+    self.assertEqual(fakes.parse_filter('(&(a=1)(|(b=2)(!(c=*))))'),
+        ('&', [('=', 'a', '1'), ('|', [('=', 'b', '2'), ('!', ('present', 'c'))])]))
+    self.assertEqual(fakes.parse_filter(r'(objectGUID=\00\ff)'), ('=', 'objectguid', '\x00\xff'))
+
+  def test_substring(self):
+    node = fakes.parse_filter('(cn=fo*ar)')
+    self.assertTrue(fakes._matches(node, {'cn': set(['foobar'])}))
+    self.assertFalse(fakes._matches(node, {'cn': set(['foobaz'])}))
+
+  def test_invalid(self):
+    for filterstr in ('cn=foo', '(cn=foo', '(cn)', '(cn=foo))'):
+      with self.assertRaises(ldap.FILTER_ERROR):
+        fakes.parse_filter(filterstr)
+
+
+class TestFakeLDAPDirectory(TestCase):
+
+  def setUp(self):
+    self.directory = fakes.FakeLDAPDirectory([
+      ('cn=a,ou=One,dc=test', {'cn': ['a'], 'objectClass': ['person']}),
+      ('cn=b,ou=Two,dc=test', {'cn': ['b'], 'objectClass': ['person']}),
+      ('ou=One,dc=test', {'ou': ['One'], 'objectClass': ['organizationalUnit']}),
+    ])
+
+  def test_scope(self):
+    self.assertEqual(len(self.directory.search('dc=test', ldap.SCOPE_SUBTREE, '(objectClass=*)')), 3)
+    self.assertEqual(len(self.directory.search('ou=one,dc=test', ldap.SCOPE_SUBTREE, '(objectClass=*)')), 2)
+    self.assertEqual(len(self.directory.search('ou=One,dc=test', ldap.SCOPE_ONELEVEL, '(objectClass=*)')), 1)
+    self.assertEqual(len(self.directory.search('ou=One,dc=test', ldap.SCOPE_BASE, '(objectClass=*)')), 1)
+
+  def test_indexed(self):
+    result = self.directory.search('dc=test', ldap.SCOPE_SUBTREE, '(&(objectClass=person)(cn=B))')
+    self.assertEqual([dn for dn, attrs in result], ['cn=b,ou=Two,dc=test'])
+
+  def test_errors(self):
+    connection = fakes.FakeLDAPObject(self.directory, fakes.FakeBehaviour(error_rate=1.0))
+    with self.assertRaises(ldap.SERVER_DOWN):
+      connection.search_s('dc=test', ldap.SCOPE_SUBTREE, '(cn=a)')
+
+
+class TestFakeLDAPDataSources(TestCase):
+
+  def test_test_ldap(self):
+    obj = fakes.FakeTestLDAPDataSource(host='fake', username='fake', password='fake', users=30, schools=3)
+    data = obj.get_data('fake7')
+    self.assertEqual(data['first_name'], u'First7')
+    self.assertEqual(data['roles'][0]['municipality'], u'KuntaYksi')
+    self.assertTrue(models.User.objects.filter(external_id='fake7').exists())
+    self.assertEqual(obj.get_data('nobody'), None)
+    request = RequestFactory().get('/', {'school': 'LdapKoulu1'})
+    users = list(obj.iter_user_data(request))
+    self.assertTrue(users)
+    self.assertEqual(set(u['roles'][0]['school'] for u in users), set(['00001']))
+
+  def test_oulu(self):
+    obj = fakes.FakeOuluLDAPDataSource(base_dn='DC=edu,DC=fake', host='fake', username='fake',
+        password='fake', users=30)
+    data = obj.get_data(base64.b64encode(fakes.object_guid('fake3')))
+    self.assertEqual(data['last_name'], 'Last3')
+    request = RequestFactory().get('/', {'group': '3A'})
+    for user in obj.iter_user_data(request):
+      self.assertEqual(user['roles'][0]['group'], '3A')
+
+
+class TestFakeBackendServer(TestCase):
+
+  def setUp(self):
+    self.server = fakes.FakeBackendServer(dataset=fakes.FakeDataset(30, 3)).start()
+    self.sources = self.server.external_sources()
+
+  def tearDown(self):
+    self.server.stop()
+
+  def test_dreamschool(self):
+    with mock.patch('authdata.datasources.dreamschool.requests', requests):
+      obj = DreamschoolDataSource(**self.sources['dreamschool'][2])
+      data = obj.get_data('5')
+      self.assertEqual(data['first_name'], 'First5')
+      self.assertEqual(obj.get_data('500'), None)
+      request = RequestFactory().get('/', {'municipality': 'fake', 'school': 'Fake school 2'})
+      with override_settings(AUTHDATA_DREAMSCHOOL_ORG_MAP=self.server.dreamschool_org_map()):
+        users = list(obj.iter_user_data(request))
+    expected = [p for p in self.server.dataset.people if p.school == 1]
+    self.assertEqual(len(users), len(expected))
+    self.assertEqual(set(u['roles'][0]['school'] for u in users), set(['Fake school 2']))
+
+  def test_dreamschool_unauthorized(self):
+    response = requests.get('http://%s/dreamschool/api/2/users/1/' % self.server.host)
+    self.assertEqual(response.status_code, 401)
+
+  def test_wilma(self):
+    data = WilmaDataSource(**self.sources['wilma'][2]).get_data('fake2')
+    self.assertEqual(data['last_name'], 'Last2')
+
+  def test_wilma_checksum(self):
+    response = requests.get('http://%s/external/mpass?username=fake2&nonce=x&h=bad' % self.server.host)
+    self.assertEqual(response.status_code, 403)
+
+  def test_opinsys(self):
+    data = OpinsysDataSource(**self.sources['opinsys'][2]).get_data('fake4')
+    self.assertEqual(data['first_name'], 'First4')
+    self.assertEqual(data['roles'][0]['municipality'], 'Fake')
+
+  def test_gafe(self):
+    data = GafeDataSource(**self.sources['gafe'][2]).get_data('fake6@fake.invalid')
+    self.assertEqual(data['first_name'], 'First6')
+    self.assertEqual(data['attributes'], [{'name': 'legacyId', 'value': '6'}])
+
+  def test_errors(self):
+    self.server.behaviour = fakes.FakeBehaviour(error_rate=1.0)
+    response = requests.get('http://%s/v3/users/_by_id/fake1' % self.server.host, auth=('fake', 'fake'))
+    self.assertEqual(response.status_code, 503)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
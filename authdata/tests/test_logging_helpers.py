@@ -0,0 +1,216 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member, protected-access
+
+import os
+import gc
+import shutil
+import logging
+import logging.config
+import tempfile
+import StringIO
+import threading
+
+import mock
+
+from django.conf import settings
+from django.test import TestCase
+
+from project import logging_helpers
+
+
+class ListHandler(logging.Handler):
+
+  def __init__(self):
+    logging.Handler.__init__(self)
+    self.records = []
+
+  def emit(self, record):
+    self.records.append(record)
+
+
+class TestFilter(TestCase):
+
+  def test_lazy_json(self):
+    record = logging.LogRecord('foo', logging.INFO, __file__, 1, 'msg', None, None)
+    record.data = {'b': 1, 'a': [1, 2]}
+    with mock.patch('project.logging_helpers.json.dumps', wraps=logging_helpers.json.dumps) as dumps:
+      self.assertTrue(logging_helpers.Filter().filter(record))
+      self.assertEqual(dumps.call_count, 0)
+      self.assertEqual(str(record.data2), '{"a":[1,2],"b":1}')
+      self.assertEqual(str(record.data2), '{"a":[1,2],"b":1}')
+      self.assertEqual(dumps.call_count, 1)
+
+  def test_no_data(self):
+    record = logging.LogRecord('foo', logging.INFO, __file__, 1, 'msg', None, None)
+    logging_helpers.Filter().filter(record)
+    self.assertEqual(record.data, None)
+    self.assertEqual(str(record.data2), 'null')
+
+  def test_unserializable(self):
+    self.assertEqual(str(logging_helpers.LazyJSON({'a': object})), '{"a":"<type \'object\'>"}')
+
+
+class TestQueueHandler(TestCase):
+
+  def setUp(self):
+    self.target = ListHandler()
+    self.handler = logging_helpers.QueueHandler(handlers=[self.target])
+    self.logger = logging.getLogger('authdata.tests.queue')
+    self.logger.propagate = False
+    self.logger.addHandler(self.handler)
+
+  def tearDown(self):
+    self.logger.removeHandler(self.handler)
+    self.handler.close()
+    self.target.close()
+
+  def test_emit(self):
+    self.logger.warning('hello %s', 'world', extra={'data': {'a': 1}})
+    self.handler.close()
+    self.assertEqual(len(self.target.records), 1)
+    record = self.target.records[0]
+    self.assertEqual(record.getMessage(), 'hello world')
+    self.assertEqual(record.data, {'a': 1})
+    self.assertNotEqual(record.thread, None)
+
+  def test_exception(self):
+    try:
+      raise ValueError('foo')
+    except ValueError:
+      self.logger.exception('failed')
+    self.handler.close()
+    record = self.target.records[0]
+    self.assertEqual(record.exc_info, None)
+    self.assertIn('ValueError: foo', record.exc_text)
+
+  def test_level(self):
+    self.target.setLevel(logging.ERROR)
+    self.logger.warning('skipped')
+    self.logger.error('handled')
+    self.handler.close()
+    self.assertEqual([r.getMessage() for r in self.target.records], ['handled'])
+
+  def test_full(self):
+    blocked = threading.Event()
+    self.target.emit = lambda record: blocked.wait(5)
+    self.handler.queue_size = 1
+    for i in xrange(5):
+      self.logger.warning('message')
+    self.assertTrue(self.handler.dropped >= 3)
+    blocked.set()
+
+  def test_not_configured(self):
+    with self.assertRaises(ValueError):
+      logging_helpers.QueueHandler(handlers=['test_queue_target'])
+
+
+class TestQueueHandlerConfig(TestCase):
+
+  def setUp(self):
+    self.logger = logging.getLogger('authdata.tests.queue_config')
+
+  def tearDown(self):
+    for handler in self.logger.handlers[:]:
+      self.logger.removeHandler(handler)
+      handler.close()
+
+  def test_dict_config(self):
+    # The target is not attached to any logger, only the queue refers to it
+    logging.config.dictConfig({
+      'version': 1,
+      'disable_existing_loggers': False,
+      'handlers': {
+        'queue': {
+          '()': 'project.logging_helpers.QueueHandler',
+          'handlers': ['cfg://handlers.list'],
+        },
+        'list': {
+          '()': 'authdata.tests.test_logging_helpers.ListHandler',
+        },
+      },
+      'loggers': {
+        'authdata.tests.queue_config': {
+          'handlers': ['queue'],
+          'level': 'INFO',
+          'propagate': False,
+        },
+      },
+    })
+    gc.collect()
+    handler = self.logger.handlers[0]
+    self.logger.info('hello')
+    handler.close()
+    self.assertEqual([r.getMessage() for r in handler.handlers[0].records], ['hello'])
+
+
+class TestDeployedConfig(TestCase):
+  """
+  LOGGING of the settings deployed by ansible
+  """
+  template = os.path.join(settings.BASE_DIR, 'ansible', 'roles', 'mpass-data', 'templates', 'local_settings.py.j2')
+
+  def setUp(self):
+    self.loggers = [logging.getLogger(), logging.getLogger('django'), logging.getLogger('authdata')]
+    self.saved = [(logger.handlers[:], logger.level, logger.propagate) for logger in self.loggers]
+    self.directory = tempfile.mkdtemp()
+
+  def tearDown(self):
+    for logger, (handlers, level, propagate) in zip(self.loggers, self.saved):
+      for handler in logger.handlers:
+        if handler not in handlers:
+          handler.close()
+      logger.handlers = handlers
+      logger.setLevel(level)
+      logger.propagate = propagate
+    shutil.rmtree(self.directory)
+
+  def logging_settings(self):
+    # LOGGING is plain Python at the end of the template
+    with open(self.template) as template:
+      source = template.read()
+    namespace = {}
+    exec source[source.index('LOGGING = {'):] in namespace  # pylint: disable=exec-used
+    return namespace['LOGGING']
+
+  def test_dict_config(self):
+    config = self.logging_settings()
+    config['handlers']['file']['filename'] = os.path.join(self.directory, 'authdata.log')
+    try:
+      import logstash  # pylint: disable=unused-variable
+    except ImportError:
+      # python-logstash is installed on the servers, no logger uses it
+      del config['handlers']['logstash']
+    with mock.patch('sys.stderr', new_callable=StringIO.StringIO) as console:
+      logging.config.dictConfig(config)
+    gc.collect()
+    logging.getLogger('authdata.tests').info('deployed')
+    logging.getLogger('authdata').handlers[0].close()
+    self.assertIn('deployed', console.getvalue())
+    with open(config['handlers']['file']['filename']) as log:
+      self.assertIn('deployed', log.read())
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
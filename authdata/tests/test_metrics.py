@@ -0,0 +1,93 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+from prometheus_client import REGISTRY
+
+from rest_framework.test import APITestCase
+
+from django.test import TestCase
+from django.test import override_settings
+
+from authdata import timing
+from authdata.datasources.base import ExternalDataSource
+from authdata.tests import factories as f
+
+
+def sample(name, **labels):
+  return REGISTRY.get_sample_value(name, labels) or 0
+
+
+class TestMetrics(TestCase):
+
+  def test_backend(self):
+    before = sample('authdata_backend_calls_total', source='foo', outcome='ok')
+    errors = sample('authdata_backend_calls_total', source='foo', outcome='error')
+    with timing.backend('foo'):
+      pass
+    with self.assertRaises(IOError):
+      with timing.backend('foo'):
+        raise IOError
+    self.assertEqual(sample('authdata_backend_calls_total', source='foo', outcome='ok'), before + 1)
+    self.assertEqual(sample('authdata_backend_calls_total', source='foo', outcome='error'), errors + 1)
+    self.assertTrue(sample('authdata_backend_duration_seconds_count', source='foo') >= 2)
+
+  def test_cache(self):
+    before = sample('authdata_cache_lookups_total', cache='foo', result='hit')
+    timing.cache('foo', True)
+    self.assertEqual(sample('authdata_cache_lookups_total', cache='foo', result='hit'), before + 1)
+
+  def test_provisioning(self):
+    obj = ExternalDataSource()
+    obj.external_source = 'foo'
+    created = sample('authdata_provisioned_users_total', source='foo', created='true')
+    updated = sample('authdata_provisioned_users_total', source='foo', created='false')
+    obj.provision_user('oid1', 'ext1')
+    obj.provision_user('oid1', 'ext1')
+    self.assertEqual(sample('authdata_provisioned_users_total', source='foo', created='true'), created + 1)
+    self.assertEqual(sample('authdata_provisioned_users_total', source='foo', created='false'), updated + 1)
+
+
+class TestMetricsView(APITestCase):
+
+  def test_requests(self):
+    self.client.force_authenticate(user=f.UserFactory())
+    before = sample('authdata_requests_total', view='UserViewSet', method='GET', status='200')
+    self.client.get('/api/1/user/')
+    self.assertEqual(sample('authdata_requests_total', view='UserViewSet', method='GET', status='200'), before + 1)
+    self.assertTrue(sample('authdata_request_duration_seconds_count', view='UserViewSet', method='GET') >= 1)
+
+  def test_metrics(self):
+    response = self.client.get('/metrics')
+    self.assertEqual(response.status_code, 200)
+    self.assertIn('authdata_requests_total', response.content)
+
+  @override_settings(AUTHDATA_METRICS_ALLOWED_IPS=())
+  def test_forbidden(self):
+    response = self.client.get('/metrics')
+    self.assertEqual(response.status_code, 403)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
@@ -0,0 +1,126 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import collections
+
+import mock
+
+from rest_framework.test import APITestCase
+
+from django.db import connection
+from django.test import TestCase
+from django.test import override_settings
+
+from authdata import timing
+from authdata.datasources.base import ExternalDataSource
+from authdata.datasources.base import LRUCache
+from authdata.tests import factories as f
+
+
+class TestTiming(TestCase):
+
+  def tearDown(self):
+    timing.stop()
+
+  def test_not_timed(self):
+    self.assertEqual(timing.current(), None)
+    with timing.backend('foo'):
+      pass
+    timing.cache('foo', True)
+
+  def test_backend(self):
+    request_timing = timing.start()
+    obj = ExternalDataSource()
+    obj.external_source = 'foo'
+    with obj.timed():
+      pass
+    with obj.timed():
+      pass
+    self.assertEqual(request_timing.backends['foo'][0], 2)
+    self.assertIn('backend-foo;dur=', request_timing.server_timing())
+    self.assertEqual(request_timing.log_data()['backends']['foo']['calls'], 2)
+
+  def test_backend_exception(self):
+    request_timing = timing.start()
+    with self.assertRaises(ValueError):
+      with timing.backend('foo'):
+        raise ValueError
+    self.assertEqual(request_timing.backends['foo'][0], 1)
+
+  def test_cache(self):
+    request_timing = timing.start()
+    cache = LRUCache(10, name='foo')
+    cache.get('a')
+    cache.set('a', 1)
+    self.assertEqual(cache.get('a'), 1)
+    LRUCache(10).get('a')
+    self.assertEqual(request_timing.caches.items(), [('foo', [1, 1])])
+    self.assertIn('cache-foo;desc="1 hits, 1 misses"', request_timing.server_timing())
+
+
+class TestTimingMiddleware(APITestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client.force_authenticate(user=self.user)
+    f.AttendanceFactory.create_batch(2)
+
+  @override_settings(AUTHDATA_TIMING_SAMPLE_RATE=1.0)
+  def test_timed(self):
+    with mock.patch('authdata.middleware.LOG') as log_mock:
+      response = self.client.get('/api/1/user/')
+    self.assertEqual(response.status_code, 200)
+    header = response['Server-Timing']
+    self.assertIn('db;dur=', header)
+    self.assertIn('render;dur=', header)
+    self.assertIn('total;dur=', header)
+    data = log_mock.info.call_args[1]['extra']['data']
+    self.assertEqual(data['view'], 'UserViewSet')
+    self.assertEqual(data['status'], 200)
+    self.assertTrue(data['db_queries'] > 0)
+    self.assertEqual(timing.current(), None)
+
+  @override_settings(AUTHDATA_TIMING_SAMPLE_RATE=1.0)
+  def test_full_query_log(self):
+    queries_log = connection.queries_log
+    # The log is cleared when a request starts, a short one fills up
+    connection.queries_log = collections.deque(maxlen=2)
+    try:
+      with mock.patch('authdata.middleware.LOG') as log_mock:
+        self.client.get('/api/1/user/')
+    finally:
+      connection.queries_log = queries_log
+    data = log_mock.info.call_args[1]['extra']['data']
+    self.assertTrue(data['db_queries'] > 2)
+
+  @override_settings(AUTHDATA_TIMING_SAMPLE_RATE=0.0)
+  def test_not_sampled(self):
+    response = self.client.get('/api/1/user/')
+    self.assertEqual(response.status_code, 200)
+    self.assertFalse(response.has_header('Server-Timing'))
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
@@ -24,6 +24,7 @@
 # THE SOFTWARE.
 # pylint: disable=locally-disabled, no-member
 
+from django.db import IntegrityError
 from django.test import TestCase
 from authdata.tests import factories as f
 from authdata import models
@@ -132,6 +133,23 @@ class TestAttendance(TestCase):
     self.assertIn(u'Ääkkösmunicipality', unicode(o))
 
 
+class TestDreamschoolOrganisation(TestCase):
+  def test_dreamschoolorganisation(self):
+    o = f.DreamschoolOrganisationFactory(school=u'Ääkkösschool',
+        municipality=u'Ääkkösmunicipality', org_id=3)
+    self.assertTrue(o)
+    self.assertTrue(o.created)
+    self.assertTrue(o.modified)
+    self.assertIn(u'ääkkösschool', unicode(o))
+    self.assertIn(u'ääkkösmunicipality', unicode(o))
+    self.assertIn(u'3', unicode(o))
+
+  def test_unique(self):
+    f.DreamschoolOrganisationFactory(school=u'school', municipality=u'municipality', org_id=3)
+    with self.assertRaises(IntegrityError):
+      f.DreamschoolOrganisationFactory(school=u'School', municipality=u'MUNICIPALITY', org_id=4)
+
+
 class TestTimeStampedModel(TestCase):
   def test_timestampedmodel(self):
     o = models.TimeStampedModel()
@@ -0,0 +1,175 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import unittest
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+
+from authdata import partitions
+from authdata.models import Attendance, UserAttribute
+from authdata.tests import factories as f
+
+
+class TestPartitionSQL(TestCase):
+
+  def setUp(self):
+    self.source = f.SourceFactory()
+
+  def test_partition(self):
+    statements = partitions.partition_sql(Attendance, [2, 1], '"authdata_attendance_id_seq"',
+        ['CREATE INDEX i ON authdata_attendance USING btree (user_id)'],
+        [('fk', 'FOREIGN KEY (user_id) REFERENCES authdata_user(id) DEFERRABLE INITIALLY DEFERRED')])
+    self.assertEqual(statements, [
+      'ALTER TABLE "authdata_attendance" RENAME TO "authdata_attendance_unpartitioned"',
+      'CREATE TABLE "authdata_attendance" (LIKE "authdata_attendance_unpartitioned" INCLUDING DEFAULTS INCLUDING STORAGE) PARTITION BY LIST (data_source_id)',
+      'CREATE TABLE "authdata_attendance_p1" PARTITION OF "authdata_attendance" FOR VALUES IN (1)',
+      'CREATE TABLE "authdata_attendance_p2" PARTITION OF "authdata_attendance" FOR VALUES IN (2)',
+      'CREATE TABLE "authdata_attendance_default" PARTITION OF "authdata_attendance" DEFAULT',
+      'INSERT INTO "authdata_attendance" SELECT * FROM "authdata_attendance_unpartitioned"',
+      'ALTER SEQUENCE "authdata_attendance_id_seq" OWNED BY "authdata_attendance".id',
+      'DROP TABLE "authdata_attendance_unpartitioned"',
+      'ALTER TABLE "authdata_attendance" ADD PRIMARY KEY (id, data_source_id)',
+      'CREATE INDEX i ON authdata_attendance USING btree (user_id)',
+      'ALTER TABLE "authdata_attendance" ADD CONSTRAINT "fk" FOREIGN KEY (user_id) REFERENCES authdata_user(id) DEFERRABLE INITIALLY DEFERRED',
+    ])
+
+  def test_staging(self):
+    staging = 'authdata_userattribute_p%d_staging' % self.source.pk
+    self.assertEqual(partitions.staging_sql(UserAttribute, self.source), [
+      'CREATE TABLE "%s" (LIKE "authdata_userattribute" INCLUDING DEFAULTS)' % staging,
+      'ALTER TABLE "%s" ADD CONSTRAINT "%s_source" CHECK (data_source_id IS NOT NULL AND data_source_id = %d)' % (
+          staging, staging, self.source.pk),
+    ])
+
+  def test_attach(self):
+    partition = 'authdata_attendance_p%d' % self.source.pk
+    attach = [
+      'ALTER TABLE "%s_staging" RENAME TO "%s"' % (partition, partition),
+      'ALTER TABLE "authdata_attendance" ATTACH PARTITION "%s" FOR VALUES IN (%d)' % (partition, self.source.pk),
+    ]
+    self.assertEqual(partitions.attach_sql(Attendance, self.source, current=True), [
+      'ALTER TABLE "authdata_attendance" DETACH PARTITION "%s"' % partition,
+      'DROP TABLE "%s"' % partition,
+    ] + attach)
+    self.assertEqual(partitions.attach_sql(Attendance, self.source, current=True, keep=True)[1],
+        'ALTER TABLE "%s" RENAME TO "%s_detached"' % (partition, partition))
+    self.assertEqual(partitions.attach_sql(Attendance, self.source, current=False), [
+      'DELETE FROM "authdata_attendance_default" WHERE data_source_id = %d' % self.source.pk,
+    ] + attach)
+
+  def test_detach(self):
+    partition = 'authdata_attendance_p%d' % self.source.pk
+    self.assertEqual(partitions.detach_sql(Attendance, self.source, drop=True), [
+      'ALTER TABLE "authdata_attendance" DETACH PARTITION "%s"' % partition,
+      'DROP TABLE "%s"' % partition,
+    ])
+
+
+class TestPartitionCommands(TestCase):
+
+  @unittest.skipIf(connection.vendor == 'postgresql', 'Needs another database')
+  def test_not_postgresql(self):
+    source = f.SourceFactory(name='foo')
+    with self.assertRaises(CommandError):
+      call_command('partition_tables')
+    with self.assertRaises(CommandError):
+      call_command('source_partition', 'detach', 'attendance', source.name)
+
+  def test_unknown(self):
+    with self.assertRaises(CommandError):
+      call_command('partition_tables', 'user')
+    with self.assertRaises(CommandError):
+      call_command('source_partition', 'detach', 'attendance', 'doesnotexist')
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'Needs PostgreSQL')
+class TestPartitionPostgreSQL(TestCase):
+  """
+  Partitions the attendance table for real. PostgreSQL rolls the DDL back
+  with the transaction of the test.
+  """
+
+  def setUp(self):
+    if connection.pg_version < partitions.MIN_VERSION:
+      self.skipTest('Needs PostgreSQL 11 or later')
+    self.attendance = f.AttendanceFactory(group='old', data_source__name='first')
+    self.source = self.attendance.data_source
+    self.other = f.AttendanceFactory(data_source__name='second')
+    # Tables with pending foreign key checks can not be dropped, as if the
+    # rows had been committed before
+    with connection.cursor() as cursor:
+      cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+
+  def groups(self, source):
+    return sorted(Attendance.objects.filter(data_source=source).values_list('group', flat=True))
+
+  def load(self, staging, source, group):
+    with connection.cursor() as cursor:
+      cursor.execute('INSERT INTO %s (created, modified, user_id, school_id, role_id, "group", data_source_id) '
+          'SELECT created, modified, user_id, school_id, role_id, %%s, %%s FROM authdata_attendance '
+          'WHERE id = %%s' % partitions.quote(staging), [group, source.pk, self.other.pk])
+
+  def call(self, *args, **kwargs):
+    out = StringIO()
+    call_command(*args, stdout=out, **kwargs)
+    return out.getvalue()
+
+  def test_partition(self):
+    self.call('partition_tables', 'attendance')
+    with connection.cursor() as cursor:
+      self.assertTrue(partitions.is_partitioned(cursor, Attendance))
+      self.assertTrue(partitions.exists(cursor, partitions.partition_name(Attendance, self.source)))
+    self.assertEqual(Attendance.objects.count(), 2)
+    with self.assertRaises(CommandError):
+      self.call('partition_tables', 'attendance')
+
+    self.assertIn(partitions.staging_name(Attendance, self.source),
+        self.call('source_partition', 'staging', 'attendance', self.source.name))
+    self.load(partitions.staging_name(Attendance, self.source), self.source, 'new')
+    self.call('source_partition', 'attach', 'attendance', self.source.name)
+    self.assertEqual(self.groups(self.source), ['new'])
+    self.assertEqual(Attendance.objects.filter(data_source=self.other.data_source).count(), 1)
+
+    # A source added after partitioning has its rows in the default partition
+    source = f.SourceFactory(name='added')
+    f.AttendanceFactory(data_source=source, group='default')
+    self.call('source_partition', 'staging', 'attendance', source.name)
+    self.load(partitions.staging_name(Attendance, source), source, 'attached')
+    self.call('source_partition', 'attach', 'attendance', source.name)
+    self.assertEqual(self.groups(source), ['attached'])
+
+    self.call('source_partition', 'detach', 'attendance', self.source.name, drop=True)
+    self.assertEqual(self.groups(self.source), [])
+    with connection.cursor() as cursor:
+      self.assertFalse(partitions.exists(cursor, partitions.partition_name(Attendance, self.source)))
+    with self.assertRaises(CommandError):
+      self.call('source_partition', 'detach', 'attendance', self.source.name)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
@@ -0,0 +1,172 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import mock
+
+from rest_framework.test import APITestCase
+
+from django.test import TestCase
+
+from authdata import models
+from authdata.tests import factories as f
+from authdata.tests.querycount import QueryCountMixin
+from authdata.tests.querycount import create_users
+from authdata.tests.querycount import max_queries
+
+
+class TestMaxQueries(TestCase):
+
+  def test_within_budget(self):
+    with max_queries(1) as context:
+      models.User.objects.count()
+    self.assertEqual(len(context), 1)
+
+  def test_over_budget(self):
+    with self.assertRaises(AssertionError):
+      with max_queries(1):
+        models.User.objects.count()
+        models.User.objects.count()
+
+  def test_decorator(self):
+    @max_queries(0)
+    def count():
+      return models.User.objects.count()
+    with self.assertRaises(AssertionError):
+      count()
+
+
+class TestQueryBudgets(QueryCountMixin, APITestCase):
+  """
+  Query budgets of the API endpoints. The number of queries must not grow
+  with the number of users, attendances or attributes returned. Plain GETs
+  do not compute an ETag, conditional requests are answered with the
+  three queries of authdata.conditional.
+  """
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client.force_authenticate(user=self.user)
+    # UserSerializer returns the attributes written by the requesting user
+    self.data_source = f.SourceFactory(name=self.user.username)
+
+  def get(self, path, data=None):
+    response = self.client.get(path, data or {})
+    self.assertEqual(response.status_code, 200)
+    return response
+
+  def users(self, count, size, **kwargs):
+    return create_users(count, **dict(dict(attendances=size, attributes=size, data_source=self.data_source), **kwargs))
+
+  def test_query_username(self):
+    def fixture(size):
+      return self.users(1, size)[0].username
+    # the username is first resolved to its source, see
+    # ExternalDataSource.resolve_oid
+    self.assertConstantQueries(fixture, lambda username: self.get('/api/1/query/%s' % username), 4)
+
+  def test_query_external(self):
+    def fixture(size):
+      user = self.users(1, size)[0]
+      models.User.objects.filter(pk=user.pk).update(external_source='foo', external_id='bar')
+      return user.username
+    def request(username):
+      data = {'username': username, 'first_name': '', 'last_name': '', 'roles': [], 'attributes': []}
+      with mock.patch('authdata.views.get_external_user_data', return_value=data):
+        self.get('/api/1/query/%s' % username)
+    self.assertConstantQueries(fixture, request, 2)
+
+  def test_query_attribute(self):
+    def fixture(size):
+      user_attribute = models.UserAttribute.objects.filter(user=self.users(1, size)[0])[0]
+      return {user_attribute.attribute.name: user_attribute.value}
+    # inside a transaction authdata.cache does not keep a snapshot, the
+    # attribute name is looked up
+    self.assertConstantQueries(fixture, lambda params: self.get('/api/1/query', params), 4)
+
+  def test_user_list(self):
+    self.assertConstantQueries(lambda size: self.users(size, size),
+        lambda users: self.get('/api/1/user/'), 3)
+
+  def test_user_list_municipality(self):
+    def fixture(size):
+      school = f.SchoolFactory(data_source=self.data_source, municipality__data_source=self.data_source)
+      self.users(size, size, school=school)
+      return school
+    self.assertConstantQueries(fixture,
+        lambda school: self.get('/api/1/user/', {'municipality': school.municipality.name}), 3)
+
+  def test_user_list_school_group(self):
+    def fixture(size):
+      school = f.SchoolFactory(data_source=self.data_source, municipality__data_source=self.data_source)
+      self.users(size, size, school=school)
+      return school
+    self.assertConstantQueries(fixture,
+        lambda school: self.get('/api/1/user/', {'school': school.name, 'group': '7A'}), 3)
+
+  def test_user_list_changed_at(self):
+    self.assertConstantQueries(lambda size: self.users(size, size),
+        lambda users: self.get('/api/1/user/', {'changed_at': '0'}), 3)
+
+  def test_query_not_modified(self):
+    def fixture(size):
+      username = self.users(1, size)[0].username
+      return username, self.client.head('/api/1/query/%s' % username)['ETag']
+    def request(user):
+      username, etag = user
+      response = self.client.get('/api/1/query/%s' % username, HTTP_IF_NONE_MATCH=etag)
+      self.assertEqual(response.status_code, 304)
+    self.assertConstantQueries(fixture, request, 3)
+
+  def test_user_detail(self):
+    self.assertConstantQueries(lambda size: self.users(1, size)[0],
+        lambda user: self.get('/api/1/user/%d/' % user.pk), 3)
+
+  def test_attribute_list(self):
+    self.assertConstantQueries(lambda size: f.AttributeFactory.create_batch(size),
+        lambda attributes: self.get('/api/1/attribute/'), 1)
+
+  def test_userattribute_list(self):
+    self.assertConstantQueries(lambda size: self.users(size, 1, attributes=size),
+        lambda users: self.get('/api/1/userattribute/'), 1)
+
+  def test_municipality_list(self):
+    self.assertConstantQueries(lambda size: f.MunicipalityFactory.create_batch(size, data_source=self.data_source),
+        lambda municipalities: self.get('/api/1/municipality/'), 1)
+
+  def test_school_list(self):
+    self.assertConstantQueries(lambda size: f.SchoolFactory.create_batch(size, data_source=self.data_source),
+        lambda schools: self.get('/api/1/school/'), 1)
+
+  def test_role_list(self):
+    self.assertConstantQueries(lambda size: f.RoleFactory.create_batch(size),
+        lambda roles: self.get('/api/1/role/'), 1)
+
+  def test_attendance_list(self):
+    self.assertConstantQueries(lambda size: self.users(size, size),
+        lambda users: self.get('/api/1/attendance/'), 1)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
@@ -0,0 +1,69 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import datetime
+import decimal
+
+from django.test import TestCase
+from django.test import override_settings
+from rest_framework import renderers as drf_renderers
+
+from authdata import renderers
+
+
+DATA = {
+  'results': [{'username': u'foo', 'first_name': u'\xc4ke', 'last_name': u'\u2028', 'roles': [], 'attributes': None}],
+  'count': 1,
+  'created': datetime.datetime(2018, 1, 2, 3, 4, 5),
+  'value': decimal.Decimal('1.5'),
+}
+
+
+class TestJSONRenderer(TestCase):
+
+  def render(self, data=DATA, accepted_media_type=None):
+    return renderers.JSONRenderer().render(data, accepted_media_type)
+
+  def test_same_as_rest_framework(self):
+    expected = drf_renderers.JSONRenderer().render(DATA)
+    for path in (None, 'authdata.renderers.simplejson_dumps'):
+      with override_settings(AUTHDATA_JSON_DUMPS=path):
+        self.assertEqual(self.render(), expected)
+
+  @override_settings(AUTHDATA_JSON_DUMPS='authdata.renderers.simplejson_dumps')
+  def test_indent(self):
+    self.assertEqual(self.render(accepted_media_type='application/json; indent=2'),
+        drf_renderers.JSONRenderer().render(DATA, 'application/json; indent=2'))
+
+  @override_settings(AUTHDATA_JSON_DUMPS='authdata.doesnotexist.dumps')
+  def test_import_error(self):
+    self.assertEqual(self.render(), drf_renderers.JSONRenderer().render(DATA))
+
+  @override_settings(AUTHDATA_JSON_DUMPS='authdata.renderers.simplejson_dumps')
+  def test_none(self):
+    self.assertEqual(self.render(None), b'')
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
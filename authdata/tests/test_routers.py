@@ -0,0 +1,141 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+import time
+
+import mock
+
+from rest_framework.test import APITestCase
+
+from django.core.urlresolvers import resolve
+from django.http import Http404
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test import SimpleTestCase
+from django.test import override_settings
+
+from authdata import routers
+from authdata.middleware import ReplicaMiddleware
+from authdata.models import User
+from authdata.tests import factories as f
+from authdata.views import QueryView
+
+
+@override_settings(AUTHDATA_READ_REPLICAS=('replica',))
+class TestReplicaRouter(SimpleTestCase):
+
+  def setUp(self):
+    self.router = routers.ReplicaRouter()
+
+  def tearDown(self):
+    routers.stop()
+
+  def test_default(self):
+    self.assertEqual(self.router.db_for_read(User), None)
+    self.assertEqual(self.router.db_for_write(User), 'default')
+
+  def test_read_only(self):
+    with routers.read_only():
+      self.assertEqual(self.router.db_for_read(User), 'replica')
+    self.assertEqual(self.router.db_for_read(User), None)
+
+  def test_pinned_after_write(self):
+    with routers.read_only():
+      self.assertEqual(self.router.db_for_write(User), 'default')
+      self.assertTrue(routers.pinned())
+      self.assertEqual(self.router.db_for_read(User), None)
+
+  @override_settings(AUTHDATA_READ_REPLICAS=())
+  def test_no_replicas(self):
+    with routers.read_only():
+      self.assertEqual(self.router.db_for_read(User), None)
+
+  def test_allow_migrate(self):
+    self.assertTrue(self.router.allow_migrate('default', 'authdata'))
+    self.assertFalse(self.router.allow_migrate('replica', 'authdata'))
+
+
+@override_settings(AUTHDATA_READ_REPLICAS=('replica',), AUTHDATA_REPLICA_LAG_WINDOW=60)
+class TestReplicaMiddleware(SimpleTestCase):
+
+  def setUp(self):
+    self.factory = RequestFactory()
+    self.middleware = ReplicaMiddleware()
+
+  def tearDown(self):
+    routers.stop()
+
+  def read_only(self, path, method='get', data=None):
+    request = getattr(self.factory, method)(path, data or {})
+    return self.middleware.read_only(request, resolve(path).func)
+
+  def test_read_only_views(self):
+    self.assertTrue(self.read_only('/api/1/query/foo'))
+    self.assertTrue(self.read_only('/api/1/user/'))
+    self.assertTrue(self.read_only('/api/1/attribute/'))
+    self.assertTrue(self.read_only('/api/1/role/1/'))
+
+  def test_other_views(self):
+    self.assertFalse(self.read_only('/api/1/user/1/'))
+    self.assertFalse(self.read_only('/api/1/userattribute/'))
+    self.assertFalse(self.read_only('/api/1/user/', method='post'))
+    self.assertFalse(self.read_only('/api/1/userattribute/1/', method='delete'))
+
+  def test_changed_at(self):
+    self.assertTrue(self.read_only('/api/1/user/', data={'changed_at': str(time.time() - 120)}))
+    self.assertFalse(self.read_only('/api/1/user/', data={'changed_at': str(time.time() - 30)}))
+    self.assertFalse(self.read_only('/api/1/user/', data={'changed_at': 'foo'}))
+
+  def test_request(self):
+    request = self.factory.get('/api/1/user/')
+    self.middleware.process_view(request, resolve('/api/1/user/').func, (), {})
+    self.assertEqual(routers.current_replica(), 'replica')
+    self.middleware.process_response(request, HttpResponse())
+    self.assertEqual(routers.current_replica(), None)
+
+
+class TestQueryViewReplica(APITestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client.force_authenticate(user=self.user)
+
+  def tearDown(self):
+    routers.stop()
+
+  def test_missing_from_replica(self):
+    user = f.UserFactory(username='foo')
+    with mock.patch.object(QueryView, 'get_object', side_effect=[Http404, user]), \
+        mock.patch('authdata.routers.current_replica', side_effect=lambda: None if routers.pinned() else 'replica'), \
+        mock.patch('authdata.routers.pin', wraps=routers.pin) as pin, \
+        mock.patch('authdata.views.ExternalDataSource.resolve_oid', return_value=None):
+      response = self.client.get('/api/1/query/foo')
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual(response.data['username'], 'foo')
+    self.assertTrue(pin.called)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
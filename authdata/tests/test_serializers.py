@@ -4,6 +4,8 @@
 
 from mock import Mock
 from django.test import TestCase
+from authdata import models
+from authdata import renderers
 from authdata import serializers
 from authdata.tests import factories as f
 
@@ -45,6 +47,19 @@ class TestQuerySerializer(TestCase):
     self.assertEqual(data[0], d)
 
 
+class TestQuerySerializerRepresentation(TestCase):
+
+  def test_same_as_fields(self):
+    user_obj = f.UserFactory()
+    f.UserAttributeFactory(user=user_obj)
+    f.AttendanceFactory(user=user_obj)
+    for serializer_class in (serializers.QuerySerializer, serializers.UserSerializer):
+      data = serializer_class(user_obj).data
+      fields = super(serializers.QuerySerializer, serializer_class(user_obj)).to_representation(user_obj)
+      self.assertEqual(data.keys(), fields.keys())
+      self.assertEqual(data, fields)
+
+
 class TestUserSerializer(TestCase):
 
   def test_attribute_data_no_request(self):
@@ -84,6 +99,29 @@ class TestUserSerializer(TestCase):
     self.assertEqual(data[0], d)
 
 
+class TestUserListData(TestCase):
+
+  def test_same_as_serializer(self):
+    source = f.SourceFactory(name=u'foo')
+    for i in xrange(3):
+      user_obj = f.UserFactory(external_id=str(i))
+      f.AttendanceFactory.create_batch(i, user=user_obj)
+      f.UserAttributeFactory.create_batch(2, user=user_obj, data_source=source)
+      f.UserAttributeFactory(user=user_obj)
+      disabled = f.UserAttributeFactory(user=user_obj, data_source=source)
+      disabled.disabled_at = disabled.modified
+      disabled.save()
+    request = Mock()
+    request.user.username = u'foo'
+    queryset = models.User.objects.all()
+    expected = serializers.UserSerializer(serializers.prefetch_user_data(queryset), many=True,
+        context={'request': request}).data
+    with self.assertNumQueries(3):
+      data = serializers.user_list_data(serializers.user_list_values(queryset), u'foo')
+    renderer = renderers.JSONRenderer()
+    self.assertEqual(renderer.render(data), renderer.render(expected))
+
+
 class TestUserAttributeSerializer(TestCase):
 
   def test_save(self):
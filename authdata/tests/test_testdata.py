@@ -0,0 +1,91 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+# pylint: disable=locally-disabled, no-member
+
+from StringIO import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from authdata import models
+from authdata.testdata import TestDataGenerator
+
+
+def snapshot():
+  return {
+    'users': list(models.User.objects.order_by('username').values_list('username', 'first_name', 'email')),
+    'attributes': list(models.UserAttribute.objects.order_by('user__username', 'attribute__name').values_list(
+        'user__username', 'attribute__name', 'value')),
+    'attendances': list(models.Attendance.objects.order_by('user__username', 'group').values_list(
+        'user__username', 'school__name', 'role__name', 'group')),
+  }
+
+
+class TestTestDataGenerator(TestCase):
+
+  def test_generate(self):
+    progress = []
+    TestDataGenerator(users=25, municipalities=2, schools=3, attributes=4,
+        max_attendances=3, batch_size=10).generate(progress=progress.append)
+    self.assertEqual(progress, [10, 20, 25])
+    self.assertEqual(models.User.objects.count(), 25)
+    self.assertEqual(models.Municipality.objects.count(), 2)
+    self.assertEqual(models.School.objects.count(), 6)
+    self.assertEqual(models.UserAttribute.objects.count(), 100)
+    self.assertTrue(25 <= models.Attendance.objects.count() <= 75)
+    for user in models.User.objects.all():
+      self.assertTrue(user.username.startswith('1.2.246.562.24.'))
+      attendances = user.attendances.all()
+      self.assertEqual(len(set(a.school.municipality_id for a in attendances)), 1)
+      self.assertEqual(len(set(a.role_id for a in attendances)), 1)
+    # Users are split evenly between municipalities
+    counts = [models.User.objects.filter(attendances__school__municipality=m).distinct().count()
+        for m in models.Municipality.objects.all()]
+    self.assertEqual(counts, [13, 12])
+
+  def test_deterministic(self):
+    TestDataGenerator(users=10, attributes=2, seed=5).generate()
+    first = snapshot()
+    models.User.objects.all().delete()
+    models.School.objects.all().delete()
+    models.Municipality.objects.all().delete()
+    TestDataGenerator(users=10, attributes=2, seed=5).generate()
+    self.assertEqual(snapshot(), first)
+
+  def test_append(self):
+    TestDataGenerator(users=5, seed=1).generate()
+    TestDataGenerator(users=5, seed=1).generate()
+    self.assertEqual(models.User.objects.count(), 10)
+    names = list(models.Municipality.objects.values_list('name', flat=True))
+    self.assertEqual(len(set(names)), len(names))
+    school_ids = list(models.School.objects.values_list('school_id', flat=True))
+    self.assertEqual(len(set(school_ids)), len(school_ids))
+
+  def test_create_test_data(self):
+    call_command('create_test_data', users=12, municipalities=3, schools=2, seed=1, stdout=StringIO())
+    self.assertEqual(models.User.objects.count(), 12)
+    self.assertEqual(models.School.objects.count(), 6)
+    self.assertEqual(models.UserAttribute.objects.count(), 120)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
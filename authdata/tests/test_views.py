@@ -24,16 +24,23 @@
 # THE SOFTWARE.
 # pylint: disable=locally-disabled, no-member, unused-argument
 
+import json
+
 import mock
 import requests
 
+from rest_framework.test import APIClient
 from rest_framework.test import APIRequestFactory
 from rest_framework.test import APITestCase
 from rest_framework.test import force_authenticate
 
 import django.http
+from django.db import connection
+from django.test import TransactionTestCase
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
+import authdata.cache
 import authdata.models
 import authdata.views
 import authdata.datasources.dreamschool
@@ -103,6 +110,9 @@ DS_EXPECTED = {
 }
 
 
+DS_EXPECTED_LISTING = dict(DS_EXPECTED, attributes=[])
+
+
 class TestAdminView(APITestCase):
 
   def setUp(self):
@@ -317,6 +327,129 @@ class TestQueryView(APITestCase):
     self.assertEqual(result.status_code, 404)
 
 
+class TestQueryViewAttributes(TransactionTestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client = APIClient()
+    self.client.force_authenticate(user=self.user)
+    self.attribute = f.UserAttributeFactory(user=self.user, attribute__name='oid', value='123')
+    # load the attribute names
+    self.client.get('/api/1/query', {'oid': 'foo'})
+
+  def tearDown(self):
+    authdata.cache.invalidate_all()
+
+  def test_known_attribute(self):
+    with CaptureQueriesContext(connection) as queries:
+      response = self.client.get('/api/1/query', {'oid': '123'})
+    self.assertEqual(response.data['username'], self.user.username)
+    self.assertNotIn('"authdata_attribute"."name"', queries[0]['sql'])
+
+  def test_unknown_attribute(self):
+    with self.assertNumQueries(0):
+      response = self.client.get('/api/1/query', {'foo': '123'})
+    self.assertEqual(response.status_code, 404)
+
+  @override_settings(AUTHDATA_REFERENCE_CACHE_MISS_TTL=0)
+  def test_new_attribute(self):
+    f.UserAttributeFactory.create(user=self.user, attribute__name='new', value='1')
+    authdata.models.Attribute.objects.filter(name='new').update(name='renamed')
+    response = self.client.get('/api/1/query', {'renamed': '1'})
+    self.assertEqual(response.data['username'], self.user.username)
+
+
+@override_settings(AUTH_EXTERNAL_SOURCES=AUTH_EXTERNAL_SOURCES)
+@override_settings(AUTH_EXTERNAL_ATTRIBUTE_BINDING=AUTH_EXTERNAL_ATTRIBUTE_BINDING)
+@override_settings(AUTHDATA_QUERY_BATCH_WORKERS=1)
+class TestQueryBatchView(TransactionTestCase):
+
+  def setUp(self):
+    self.user = f.UserFactory()
+    self.client = APIClient()
+    self.client.force_authenticate(user=self.user)
+    self.attribute = f.UserAttributeFactory(user=self.user, attribute__name='oid', value='123').attribute
+    self.other = f.UserFactory(username='other')
+
+  def tearDown(self):
+    authdata.cache.invalidate_all()
+
+  def post(self, queries):
+    return self.client.post('/api/1/query/batch', {'queries': queries}, format='json')
+
+  def test_local_users(self):
+    response = self.post([{'oid': '123'}, {'username': 'other'}, {'username': 'foo'}, {'foo': '123'}])
+    self.assertEqual(response.status_code, 200)
+    results = response.data['results']
+    self.assertEqual([r['query'] for r in results],
+        [{'oid': '123'}, {'username': 'other'}, {'username': 'foo'}, {'foo': '123'}])
+    self.assertEqual(results[0]['user']['username'], self.user.username)
+    self.assertEqual(results[1]['user']['username'], 'other')
+    self.assertEqual(results[2]['user'], None)
+    self.assertEqual(results[3]['user'], None)
+
+  def test_same_as_query(self):
+    response = self.post([{'oid': '123'}])
+    expected = self.client.get('/api/1/query', {'oid': '123'}).data
+    self.assertEqual(json.loads(json.dumps(response.data['results'][0]['user'])), json.loads(json.dumps(expected)))
+
+  def test_ambiguous(self):
+    f.UserAttributeFactory(user=self.other, attribute=self.attribute, value='123')
+    response = self.post([{'oid': '123'}])
+    self.assertEqual(response.data['results'][0]['user'], None)
+
+  def test_query_count(self):
+    self.post([{'oid': '123'}])
+    users = [f.UserFactory() for _ in xrange(10)]
+    for user in users:
+      f.UserAttributeFactory(user=user, attribute=self.attribute, value=user.username)
+    queries = [{'oid': user.username} for user in users[:5]] + [{'username': user.username} for user in users[5:]]
+    # user attributes, users by username, users by id and their prefetches
+    with self.assertNumQueries(7):
+      response = self.post(queries)
+    self.assertEqual(len([r for r in response.data['results'] if r['user']]), 10)
+
+  def test_external_user(self):
+    self.other.external_source = 'dreamschool'
+    self.other.external_id = '1'
+    self.other.save()
+    f.UserAttributeFactory(user=self.other, attribute__name='local', value='1')
+    with mock.patch('authdata.views.get_external_user_data') as ext_mock:
+      ext_mock.return_value = {'username': 'other', 'attributes': []}
+      response = self.post([{'username': 'other'}])
+    ext_mock.assert_called_once_with('dreamschool', '1')
+    self.assertEqual(response.data['results'][0]['user'],
+        {'username': 'other', 'attributes': [{'name': 'local', 'value': '1'}]})
+
+  def test_external_attribute(self):
+    with mock.patch('authdata.views.get_external_user_data') as ext_mock:
+      ext_mock.side_effect = [{'username': 'other', 'attributes': []}, None, ImportError]
+      response = self.post([{'dreamschool': 'a'}, {'dreamschool': 'b'}, {'ldap_test': 'c'}])
+    self.assertEqual([r['user'] for r in response.data['results']],
+        [{'username': 'other', 'attributes': []}, None, None])
+
+  @override_settings(AUTHDATA_QUERY_BATCH_WORKERS=4)
+  def test_external_concurrent(self):
+    with mock.patch('authdata.views.get_external_user_data') as ext_mock, \
+        mock.patch('authdata.views.connections') as connections_mock:
+      ext_mock.return_value = None
+      response = self.post([{'dreamschool': str(i)} for i in xrange(10)])
+    self.assertEqual(ext_mock.call_count, 10)
+    self.assertTrue(connections_mock.close_all.called)
+    self.assertEqual([r['query'] for r in response.data['results']], [{'dreamschool': str(i)} for i in xrange(10)])
+
+  def test_invalid(self):
+    self.assertEqual(self.client.post('/api/1/query/batch', [], format='json').status_code, 400)
+    response = self.post([{'username': 'other'}, {'a': '1', 'b': '2'}, {'a': 1}])
+    self.assertEqual(response.status_code, 400)
+    self.assertEqual([e['index'] for e in response.data['queries']], [1, 2])
+
+  @override_settings(AUTHDATA_QUERY_BATCH_MAX=1)
+  def test_too_many(self):
+    response = self.post([{'username': 'other'}, {'username': 'foo'}])
+    self.assertEqual(response.status_code, 400)
+
+
 class TestUserFilter(APITestCase):
 
   def test_timestamp_filter(self):
@@ -359,6 +492,23 @@ class TestUserViewSet(APITestCase):
     response = self.client.get('/api/1/user/?municipality=Bar')
     self.assertEquals(response.status_code, 200)
 
+  def test_list_user_data_stream(self, requests_mock):
+    ds_response_mock = mock.Mock()
+    ds_response_mock.status_code = 200
+    ds_response_mock.json.return_value = {'objects': [DS_DATA, dict(DS_DATA, username=u'user2')]}
+    requests_mock.get.return_value = ds_response_mock
+    requests_mock.codes = requests.codes
+
+    response = self.client.get('/api/1/user/?municipality=Bar&stream=true')
+    self.assertEquals(response.status_code, 200)
+    self.assertTrue(response.streaming)
+    self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+    lines = b''.join(response.streaming_content).splitlines()
+    self.assertEqual(len(lines), 2)
+    self.assertEqual(json.loads(lines[0]), DS_EXPECTED_LISTING)
+    # Users are provisioned while streaming
+    self.assertEqual(authdata.models.User.objects.filter(username__startswith='MPASSOID').count(), 2)
+
   def test_list_import_error(self, requests_mock):
     with mock.patch('authdata.views.importlib') as importlib_mock:
       importlib_mock.import_module = mock.Mock()
@@ -366,6 +516,14 @@ class TestUserViewSet(APITestCase):
       response = self.client.get('/api/1/user/?municipality=Bar')
     self.assertEquals(response.status_code, 200)
 
+  def test_municipality_binding(self, requests_mock):
+    self.assertEqual(authdata.views.municipality_binding('bar'), 'dreamschool')
+    self.assertEqual(authdata.views.municipality_binding('FOO'), 'ldap_test')
+    self.assertEqual(authdata.views.municipality_binding('Baz'), None)
+    with override_settings(AUTH_EXTERNAL_MUNICIPALITY_BINDING={'Baz': 'dreamschool'}):
+      self.assertEqual(authdata.views.municipality_binding('baz'), 'dreamschool')
+      self.assertEqual(authdata.views.municipality_binding('bar'), None)
+
 
 class TestAttributeViewSet(APITestCase):
 
@@ -0,0 +1,190 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Per-request timing.
+
+TimingMiddleware starts a RequestTiming for sampled requests. While a
+request is being timed, external data sources, caches and the renderer
+record into it through the functions of this module. External source calls
+and cache lookups are also counted in authdata.metrics for every request.
+"""
+
+import time
+import threading
+import collections
+from contextlib import contextmanager
+from authdata import metrics
+
+
+_local = threading.local()
+
+
+class RequestTiming(object):
+  """
+  Timings collected during one request. Durations are in seconds.
+  """
+
+  def __init__(self):
+    self.started = time.time()
+    self.db_queries = 0
+    self.db_time = 0.0
+    # name: [calls, seconds]
+    self.backends = collections.OrderedDict()
+    # name: [hits, misses]
+    self.caches = collections.OrderedDict()
+    self.render_time = 0.0
+
+  def add_backend(self, name, seconds):
+    entry = self.backends.setdefault(name, [0, 0.0])
+    entry[0] += 1
+    entry[1] += seconds
+
+  def add_cache(self, name, hit):
+    entry = self.caches.setdefault(name, [0, 0])
+    entry[0 if hit else 1] += 1
+
+  @property
+  def total_time(self):
+    return time.time() - self.started
+
+  def server_timing(self):
+    """
+    Value of the Server-Timing response header
+    """
+    metrics = ['db;dur=%.1f;desc="%d queries"' % (self.db_time * 1000, self.db_queries)]
+    for name, (calls, seconds) in self.backends.iteritems():
+      metrics.append('backend-%s;dur=%.1f;desc="%d calls"' % (name, seconds * 1000, calls))
+    for name, (hits, misses) in self.caches.iteritems():
+      metrics.append('cache-%s;desc="%d hits, %d misses"' % (name, hits, misses))
+    metrics.append('render;dur=%.1f' % (self.render_time * 1000))
+    metrics.append('total;dur=%.1f' % (self.total_time * 1000))
+    return ', '.join(metrics)
+
+  def log_data(self):
+    """
+    Timings as structured log fields, durations in milliseconds
+    """
+    return {
+      'total_ms': round(self.total_time * 1000, 1),
+      'db_queries': self.db_queries,
+      'db_ms': round(self.db_time * 1000, 1),
+      'backends': dict((name, {'calls': calls, 'ms': round(seconds * 1000, 1)})
+          for name, (calls, seconds) in self.backends.iteritems()),
+      'caches': dict((name, {'hits': hits, 'misses': misses})
+          for name, (hits, misses) in self.caches.iteritems()),
+      'render_ms': round(self.render_time * 1000, 1),
+    }
+
+
+class QueryLog(object):
+  """
+  Stands in for the ``queries_log`` of a database connection while a
+  request is timed and adds each logged query to the RequestTiming. The
+  queries are passed on to the original log, which is a bounded deque and
+  can not be used for counting once it is full.
+  """
+
+  def __init__(self, log, timing):
+    self.log = log
+    self.timing = timing
+
+  def append(self, query):
+    self.timing.db_queries += 1
+    self.timing.db_time += float(query['time'])
+    self.log.append(query)
+
+  def __len__(self):
+    return len(self.log)
+
+  def __iter__(self):
+    return iter(self.log)
+
+  def __getattr__(self, name):
+    return getattr(self.log, name)
+
+
+def start():
+  _local.timing = RequestTiming()
+  return _local.timing
+
+
+def stop():
+  timing = getattr(_local, 'timing', None)
+  _local.timing = None
+  return timing
+
+
+def current():
+  """
+  RequestTiming of the request being timed in this thread or None
+  """
+  return getattr(_local, 'timing', None)
+
+
+@contextmanager
+def backend(name):
+  """
+  Record the time spent in the block as external backend time
+  """
+  started = time.time()
+  error = True
+  try:
+    yield
+    error = False
+  finally:
+    seconds = time.time() - started
+    metrics.observe_backend(name, seconds, error)
+    timing = current()
+    if timing is not None:
+      timing.add_backend(name, seconds)
+
+
+@contextmanager
+def render():
+  """
+  Record the time spent in the block as rendering time
+  """
+  timing = current()
+  if timing is None:
+    yield
+    return
+  started = time.time()
+  try:
+    yield
+  finally:
+    timing.render_time += time.time() - started
+
+
+def cache(name, hit):
+  """
+  Record a cache hit or miss
+  """
+  metrics.observe_cache(name, hit)
+  timing = current()
+  if timing is not None:
+    timing.add_cache(name, hit)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
@@ -29,7 +29,8 @@ from django.conf.urls import *
 
 from django.contrib import admin
 from rest_framework import routers
-from authdata.views import QueryView
+from authdata.metrics import metrics_view
+from authdata.views import QueryView, QueryBatchView
 from authdata.views import UserViewSet, AttributeViewSet, UserAttributeViewSet, MunicipalityViewSet, SchoolViewSet, RoleViewSet, AttendanceViewSet
 
 router = routers.DefaultRouter()
@@ -46,9 +47,11 @@ router.register(r'attendance', AttendanceViewSet)
 # RR 2018-02-28
 urlpatterns = [
     url(r'^api/1/user$', QueryView.as_view()),  # This should be removed as "/user" and "/user/" are now different which is confusing. User "/query/" instead
+    url(r'^api/1/query/batch/?$', QueryBatchView.as_view()),
     url(r'^api/1/query(/(?P<username>[\w._-]+))?/?$', QueryView.as_view()),
     url(r'^api/1/', include(router.urls)),
     url(r'^sysadmin/', include(admin.site.urls)),
+    url(r'^metrics$', metrics_view),
 ]
 
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
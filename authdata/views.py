@@ -23,34 +23,97 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 # THE SOFTWARE.
 
+import json
 import logging
 import datetime
 import importlib
+from multiprocessing.pool import ThreadPool
+from django.db import connection
+from django.db import connections
 from django.db.models import Q
 from django.http import Http404
-from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from django.conf import settings
 from rest_framework import filters
 from rest_framework import generics
 from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.utils import encoders
 import django_filters
+from authdata.serializers import prefetch_user_data, user_list_data, user_list_values
 from authdata.serializers import QuerySerializer, UserSerializer, AttributeSerializer, UserAttributeSerializer, MunicipalitySerializer, SchoolSerializer, RoleSerializer, AttendanceSerializer
 from authdata.models import User, Attribute, UserAttribute, Municipality, School, Role, Attendance
+from authdata.parsers import NDJSONParser
+from authdata.datasources.base import ExternalDataSource
+from authdata import bulk
+from authdata import cache
+from authdata import conditional
+from authdata import documents
+from authdata import routers
 
 LOG = logging.getLogger(__name__)
 
 
-def get_external_user_data(external_source, external_id):
+def get_external_source(external_source):
   """
-  Raises ImportError if external source configuration is wrong
+  Returns a handler for the configured external source.
+
+  Raises KeyError if external source is not configured and ImportError if
+  external source configuration is wrong
   """
   source = settings.AUTH_EXTERNAL_SOURCES[external_source]
   LOG.debug('Trying to import module of external authentication source', extra={'data': {'module_name': source[0]}})
   handler_module = importlib.import_module(source[0])
   kwargs = source[2]
-  handler = getattr(handler_module, source[1])(**kwargs)
-  return handler.get_data(external_id)
+  return getattr(handler_module, source[1])(**kwargs)
+
+
+def get_external_user_data(external_source, external_id):
+  """
+  Raises ImportError if external source configuration is wrong
+  """
+  return get_external_source(external_source).get_data(external_id)
+
+
+_municipality_bindings = {}
+
+
+def municipality_binding(name):
+  """
+  The external source the municipality ``name`` is bound to in
+  settings.AUTH_EXTERNAL_MUNICIPALITY_BINDING, case-insensitively, or None.
+  The lowercased names are computed once per setting.
+  """
+  bindings = settings.AUTH_EXTERNAL_MUNICIPALITY_BINDING
+  cached = _municipality_bindings.get('lowered')
+  if cached is None or cached[0] is not bindings:
+    cached = (bindings, dict((binding_name.lower(), binding) for binding_name, binding in bindings.iteritems()))
+    _municipality_bindings['lowered'] = cached
+  return cached[1].get(name.lower())
+
+
+def local_attributes(user_obj=None, username=None):
+  """
+  Attributes stored locally for a user whose data comes from an external
+  source. The user is given as an object or by username.
+  """
+  if user_obj is None:
+    user_attributes = UserAttribute.objects.filter(user__username=username)
+  else:
+    user_attributes = user_obj.attributes.all()
+  return [{'name': user_attribute.attribute.name, 'value': user_attribute.value}
+      for user_attribute in user_attributes.select_related('attribute')]
+
+
+def json_lines(items):
+  """
+  Encode items as newline delimited JSON, one item at a time
+  """
+  for item in items:
+    yield json.dumps(item, cls=encoders.JSONEncoder, ensure_ascii=False).encode('utf-8') + '\n'
 
 
 class QueryView(generics.RetrieveAPIView):
@@ -71,37 +134,46 @@ class QueryView(generics.RetrieveAPIView):
   * the parameter name is not recognized
   * multiple results would be returned (only one result is allowed)
   * no parameters are specified
+
+  Responses of local users to HEAD requests and requests with
+  If-None-Match have an ETag, a conditional request is answered with
+  ``304 Not Modified`` if the user has not changed.
   """
-  queryset = User.objects.all()
+  queryset = prefetch_user_data(User.objects.all())
   serializer_class = QuerySerializer
   lookup_field = 'username'
+  replica_actions = ('get',)
 
+  @conditional.conditional('conditional_users', single=True)
   def get(self, request, *args, **kwargs):
+    if documents.enabled() and self.kwargs.get(self.lookup_field):
+      data = documents.query_document(self.kwargs[self.lookup_field])
+      if data is not None:
+        return Response(data)
+    username = self.kwargs.get(self.lookup_field)
+    if username:
+      # External users are served from their source without loading the
+      # local user and its roles
+      resolved = ExternalDataSource.resolve_oid(username)
+      if resolved is not None and all(resolved):
+        return self.external_response(resolved[0], resolved[1], username=username)
     # 1. look for a user object matching the query parameter. if it's found, check if it's an external user and fetch data
     try:
       user_obj = self.get_object()
     except Http404:
       user_obj = None
+    if user_obj is None and routers.current_replica() is not None:
+      # the user may have been provisioned after the replica was last updated
+      routers.pin()
+      try:
+        user_obj = self.get_object()
+      except Http404:
+        user_obj = None
     if user_obj:
       # local user object exists.
       if user_obj.external_source and user_obj.external_id:
         # user is an external user. fetch data from source.
-        try:
-          user_data = get_external_user_data(user_obj.external_source, user_obj.external_id)
-        except ImportError:
-          LOG.error('Can not import external authentication source', extra={'data': {'external_source': repr(user_obj.external_source)}})
-          return Response(None)
-        except KeyError:
-          LOG.error('External source not configured', extra={'data': {'external_source': repr(user_obj.external_source)}})
-          return Response(None)
-        if user_data is None:
-          # queried user does not exist in the external source
-          return Response(None)
-        for user_attribute in user_obj.attributes.all():
-          # Add attributes to user data
-          user_data['attributes'].append({'name': user_attribute.attribute.name, 'value': user_attribute.value})
-        LOG.debug('/query returning data', extra={'data': {'user_data': repr(user_data)}})
-        return Response(user_data)
+        return self.external_response(user_obj.external_source, user_obj.external_id, user_obj=user_obj)
     else:
       # 2. if user was not found and query parameter is mapped to an external source, fetch and create user
       for attr in request.GET.keys():
@@ -114,10 +186,10 @@ class QueryView(generics.RetrieveAPIView):
 
             # New users are created in data source
             user_obj = User.objects.get(username=user_data['username'])
-            for user_attribute in user_obj.attributes.all():
-              # Add attributes to user data
-              user_data['attributes'].append({'name': user_attribute.attribute.name, 'value': user_attribute.value})
-            LOG.debug('/query returning data', extra={'data': {'user_data': repr(user_data)}})
+            # Add attributes to user data
+            user_data['attributes'].extend(local_attributes(user_obj))
+            if LOG.isEnabledFor(logging.DEBUG):
+              LOG.debug('/query returning data', extra={'data': {'user_data': repr(user_data)}})
             return Response(user_data)
 
           except ImportError as e:
@@ -126,52 +198,252 @@ class QueryView(generics.RetrieveAPIView):
             # TODO: error handling
             # flow back to normal implementation most likely return empty
         break
-    return super(QueryView, self).get(request, *args, **kwargs)
-
-  def get_object(self):
-    qs = self.filter_queryset(self.get_queryset())
-    qs = qs.distinct()
+      raise Http404
+    # serialize the object already fetched instead of letting retrieve() query it again
+    return Response(self.get_serializer(user_obj).data)
+
+  def external_response(self, external_source, external_id, **user):
+    """
+    Response with the data of an external user and its local attributes
+    """
+    try:
+      user_data = get_external_user_data(external_source, external_id)
+    except ImportError:
+      LOG.error('Can not import external authentication source', extra={'data': {'external_source': repr(external_source)}})
+      return Response(None)
+    except KeyError:
+      LOG.error('External source not configured', extra={'data': {'external_source': repr(external_source)}})
+      return Response(None)
+    if user_data is None:
+      # queried user does not exist in the external source
+      return Response(None)
+    # Add attributes to user data
+    user_data['attributes'].extend(local_attributes(**user))
+    if LOG.isEnabledFor(logging.DEBUG):
+      LOG.debug('/query returning data', extra={'data': {'user_data': repr(user_data)}})
+    return Response(user_data)
+
+  def lookup_kwargs(self):
+    """
+    Filter of the queried user, raises Http404 if nothing can match
+    """
     filter_kwargs = {}
     lookup = self.kwargs.get(self.lookup_field, None)
     if lookup:
       filter_kwargs = {self.lookup_field: lookup}
     else:
       for k, v in self.request.GET.iteritems():
-        a = get_object_or_404(Attribute.objects.all(), name=k)
-        filter_kwargs['attributes__attribute__name'] = a.name
+        # Attribute names are known without a query, unknown ones are not
+        # looked up, see authdata.cache
+        attribute = cache.ATTRIBUTES.get(k, query_missing=False)
+        if attribute is None:
+          raise Http404
+        filter_kwargs['attributes__attribute_id'] = attribute.id
         filter_kwargs['attributes__value'] = v
         filter_kwargs['attributes__disabled_at__isnull'] = True
         break  # only handle one GET variable for now
       else:
         raise Http404
-    obj = generics.get_object_or_404(qs, **filter_kwargs)
+    return filter_kwargs
+
+  def conditional_users(self, request, *args, **kwargs):
+    try:
+      return User.objects.filter(**self.lookup_kwargs())
+    except Http404:
+      return None
+
+  def get_object(self):
+    qs = self.filter_queryset(self.get_queryset())
+    qs = qs.distinct()
+    obj = generics.get_object_or_404(qs, **self.lookup_kwargs())
     self.check_object_permissions(self.request, obj)
     return obj
 
 
+class QueryBatchView(generics.GenericAPIView):
+  """ Returns information about many users in one request.
+
+  POST ``{"queries": [{"username": "..."}, {"<attribute>": "<value>"}, ...]}``,
+  each query is one name and value like the parameter of ``/api/1/query``.
+  The results are returned in the order of the queries as
+  ``{"results": [{"query": {...}, "user": {...}}, ...]}``. ``user`` is null
+  where ``/api/1/query`` would return ``Not found`` or null.
+
+  Local users are looked up for all queries at once. External sources are
+  queried concurrently in settings.AUTHDATA_QUERY_BATCH_WORKERS threads.
+  """
+  queryset = prefetch_user_data(User.objects.all())
+  serializer_class = QuerySerializer
+
+  def post(self, request, *args, **kwargs):
+    queries, errors = self.validate(request.data)
+    if errors:
+      return Response({'queries': errors}, status=400)
+    users = self.local_users(queries)
+    external = []
+    for index, (name, value) in enumerate(queries):
+      user_obj = users.get(index)
+      if user_obj is not None and user_obj.external_source and user_obj.external_id:
+        external.append((index, user_obj.external_source, user_obj.external_id, user_obj))
+      elif user_obj is None and name in settings.AUTH_EXTERNAL_ATTRIBUTE_BINDING:
+        external.append((index, settings.AUTH_EXTERNAL_ATTRIBUTE_BINDING[name], value, None))
+    results = dict(self.fetch_external(external))
+    for index, user_obj in users.iteritems():
+      if index not in results:
+        results[index] = self.get_serializer(user_obj).data
+    return Response({'results': [{'query': {name: value}, 'user': results.get(index)}
+        for index, (name, value) in enumerate(queries)]})
+
+  def validate(self, data):
+    """
+    Returns the queries as (name, value) pairs and the errors by index
+    """
+    queries = data.get('queries') if isinstance(data, dict) else None
+    if not isinstance(queries, list):
+      return [], ['Expected a list of queries.']
+    max_queries = getattr(settings, 'AUTHDATA_QUERY_BATCH_MAX', 1000)
+    if len(queries) > max_queries:
+      return [], ['Ensure there are no more than %d queries.' % max_queries]
+    pairs = []
+    errors = []
+    for index, query in enumerate(queries):
+      if not isinstance(query, dict) or len(query) != 1:
+        errors.append({'index': index, 'errors': ['Expected an object with one name and value.']})
+        continue
+      name, value = query.items()[0]
+      if not isinstance(value, basestring) or not value:
+        errors.append({'index': index, 'errors': ['Not a valid string.']})
+        continue
+      pairs.append((name, value))
+    return pairs, errors
+
+  def local_users(self, queries):
+    """
+    Returns the local user of each query by index. Queries matching more
+    than one user are left out like in /api/1/query.
+    """
+    usernames = set()
+    values = {}
+    for name, value in queries:
+      if name == 'username':
+        usernames.add(value)
+        continue
+      # Attribute names are known without a query, see authdata.cache
+      attribute = cache.ATTRIBUTES.get(name, query_missing=False)
+      if attribute is not None:
+        values.setdefault(attribute.id, set()).add(value)
+    matches = {}
+    for attribute_id, attribute_values in values.iteritems():
+      for chunk in bulk.chunks(list(attribute_values)):
+        rows = UserAttribute.objects.filter(attribute_id=attribute_id, value__in=chunk,
+            disabled_at__isnull=True).values_list('value', 'user_id')
+        for value, user_id in rows:
+          matches.setdefault((attribute_id, value), set()).add(user_id)
+    user_ids = set()
+    for ids in matches.itervalues():
+      if len(ids) == 1:
+        user_ids.update(ids)
+    by_username = {}
+    by_id = {}
+    qs = self.get_queryset()
+    for chunk in bulk.chunks(list(usernames)):
+      for user_obj in qs.filter(username__in=chunk):
+        by_username[user_obj.username] = by_id[user_obj.id] = user_obj
+    for chunk in bulk.chunks(list(user_ids - set(by_id))):
+      for user_obj in qs.filter(id__in=chunk):
+        by_id[user_obj.id] = user_obj
+    users = {}
+    for index, (name, value) in enumerate(queries):
+      if name == 'username':
+        user_obj = by_username.get(value)
+      else:
+        attribute = cache.ATTRIBUTES.get(name, query_missing=False)
+        ids = matches.get((attribute.id, value), ()) if attribute is not None else ()
+        user_obj = by_id.get(next(iter(ids))) if len(ids) == 1 else None
+      if user_obj is not None:
+        users[index] = user_obj
+    return users
+
+  def fetch_external(self, lookups):
+    """
+    Fetches the data of (index, external source, external id, local user)
+    lookups concurrently. Returns (index, user data or None) pairs.
+    """
+    workers = min(getattr(settings, 'AUTHDATA_QUERY_BATCH_WORKERS', 8), len(lookups))
+    if workers <= 1:
+      return [self.fetch_external_user(lookup) for lookup in lookups]
+    pool = ThreadPool(workers)
+    try:
+      return pool.map(self.fetch_external_user_in_thread, lookups)
+    finally:
+      pool.close()
+      pool.join()
+
+  def fetch_external_user_in_thread(self, lookup):
+    try:
+      return self.fetch_external_user(lookup)
+    finally:
+      # the thread's connections are not closed at the end of the request
+      connections.close_all()
+
+  def fetch_external_user(self, lookup):
+    index, external_source, external_id, user_obj = lookup
+    try:
+      user_data = get_external_user_data(external_source, external_id)
+    except ImportError:
+      LOG.error('Can not import external authentication source', extra={'data': {'external_source': repr(external_source)}})
+      return index, None
+    except KeyError:
+      LOG.error('External source not configured', extra={'data': {'external_source': repr(external_source)}})
+      return index, None
+    if user_data is None:
+      # queried user does not exist in the external source
+      return index, None
+    if user_obj is None:
+      # New users are created in data source
+      try:
+        user_obj = User.objects.get(username=user_data['username'])
+      except User.DoesNotExist:
+        return index, None
+    # Add attributes to user data
+    user_data['attributes'].extend(local_attributes(user_obj))
+    return index, user_data
+
+
 class UserFilter(django_filters.FilterSet):
   municipality = django_filters.CharFilter(name='attendances__school__municipality__name', lookup_expr='iexact')
   school = django_filters.CharFilter(name='attendances__school__name', lookup_expr='iexact')
   group = django_filters.CharFilter(name='attendances__group', lookup_expr='iexact')
   # changed_at = django_filters.MethodFilter(action='timestamp_filter')
   # RR 2018-02-28
-  changed_at = django_filters.BooleanFilter(name='attendance__timestamp__validity', method='timestamp_filter')
+  changed_at = django_filters.CharFilter(method='filter_changed_at')
 
+  def filter_changed_at(self, queryset, name, value):
+    return self.timestamp_filter(queryset, value)
 
   def timestamp_filter(self, queryset, value):
     # TODO: this is unaware of removed UserAttributes
     try:
-      tstamp = datetime.datetime.fromtimestamp(float(value))
+      tstamp = datetime.datetime.fromtimestamp(float(value), timezone.utc)
     except ValueError:
       return queryset.none()
+    if documents.enabled():
+      # A document is refreshed or deleted whenever any of the data below
+      # changes. Users without a document are included.
+      return queryset.filter(Q(document__modified__gte=tstamp) | Q(document__isnull=True))
     by_user = Q(modified__gte=tstamp)
     by_user_attribute = Q(attributes__modified__gte=tstamp)
+    # removed attributes moved out of UserAttribute, see authdata.archive
+    by_archived_attribute = Q(archived_attributes__modified__gte=tstamp)
     by_attribute_name = Q(attributes__attribute__modified__gte=tstamp)
     by_attendance = Q(attendances__modified__gte=tstamp)
     by_role_name = Q(attendances__role__modified__gte=tstamp)
-    # SELECT DISTINCT ON ("authdata_user"."id") - makes this query perform a lot faster,
-    # but is ONLY compatible with PostgreSQL!
-    return queryset.filter(by_user | by_user_attribute | by_attribute_name | by_attendance | by_role_name).distinct('id')
+    queryset = queryset.filter(by_user | by_user_attribute | by_archived_attribute | by_attribute_name | by_attendance | by_role_name)
+    if connection.vendor == 'postgresql':
+      # SELECT DISTINCT ON ("authdata_user"."id") - makes this query perform a lot faster,
+      # but is ONLY compatible with PostgreSQL!
+      return queryset.distinct('id')
+    return queryset.distinct()
 
   class Meta:
     model = User
@@ -179,7 +451,7 @@ class UserFilter(django_filters.FilterSet):
 
 
 class UserViewSet(viewsets.ModelViewSet):
-  queryset = User.objects.all().distinct()
+  queryset = prefetch_user_data(User.objects.all().distinct())
   serializer_class = UserSerializer
   # filter_backends = (filters.DjangoFilterBackend,)
   # Removed DjangoFilterBackend inline with deprecation policy. Use django_filters.rest_framework.FilterSet and/or 
@@ -187,18 +459,43 @@ class UserViewSet(viewsets.ModelViewSet):
   # RR 2018-02-28
   filter_backends = (django_filters.rest_framework.DjangoFilterBackend,)
   filter_class = UserFilter
-
+  replica_actions = ('list',)
+
+  def external_municipality(self, request):
+    """
+    The external source the queried municipality is bound to or None
+    """
+    if 'municipality' not in request.GET:
+      return None
+    return municipality_binding(request.GET['municipality'])
+
+  def conditional_users(self, request, *args, **kwargs):
+    # Aggregating an unfiltered listing costs more than serializing a page
+    if not set(request.GET) & set(self.filter_class.base_filters) or self.external_municipality(request) is not None:
+      return None
+    return self.filter_queryset(self.get_queryset())
+
+  @conditional.conditional('conditional_users')
   def list(self, request, *args, **kwargs):
-    if 'municipality' in request.GET and request.GET['municipality'].lower() in [binding_name.lower() for binding_name in settings.AUTH_EXTERNAL_MUNICIPALITY_BINDING.keys()]:
-      for binding_name, binding in settings.AUTH_EXTERNAL_MUNICIPALITY_BINDING.iteritems():
-        if binding_name.lower() == request.GET['municipality'].lower():
-          source = settings.AUTH_EXTERNAL_SOURCES[binding]
+    """
+    Municipalities bound to an external source are listed from the source.
+    With ``stream=true`` the users of an external source are streamed as
+    newline delimited JSON as they are fetched, instead of a paginated
+    listing.
+
+    Filtered listings of local users can be validated with an ETag, see
+    authdata.conditional.
+    """
+    external_source = self.external_municipality(request)
+    if external_source is not None:
       try:
-        handler_module = importlib.import_module(source[0])
-        k = source[2]
-        handler = getattr(handler_module, source[1])(**k)
+        handler = get_external_source(external_source)
+        if request.GET.get('stream', '').lower() in ('1', 'true'):
+          return StreamingHttpResponse(json_lines(handler.iter_user_data(request)),
+              content_type='application/x-ndjson; charset=utf-8')
         user_data = handler.get_user_data(request)
-        LOG.debug('/user returning data', extra={'data': {'user_data': repr(user_data)}})
+        if LOG.isEnabledFor(logging.DEBUG):
+          LOG.debug('/user returning data', extra={'data': {'user_data': repr(user_data)}})
         return Response(user_data)
       except ImportError as e:
         LOG.error('Could not import external data source',
@@ -206,12 +503,44 @@ class UserViewSet(viewsets.ModelViewSet):
         # TODO: error handling
         # flow back to normal implementation most likely return empty
 
-    return super(UserViewSet, self).list(request, *args, **kwargs)
+    queryset = self.filter_queryset(self.get_queryset())
+    # Only the columns in the output are read, see user_list_data()
+    users = user_list_values(queryset)
+    page = self.paginate_queryset(users)
+    list_data = documents.list_documents if documents.enabled() else user_list_data
+    if page is not None:
+      return self.get_paginated_response(list_data(page, request.user.username))
+    return Response(list_data(users, request.user.username))
+
+
+class BulkMixin(object):
+  """
+  Adds ``bulk/`` to a viewset for writing many objects in one request.
+
+  POST a JSON list or newline delimited JSON (application/x-ndjson) of
+  objects, ``mode`` is one of create, update or upsert (default). Objects
+  refer to other objects by name, see authdata.bulk. Nothing is written if
+  any object is invalid, the errors are returned by list index.
+  """
+  bulk_writer_class = None
+
+  @action(detail=False, methods=['post'], parser_classes=(JSONParser, NDJSONParser))
+  def bulk(self, request):
+    mode = request.query_params.get('mode', 'upsert')
+    if mode not in bulk.MODES:
+      return Response({'mode': ['Must be one of %s.' % ', '.join(bulk.MODES)]}, status=400)
+    data_source, _ = cache.SOURCES.get_or_create(request.user.username)
+    try:
+      result = self.bulk_writer_class(data_source, mode).write(request.data)
+    except bulk.BulkError as e:
+      return Response({'errors': e.errors}, status=400)
+    return Response(result)
 
 
 class AttributeViewSet(viewsets.ReadOnlyModelViewSet):
   queryset = Attribute.objects.all()
   serializer_class = AttributeSerializer
+  replica_actions = ('list', 'retrieve')
 
 
 class UserAttributeFilter(django_filters.FilterSet):
@@ -223,9 +552,10 @@ class UserAttributeFilter(django_filters.FilterSet):
     fields = ['user', 'attribute']
 
 
-class UserAttributeViewSet(viewsets.ModelViewSet):
-  queryset = UserAttribute.objects.filter(disabled_at__isnull=True)
+class UserAttributeViewSet(BulkMixin, viewsets.ModelViewSet):
+  queryset = UserAttribute.objects.filter(disabled_at__isnull=True).select_related('user', 'attribute')
   serializer_class = UserAttributeSerializer
+  bulk_writer_class = bulk.UserAttributeWriter
   # filter_backends = (filters.DjangoFilterBackend,)
   # Removed DjangoFilterBackend inline with deprecation policy. Use django_filters.rest_framework.FilterSet and/or 
   # django_filters.rest_framework.DjangoFilterBackend instead. #5273
@@ -242,24 +572,28 @@ class UserAttributeViewSet(viewsets.ModelViewSet):
     return Response(status=204)
 
 
-class MunicipalityViewSet(viewsets.ModelViewSet):
+class MunicipalityViewSet(BulkMixin, viewsets.ModelViewSet):
   queryset = Municipality.objects.all()
   serializer_class = MunicipalitySerializer
+  bulk_writer_class = bulk.MunicipalityWriter
 
 
-class SchoolViewSet(viewsets.ModelViewSet):
+class SchoolViewSet(BulkMixin, viewsets.ModelViewSet):
   queryset = School.objects.all()
   serializer_class = SchoolSerializer
+  bulk_writer_class = bulk.SchoolWriter
 
 
 class RoleViewSet(viewsets.ReadOnlyModelViewSet):
   queryset = Role.objects.all()
   serializer_class = RoleSerializer
+  replica_actions = ('list', 'retrieve')
 
 
-class AttendanceViewSet(viewsets.ModelViewSet):
+class AttendanceViewSet(BulkMixin, viewsets.ModelViewSet):
   queryset = Attendance.objects.all()
   serializer_class = AttendanceSerializer
+  bulk_writer_class = bulk.AttendanceWriter
 
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
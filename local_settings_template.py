@@ -25,13 +25,30 @@
 
 DATABASES = {
   'default': {
-    'ENGINE': 'django.db.backends.postgresql_psycopg2',
+    'ENGINE': 'authdata.db.postgresql',
     'NAME': 'authdata',
     'USER': 'authdata',
     'PASSWORD': 'authdata',
+    # Keep connections open between requests, see authdata.db
+    'CONN_MAX_AGE': 300,
+    'CONN_HEALTH_CHECKS': True,
+    # With GUNICORN_PROFILE=threaded use a pool instead:
+    #'CONN_MAX_AGE': 0,
+    #'POOL': {'MAX_SIZE': 4},
   }
 }
 
+# Read replicas for read-only API views. Tests use the default database.
+#DATABASES['replica'] = {
+#  'ENGINE': 'django.db.backends.postgresql_psycopg2',
+#  'NAME': 'authdata',
+#  'HOST': 'replica.example.com',
+#  'USER': 'authdata',
+#  'PASSWORD': 'authdata',
+#  'TEST': {'MIRROR': 'default'},
+#}
+#AUTHDATA_READ_REPLICAS = ('replica',)
+
 USE_X_FORWARDED_HOST = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 
@@ -39,15 +56,15 @@ LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
     'root': {
-      'level': 'DEBUG',
-      'handlers': ['console', 'file'],
+      'level': 'INFO',
+      'handlers': ['queue'],
     },
     'formatters': {
       'normal': {
-        'format': '%(asctime)s %(levelname)s %(name)s %(thread)d %(lineno)s %(message)s %(data)s'
+        'format': '%(asctime)s %(levelname)s %(name)s %(thread)d %(lineno)s %(message)s %(data2)s'
       },
       'verbose': {
-        'format': '%(levelname)s %(asctime)s %(module)s %(process)d %(thread)d %(message)s %(data)s'
+        'format': '%(levelname)s %(asctime)s %(module)s %(process)d %(thread)d %(message)s %(data2)s'
       },
     },
     'filters': {
@@ -56,6 +73,13 @@ LOGGING = {
       },
     },
     'handlers': {
+      # Records are written to console and file in a background thread
+      'queue': {
+        'level': 'INFO',
+        '()': 'project.logging_helpers.QueueHandler',
+        'handlers': ['cfg://handlers.console', 'cfg://handlers.file'],
+        'filters': ['default'],
+      },
       'console': {
         'level': 'DEBUG',
         'class': 'logging.StreamHandler',
@@ -72,17 +96,17 @@ LOGGING = {
     'loggers': {
       'django': {
         'level': 'WARNING',
-        'handlers': ['console', 'file'],
+        'handlers': ['queue'],
         'propagate': True,
       },
       'authdata': {
-        'handlers': ['console', 'file'],
-        'level': 'DEBUG',
+        'handlers': ['queue'],
+        'level': 'INFO',
         'propagate': False,
       },
       '': {
-        'handlers': ['console', 'file'],
-        'level': 'DEBUG',
+        'handlers': ['queue'],
+        'level': 'INFO',
         'propagate': False,
       },
     },
@@ -0,0 +1,85 @@
+
+# -*- encoding: utf-8 -*-
+
+# The MIT License (MIT)
+#
+# Copyright (c) 2014-2015 Haltu Oy, http://haltu.fi
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+# THE SOFTWARE.
+"""
+Gunicorn configuration
+
+  gunicorn -c project/gunicorn_conf.py project.wsgi:application
+
+Metrics of the workers are collected in prometheus_multiproc_dir, which is
+emptied when gunicorn starts.
+
+GUNICORN_PROFILE selects the worker model:
+
+sync
+  Single threaded worker processes. Use persistent database connections
+  (CONN_MAX_AGE), each process keeps one open.
+
+threaded
+  Fewer processes with several threads each, for deployments where most of
+  the request time is spent waiting for external sources. Use the
+  connection pool of authdata.db.postgresql with MAX_SIZE of at most
+  GUNICORN_THREADS and CONN_MAX_AGE 0.
+
+GUNICORN_WORKERS, GUNICORN_THREADS and GUNICORN_TIMEOUT override the values
+of the profile.
+"""
+
+import os
+import glob
+import tempfile
+import multiprocessing
+from prometheus_client import multiprocess
+
+PROFILES = {
+  'sync': {'worker_class': 'sync', 'workers': multiprocessing.cpu_count() * 2 + 1, 'threads': 1},
+  'threaded': {'worker_class': 'gthread', 'workers': multiprocessing.cpu_count() + 1, 'threads': 4},
+}
+
+profile = PROFILES[os.environ.get('GUNICORN_PROFILE', 'sync')]
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8001')
+worker_class = profile['worker_class']
+workers = int(os.environ.get('GUNICORN_WORKERS', profile['workers']))
+threads = int(os.environ.get('GUNICORN_THREADS', profile['threads']))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+# Apache keeps connections to gunicorn open between requests
+keepalive = 5
+
+os.environ.setdefault('prometheus_multiproc_dir', os.path.join(tempfile.gettempdir(), 'mpass-data-metrics'))
+
+
+def on_starting(server):
+  path = os.environ['prometheus_multiproc_dir']
+  if not os.path.isdir(path):
+    os.makedirs(path)
+  for filename in glob.glob(os.path.join(path, '*.db')):
+    os.remove(filename)
+
+
+def child_exit(server, worker):
+  multiprocess.mark_process_dead(worker.pid)
+
+# vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
+
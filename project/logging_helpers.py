@@ -23,15 +23,121 @@
 
 # pylint: disable=no-self-use, no-init, too-few-public-methods
 
+import os
 import json
+import Queue
+import logging
+import threading
+
+
+class LazyJSON(object):
+  """
+  Compact JSON of a value, serialized when first formatted
+  """
+  __slots__ = ('value', '_text')
+
+  def __init__(self, value):
+    self.value = value
+    self._text = None
+
+  def __str__(self):
+    if self._text is None:
+      self._text = json.dumps(self.value, sort_keys=True, separators=(',', ':'), default=repr)
+    return self._text
 
 
 class Filter(object):
+  """
+  Adds ``data`` and its JSON as ``data2`` to every record, so formats can
+  refer to them. The JSON is only built if a formatter uses it.
+  """
   def filter(self, record):
     if 'data' not in record.__dict__:
       record.__dict__['data'] = None
-    record.__dict__['data2'] = json.dumps(record.__dict__['data'], sort_keys=True, indent=2)
+    record.__dict__['data2'] = LazyJSON(record.__dict__['data'])
     return True
 
+
+class QueueHandler(logging.Handler):
+  """
+  Passes records to other handlers in a background thread, so that logging
+  never waits for file or network I/O.
+
+  handlers: handlers to pass records to. In ``dictConfig`` refer to them
+    as ``cfg://handlers.<name>``; they are configured in name order, so
+    their names must sort before the name of this handler.
+  queue_size: records waiting at most, more records are dropped
+
+  Messages are formatted before queueing. Record attributes, such as
+  ``data``, are formatted in the background thread and must not be
+  modified after logging.
+  """
+
+  def __init__(self, handlers=(), queue_size=10000):
+    logging.Handler.__init__(self)
+    # Indexing converts the cfg:// references of dictConfig
+    self.handlers = [handlers[i] for i in xrange(len(handlers))]
+    for handler in self.handlers:
+      if not isinstance(handler, logging.Handler):
+        raise ValueError('Handler %r is not configured' % (handler,))
+    self.queue_size = queue_size
+    self.dropped = 0
+    self._queue = None
+    self._thread = None
+    self._pid = None
+    self._lock = threading.Lock()
+
+  def _start(self):
+    # Threads do not survive fork, start one in each process
+    with self._lock:
+      if self._pid == os.getpid():
+        return
+      self._queue = Queue.Queue(self.queue_size)
+      self._thread = threading.Thread(target=self._run, name='logging-queue')
+      self._thread.daemon = True
+      self._thread.start()
+      self._pid = os.getpid()
+
+  def _run(self):
+    while True:
+      record = self._queue.get()
+      if record is None:
+        break
+      for handler in self.handlers:
+        if record.levelno >= handler.level:
+          handler.handle(record)
+
+  def prepare(self, record):
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+      record.exc_text = logging.Formatter().formatException(record.exc_info)
+      record.exc_info = None
+    return record
+
+  def emit(self, record):
+    if self._pid != os.getpid():
+      self._start()
+    try:
+      self._queue.put_nowait(self.prepare(record))
+    except Queue.Full:
+      self.dropped += 1
+    except Exception:
+      self.handleError(record)
+
+  def close(self):
+    """
+    Handle the queued records and stop the background thread
+    """
+    with self._lock:
+      if self._pid == os.getpid() and self._thread.is_alive():
+        try:
+          self._queue.put(None, timeout=5)
+        except Queue.Full:
+          pass
+        self._thread.join(5)
+      self._pid = None
+    logging.Handler.close(self)
+
 # vim: tabstop=2 expandtab shiftwidth=2 softtabstop=2
 
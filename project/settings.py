@@ -67,6 +67,9 @@ INSTALLED_APPS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'authdata.middleware.MetricsMiddleware',
+    'authdata.middleware.TimingMiddleware',
+    'authdata.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -91,6 +94,8 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = ['authdata.routers.ReplicaRouter']
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.7/topics/i18n/
 
@@ -123,6 +128,10 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',  # Included for easier debugging
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'authdata.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'PAGINATE_BY': 10,
     'PAGINATE_BY_PARAM': 'page_size',  # Allow client to override, using `?page_size=xxx`.
     'MAX_PAGINATE_BY': 1000
@@ -163,6 +172,52 @@ AUTHDATA_DREAMSCHOOL_ORG_MAP = {
   u'kauniainen': {u'mäntymäen koulu': 3, u'kasavuoren koulu': 1},
 }
 
+# Organisations can also be managed in the admin, those override the map
+# above. The merged map is cached in each process for this many seconds.
+AUTHDATA_DREAMSCHOOL_ORG_MAP_TTL = 300
+
+# Share of requests timed by authdata.middleware.TimingMiddleware, 0 - 1.
+# Timed requests get a Server-Timing header and a timing log record.
+AUTHDATA_TIMING_SAMPLE_RATE = 0.0
+
+# Addresses allowed to read /metrics. Do not proxy /metrics to the outside.
+AUTHDATA_METRICS_ALLOWED_IPS = ('127.0.0.1',)
+
+# Aliases in DATABASES of read replicas used by read-only API views.
+# Listings with changed_at newer than AUTHDATA_REPLICA_LAG_WINDOW seconds
+# are read from the default database, keep the window above the replica lag.
+AUTHDATA_READ_REPLICAS = ()
+AUTHDATA_REPLICA_LAG_WINDOW = 300
+
+# Serve /api/1/query and user listings from denormalized UserDocuments,
+# see authdata.documents. Run manage.py rebuild_user_documents first and
+# manage.py rebuild_user_documents --missing periodically.
+AUTHDATA_USER_DOCUMENTS = False
+
+# Maximum number of objects in one bulk/ request
+AUTHDATA_BULK_MAX_ROWS = 50000
+
+# UserAttributes disabled this many days ago are moved to the archive by
+# manage.py archive_user_attributes, see authdata.archive
+AUTHDATA_ATTRIBUTE_RETENTION_DAYS = 30
+
+# Sources, attributes, roles, municipalities and schools are cached in each
+# process, see authdata.cache. Changes made in other processes are seen
+# after this many seconds.
+AUTHDATA_REFERENCE_CACHE_TTL = 300
+# Attribute names unknown to /api/1/query reload the attributes at most
+# once in this many seconds
+AUTHDATA_REFERENCE_CACHE_MISS_TTL = 10
+
+# Maximum number of queries in one /api/1/query/batch request and the
+# number of threads querying external sources for it
+AUTHDATA_QUERY_BATCH_MAX = 1000
+AUTHDATA_QUERY_BATCH_WORKERS = 8
+
+# Function encoding compact API responses, see authdata.renderers. None
+# uses the encoding of rest_framework.
+AUTHDATA_JSON_DUMPS = 'authdata.renderers.simplejson_dumps'
+
 try:
   from local_settings import *
 except ImportError: